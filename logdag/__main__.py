@@ -90,6 +90,87 @@ def make_dag_stdin(ns):
     timer.stop()
 
 
+def make_dag_sweep(ns):
+    from . import sweep
+
+    conf = open_logdag_config(ns)
+    grid = sweep.parse_grid(ns.grid)
+    l_variant = sweep.init_variants(conf, grid)
+    _logger.info("{0} variants: {1}".format(
+        len(l_variant), ", ".join([name for name, _ in l_variant])))
+    l_window_args = sweep.sweep_args(l_variant)
+
+    timer = common.Timer("makedag sweep task", output=_logger)
+    timer.start()
+    p = ns.parallel
+    if p > 1:
+        import multiprocessing
+        with multiprocessing.Pool(processes=p) as pool:
+            pool.starmap(sweep.sweep_window,
+                         [(l_args, grid) for l_args in l_window_args])
+    else:
+        for l_args in l_window_args:
+            sweep.sweep_window(l_args, grid)
+    timer.stop()
+
+
+def make_dag_rethreshold(ns):
+    from . import makedag
+
+    conf = open_logdag_config(ns)
+    dest_conf = open_logdag_config(ns)
+    dest_conf["dag"]["output_dir"] = ns.output_dir
+    dest_conf["dag"]["skeleton_threshold"] = str(ns.threshold)
+
+    am = arguments.ArgumentManager(conf)
+    am.load()
+    dest_am = arguments.ArgumentManager(dest_conf)
+    for args in am:
+        dest_am.add((dest_conf, args[1], args[2]))
+    dest_am.dump()
+
+    timer = common.Timer("makedag rethreshold task", output=_logger)
+    timer.start()
+    for args, dest_args in zip(am, dest_am):
+        makedag.rethreshold_main(args, dest_args, ns.threshold)
+    timer.stop()
+
+
+def make_dag_ego(ns):
+    from . import ego
+    from . import log2event
+    from . import showdag
+
+    conf = open_logdag_config(ns)
+    args = arguments.name2args(ns.argname, conf)
+    if ns.tid is None and not ns.eids:
+        sys.exit("either trouble or events must be given")
+
+    timer = common.Timer("makedag ego task for {0}".format(ns.argname),
+                         output=_logger)
+    timer.start()
+    input_df, evmap = log2event.makeinput_cached(args, False)
+    if input_df is None:
+        sys.exit("no input data in {0}".format(ns.argname))
+    seeds = list(ns.eids)
+    l_dt = None
+    if ns.tid is not None:
+        from .eval import trouble
+        tm = trouble.TroubleManager(conf.get("eval", "path"))
+        tr = tm[ns.tid]
+        tr_seeds, l_dt = ego.trouble_events(conf, tr, evmap)
+        seeds = sorted(set(seeds) | set(tr_seeds))
+    timer.lap("load-nodes")
+    ldag = ego.estimate_ego(args, seeds, l_dt,
+                            input_df=input_df, evmap=evmap)
+    timer.stop()
+    if ldag is None:
+        sys.exit("failed to estimate ego-network DAG")
+
+    context = "instruction" if ns.instruction else "edge"
+    print(showdag.show_edge_list(ldag, context))
+
+
 # def show_event(ns):
 #    from . import tsdb
 #    conf = open_logdag_config(ns)
@@ -151,9 +232,9 @@ def update_event_label(ns):
                 conf["database_amulog"]["event_gid"]]
     al = src_amulog.AmulogLoader(*tmp_args)
 
-    for evdef in evmap.iter_evdef():
+    for eid, evdef in list(evmap.items()):
         assert evdef.source == log2event.SRCCLS_LOG
-        evdef.group = al.label(evdef.gid)
+        evmap.replace_evdef(eid, evdef.replace(group=al.label(evdef.gid)))
 
     evmap.dump(args)
 
@@ -206,6 +287,14 @@ def show_args(ns):
     print(am.show())
 
 
+def show_ledger(ns):
+    conf = open_logdag_config(ns)
+
+    table = [list(row) for row
+             in arguments.ArgumentManager.load_ledger(conf)]
+    print(common.cli_table(table))
+
+
 def _parse_condition(conditions):
     d = {}
     for arg in conditions:
@@ -364,9 +453,16 @@ def show_stats_by_threshold(ns):
     from . import showdag
     conf = open_logdag_config(ns)
 
-    thresholds = np.arange(0, 1, 0.1)
     dt_range = _parse_opt_range(ns)
-    data = showdag.stat_by_threshold(conf, thresholds, dt_range=dt_range)
+    if conf.get("dag", "cause_algorithm") in ("pc", "pc-corr"):
+        # p-value thresholds stricter than skeleton_threshold
+        alpha = conf.getfloat("dag", "skeleton_threshold")
+        thresholds = alpha * np.array([1, 0.5, 0.2, 0.1, 0.05, 0.02, 0.01])
+        data = showdag.stat_by_pvalue(conf, thresholds, dt_range=dt_range)
+    else:
+        thresholds = np.arange(0, 1, 0.1)
+        data = showdag.stat_by_threshold(conf, thresholds,
+                                         dt_range=dt_range)
     print(common.cli_table(list(zip(thresholds, data)), align="right"))
 
 
@@ -484,7 +580,8 @@ OPT_RANGE = [["-r", "--range"],
 OPT_THRESHOLD = [["-t", "--threshold"],
                  {"dest": "threshold", "metavar": "THRESHOLD", "action": "store",
                   "type": float, "default": None,
-                  "help": "threshold for filter ate_prune"}]
+                  "help": ("threshold for filter ate_prune, "
+                           "median_ate_prune and probability_prune")}]
 OPT_GID = [["-g", "--gid"],
            {"dest": "gid", "metavar": "GID", "action": "store",
             "type": int, "default": None,
@@ -549,6 +646,44 @@ DICT_ARGSET = {
     "make-dag-stdin": ["make-dag interface for pipeline processing",
                        [OPT_CONFIG, OPT_DEBUG, ARG_ARGNAME],
                        make_dag_stdin],
+    "make-dag-sweep": ["Generate causal DAGs for a grid of parameters "
+                       "sharing loaded data",
+                       [OPT_CONFIG, OPT_DEBUG, OPT_PARALLEL,
+                        [["-g", "--grid"],
+                         {"dest": "grid", "metavar": "OPTION=VALUES",
+                          "action": "append", "required": True,
+                          "help": ("swept option and comma-separated values "
+                                   "(e.g., dag.ci_bin_size=1m,5m), "
+                                   "can be given multiple times")}]],
+                       make_dag_sweep],
+    "make-dag-rethreshold": ["Derive PC DAGs of a stricter threshold "
+                             "from stored p-values (skeleton_record)",
+                             [OPT_CONFIG, OPT_DEBUG,
+                              [["-t", "--threshold"],
+                               {"dest": "threshold", "metavar": "THRESHOLD",
+                                "action": "store", "type": float,
+                                "required": True,
+                                "help": "new skeleton_threshold"}],
+                              [["-o", "--output-dir"],
+                               {"dest": "output_dir", "metavar": "DIRNAME",
+                                "action": "store", "required": True,
+                                "help": "dag.output_dir for derived DAGs"}]],
+                             make_dag_rethreshold],
+    "make-dag-ego": ["Estimate DAG only around a trouble or given events "
+                     "in a window (not dumped)",
+                     [OPT_CONFIG, OPT_DEBUG, OPT_INSTRUCTION,
+                      [["-t", "--trouble"],
+                       {"dest": "tid", "metavar": "TID", "action": "store",
+                        "type": int, "default": None,
+                        "help": "trouble identifier (in eval.path)"}],
+                      [["-e", "--event"],
+                       {"dest": "eids", "metavar": "EID",
+                        "action": "append", "type": int, "default": [],
+                        "help": ("event id in the window "
+                                 "(see dump-events), can be given "
+                                 "multiple times")}],
+                      ARG_ARGNAME],
+                     make_dag_ego],
     "make-dag-prune": ["Show pruned DAGs before PC algorithm",
                        [OPT_CONFIG, OPT_DEBUG, ARG_ARGNAME],
                        make_dag_prune],
@@ -583,6 +718,9 @@ DICT_ARGSET = {
     "show-args": ["Show arguments recorded in argument file",
                   [OPT_CONFIG, OPT_DEBUG],
                   show_args],
+    "show-ledger": ["Show jobs with notable status (e.g., truncated search)",
+                    [OPT_CONFIG, OPT_DEBUG],
+                    show_ledger],
     "show-edge": ["Show edges related to given conditions",
                   [OPT_CONFIG, OPT_DEBUG, OPT_INSTRUCTION,
                    OPT_DETAIL, OPT_LOG_ORG, OPT_HEAD, OPT_FOOT,
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Graph on a boolean adjacency matrix for the DAG estimation stage.
+
+Nodes are the indexes 0, ..., n-1 (same as the columns of input data).
+adj[i, j] is True if an arc i -> j exists. An undirected edge is
+represented with both arcs, in the same way as the CPDAG of pcalg
+(nx.DiGraph), so the same object works as a skeleton and as a PDAG.
+The graph is converted into networkx only for output (e.g., LogDAG).
+"""
+
+import numpy as np
+import networkx as nx
+
+
+class AdjacencyGraph:
+
+    def __init__(self, adj):
+        self.adj = np.asarray(adj, dtype=bool)
+        if self.adj.ndim != 2 or self.adj.shape[0] != self.adj.shape[1]:
+            raise ValueError("adjacency matrix must be square")
+        # graph attributes, same as nx.Graph.graph
+        self.graph = {}
+
+    @classmethod
+    def empty(cls, n_nodes):
+        return cls(np.zeros((n_nodes, n_nodes), dtype=bool))
+
+    @classmethod
+    def complete(cls, n_nodes):
+        adj = np.ones((n_nodes, n_nodes), dtype=bool)
+        np.fill_diagonal(adj, False)
+        return cls(adj)
+
+    @classmethod
+    def from_nx(cls, graph, n_nodes=None):
+        """Nodes of graph must be integers in range(n_nodes).
+        Edges of undirected graphs are added in both directions."""
+        if n_nodes is None:
+            n_nodes = graph.number_of_nodes()
+        g = cls.empty(n_nodes)
+        edges = np.array(list(graph.edges()), dtype=int).reshape(-1, 2)
+        g.adj[edges[:, 0], edges[:, 1]] = True
+        if not graph.is_directed():
+            g.adj[edges[:, 1], edges[:, 0]] = True
+        return g
+
+    @classmethod
+    def from_graph(cls, graph, n_nodes=None):
+        """Accept both AdjacencyGraph (copied) and networkx graphs."""
+        if isinstance(graph, cls):
+            return graph.copy()
+        return cls.from_nx(graph, n_nodes)
+
+    def copy(self):
+        g = AdjacencyGraph(self.adj.copy())
+        g.graph = dict(self.graph)
+        return g
+
+    def number_of_nodes(self):
+        return self.adj.shape[0]
+
+    def nodes(self):
+        return list(range(self.number_of_nodes()))
+
+    def _skeleton(self):
+        return self.adj | self.adj.T
+
+    def number_of_edges(self):
+        """Number of adjacent pairs (an undirected edge is counted once)."""
+        return int(np.triu(self._skeleton(), k=1).sum())
+
+    def edges(self):
+        """Adjacent pairs (i, j) with i < j."""
+        return [(int(i), int(j))
+                for i, j in np.argwhere(np.triu(self._skeleton(), k=1))]
+
+    def arcs(self):
+        """All arcs (i, j); an undirected edge gives both directions."""
+        return [(int(i), int(j)) for i, j in np.argwhere(self.adj)]
+
+    def has_edge(self, i, j):
+        return bool(self.adj[i, j] or self.adj[j, i])
+
+    def has_arc(self, i, j):
+        return bool(self.adj[i, j])
+
+    def is_directed_edge(self, i, j):
+        return bool(self.adj[i, j] and not self.adj[j, i])
+
+    def is_undirected_edge(self, i, j):
+        return bool(self.adj[i, j] and self.adj[j, i])
+
+    def neighbors(self, i):
+        """Adjacent nodes of i in ascending order."""
+        return np.flatnonzero(self.adj[i] | self.adj[:, i]).tolist()
+
+    def degree(self, i):
+        return int((self.adj[i] | self.adj[:, i]).sum())
+
+    def add_edge(self, i, j):
+        self.adj[i, j] = True
+        self.adj[j, i] = True
+
+    def remove_edge(self, i, j):
+        self.adj[i, j] = False
+        self.adj[j, i] = False
+
+    def remove_edges_from(self, edges):
+        edges = np.array(list(edges), dtype=int).reshape(-1, 2)
+        self.adj[edges[:, 0], edges[:, 1]] = False
+        self.adj[edges[:, 1], edges[:, 0]] = False
+
+    def orient(self, i, j):
+        """Orient the edge between i and j as i -> j."""
+        self.adj[i, j] = True
+        self.adj[j, i] = False
+
+    def connected_components(self):
+        """Returns:
+            list of set: nodes of each connected component"""
+        from scipy.sparse.csgraph import connected_components
+        _, labels = connected_components(self.adj, directed=True,
+                                         connection="weak")
+        d_comp = {}
+        for node, label in enumerate(labels):
+            d_comp.setdefault(label, set()).add(node)
+        return list(d_comp.values())
+
+    def to_nx(self, directed=True, node_ids=None):
+        """Convert into nx.DiGraph (all arcs) or nx.Graph (adjacency).
+        If node_ids is given, nodes are relabeled into node_ids[index]."""
+        if directed:
+            g = nx.DiGraph()
+            edges = self.arcs()
+        else:
+            g = nx.Graph()
+            edges = self.edges()
+        if node_ids is None:
+            g.add_nodes_from(self.nodes())
+            g.add_edges_from(edges)
+        else:
+            g.add_nodes_from(node_ids)
+            g.add_edges_from((node_ids[i], node_ids[j]) for i, j in edges)
+        g.graph.update(self.graph)
+        return g
@@ -16,6 +16,7 @@ _amulog_logger = logging.getLogger("amulog")
 
 class ArgumentManager(object):
     _arglist_filename = "args"
+    _ledger_filename = "ledger"
 
     def __init__(self, conf):
         self._conf = conf
@@ -143,6 +144,110 @@ class ArgumentManager(object):
             return
         return dirname + "/evdef.pickle"
 
+    @classmethod
+    def evdef_columnar_path(cls, args):
+        conf, dt_range, area = args
+        dirname = cls._arg_dirname(cls._output_dir(conf),
+                                   cls.jobname(args))
+        # not making dirname: also used to load the evmap
+        return dirname + "/evdef.npy"
+
+    @classmethod
+    def evdict_path(cls, conf):
+        """Event dictionary shared by the jobs in output_dir."""
+        # not making output_dir: also used to load the dictionary
+        return "{0}/evdict.npz".format(cls._output_dir(conf))
+
+    @classmethod
+    def skeleton_path(cls, args):
+        conf, dt_range, area = args
+        dirname = cls._arg_dirname(cls._output_dir(conf),
+                                   cls.jobname(args))
+        # not making dirname: also used to find results of other jobs
+        return dirname + "/skeleton.npz"
+
+    @classmethod
+    def input_path(cls, args):
+        conf, dt_range, area = args
+        dirname = cls._arg_dirname(cls._output_dir(conf),
+                                   cls.jobname(args))
+        # not making dirname: looked up before the job outputs
+        return dirname + "/input.pickle"
+
+    @classmethod
+    def checkpoint_path(cls, args, key=None):
+        """Checkpoint of the job estimation (key: e.g., component id)."""
+        conf, dt_range, area = args
+        dirname = cls._arg_dirname(cls._output_dir(conf),
+                                   cls.jobname(args))
+        common.mkdir(dirname)
+        if key is None:
+            return dirname + "/checkpoint.pickle"
+        else:
+            return dirname + "/checkpoint_{0}.pickle".format(key)
+
+    @classmethod
+    def _ledger_path(cls, conf):
+        return "{0}/{1}".format(cls._output_dir(conf),
+                                cls._ledger_filename)
+
+    @classmethod
+    def _update_ledger(cls, conf, key, line=None):
+        """Replace the entry of key (jobname, status) with line
+        (removed if None). Jobs can update the ledger in parallel."""
+        import fcntl
+        fp = cls._ledger_path(conf)
+        if line is None and not os.path.exists(fp):
+            return
+        with open(fp + ".lock", "a") as lock_f:
+            fcntl.flock(lock_f, fcntl.LOCK_EX)
+            try:
+                l_entry = [entry for entry in cls.load_ledger(conf)
+                           if tuple(entry[:2]) != key]
+                lines = ["\t".join(entry) for entry in l_entry]
+                if line is not None:
+                    lines.append(line)
+                tmp_fp = "{0}.{1}.tmp".format(fp, os.getpid())
+                with open(tmp_fp, "w") as f:
+                    f.write("".join(line + "\n" for line in lines))
+                os.replace(tmp_fp, fp)
+            finally:
+                fcntl.flock(lock_f, fcntl.LOCK_UN)
+
+    @classmethod
+    def add_ledger(cls, args, status, info=""):
+        """Record jobs with notable status (e.g., incomplete estimation)
+        in the ledger file of output_dir. The previous entry of the job
+        with the same status (e.g., before rerun) is replaced."""
+        jobname = cls.jobname(args)
+        line = "\t".join([jobname, status, info])
+        cls._update_ledger(args[0], (jobname, status), line)
+
+    @classmethod
+    def remove_ledger(cls, args, status):
+        """Remove the entry of the job with status
+        (e.g., rerun without the notable status)."""
+        cls._update_ledger(args[0], (cls.jobname(args), status))
+
+    @classmethod
+    def load_ledger(cls, conf):
+        """Returns: list of (jobname, status, info)"""
+        ret = []
+        try:
+            with open(cls._ledger_path(conf), "r") as f:
+                for line in f:
+                    ret.append(tuple(line.rstrip("\n").split("\t")))
+        except IOError:
+            pass
+        return ret
+
+    @staticmethod
+    def previous_args(args):
+        """Returns args of the previous window in the same area."""
+        conf, dt_range, area = args
+        diff = config.getdur(conf, "dag", "unit_diff")
+        return conf, (dt_range[0] - diff, dt_range[1] - diff), area
+
     # @classmethod
     # def output_filename(cls, dirname, args):
     #     return "{0}/{1}".format(dirname, cls.jobname(args))
@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Sufficient statistics of conditional independence tests.
+
+The statistics of the CI tests are sums over time bins:
+co-occurrence counts of events for G-square tests on binary data,
+and sums and cross-products for Fisher-z tests on gaussian data.
+For consecutive overlapping windows processed in one process
+(e.g., make-dag with 30h term and 24h step), the statistics of
+a window are derived from those of the previous window
+by subtracting the leaving bins and adding the entering bins;
+events are mapped across windows with EventDefinition.identifier.
+
+The statistics answer the order-0 G-square tests and the Fisher-z
+tests of any order without scanning the input matrix.
+"""
+
+import logging
+
+import numpy as np
+
+from . import log2event
+
+_logger = logging.getLogger(__package__)
+
+KIND_BINARY = "binary"
+KIND_GAUSSIAN = "gaussian"
+
+# key: (area, kind, input options), val: WindowStatistics
+_windows = {}
+
+
+class WindowStatistics:
+    """Sums and cross-products of the input columns of one window,
+    updated incrementally for the next window.
+
+    The input of the window is kept as a sparse matrix (the event
+    time-series are mostly zero) to subtract the leaving bins,
+    and the co-occurrence counts of binary data are integers.
+    The cross-products of the columns in the same order as the previous
+    window are updated in place."""
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.index = None
+        self.identifiers = []
+        self.values = None  # scipy.sparse.csc_matrix
+        self.sums = None
+        self.cross = None
+        self.mode = None  # "full" or "incremental"
+
+    def _dtype(self):
+        if self.kind == KIND_BINARY:
+            return np.int32
+        else:
+            return float
+
+    def _full(self, values):
+        # release the previous statistics before the products
+        self.sums = self.cross = None
+        self.sums = _column_sums(values)
+        self.cross = values.T.dot(values).toarray()
+        self.mode = "full"
+
+    def _overlap(self, index):
+        """Number of bins at the head of index that are the tail
+        of the previous window (0 if not consecutive)."""
+        if self.index is None:
+            return 0
+        n_overlap = int(np.sum(self.index >= index[0]))
+        if n_overlap == 0 or n_overlap > len(index):
+            return 0
+        if not self.index[-n_overlap:].equals(index[:n_overlap]):
+            return 0
+        return n_overlap
+
+    def _remap(self, n_col, new_idxs, old_idxs):
+        """Statistics of the previous window in the new column order
+        (in place if the order is not changed)."""
+        if n_col == len(self.identifiers) and \
+                np.array_equal(new_idxs, old_idxs):
+            return self.sums, self.cross
+        sums = np.zeros(n_col, dtype=self.sums.dtype)
+        sums[new_idxs] = self.sums[old_idxs]
+        cross = np.zeros((n_col, n_col), dtype=self.cross.dtype)
+        # row by row, to avoid a temporary copy of the block
+        for new_idx, old_idx in zip(new_idxs, old_idxs):
+            cross[new_idx, new_idxs] = self.cross[old_idx, old_idxs]
+        self.sums = self.cross = None
+        return sums, cross
+
+    def update(self, index, identifiers, values):
+        """Replace the statistics with those of the given window.
+
+        Args:
+            index (pd.DatetimeIndex): time bins of the window
+            identifiers (list): identifier of the event of each column
+            values (np.ndarray): input matrix of the tests
+        """
+        import scipy.sparse
+        values = scipy.sparse.csc_matrix(values, dtype=self._dtype())
+        n_overlap = self._overlap(index)
+        n_leave = 0 if n_overlap == 0 else len(self.index) - n_overlap
+        n_enter = len(index) - n_overlap
+        d_old = {identifier: idx
+                 for idx, identifier in enumerate(self.identifiers)}
+        common = [(new_idx, d_old[identifier])
+                  for new_idx, identifier in enumerate(identifiers)
+                  if identifier in d_old]
+        if n_overlap == 0 or len(common) == 0 or \
+                n_leave + n_enter >= len(index):
+            self._full(values)
+        else:
+            new_idxs = np.array([c[0] for c in common], dtype=int)
+            old_idxs = np.array([c[1] for c in common], dtype=int)
+            # the events with different values in the overlapping bins
+            # (e.g., filtered differently) are counted again
+            diff = (self.values[n_leave:][:, old_idxs] !=
+                    values[:n_overlap][:, new_idxs])
+            same = diff.getnnz(axis=0) == 0
+            new_idxs = new_idxs[same]
+            old_idxs = old_idxs[same]
+            leave = self.values[:n_leave][:, old_idxs]
+            enter = values[n_overlap:][:, new_idxs]
+
+            n_col = values.shape[1]
+            sums, cross = self._remap(n_col, new_idxs, old_idxs)
+            sums[new_idxs] += _column_sums(enter) - _column_sums(leave)
+            delta = (enter.T.dot(enter) - leave.T.dot(leave)).tocoo()
+            cross[new_idxs[delta.row], new_idxs[delta.col]] += delta.data
+
+            others = np.setdiff1d(np.arange(n_col), new_idxs)
+            if len(others) > 0:
+                sums[others] = _column_sums(values[:, others])
+                block = values.T.dot(values[:, others]).toarray()
+                cross[:, others] = block
+                cross[others, :] = block.T
+            self.sums = sums
+            self.cross = cross
+            self.mode = "incremental"
+        self.index = index
+        self.identifiers = list(identifiers)
+        self.values = values
+        return self.mode
+
+    def statistics(self):
+        return CIStatistics(self.kind, len(self.index), self.sums, self.cross)
+
+
+def _column_sums(values):
+    return np.asarray(values.sum(axis=0)).ravel()
+
+
+class CIStatistics:
+    """Sufficient statistics of the CI tests on one input matrix.
+    The columns are the indexes of the input columns."""
+
+    def __init__(self, kind, n_samples, sums, cross):
+        self.kind = kind
+        self.n_samples = n_samples
+        self.sums = sums
+        self.cross = cross
+
+    def subset(self, col_idxs):
+        """Returns CIStatistics of the given columns,
+        relabeled into their indexes in col_idxs."""
+        col_idxs = np.asarray(col_idxs, dtype=int)
+        return CIStatistics(self.kind, self.n_samples, self.sums[col_idxs],
+                            self.cross[np.ix_(col_idxs, col_idxs)])
+
+    def p_value(self, i, j, cond):
+        """p-value of the test, or None if not answered
+        from the statistics."""
+        if self.kind == KIND_BINARY:
+            if len(cond) == 0:
+                return self._g_square_bin(i, j)
+            return None
+        elif self.kind == KIND_GAUSSIAN:
+            return self._fisher_z(i, j, cond)
+        else:
+            raise ValueError("invalid statistics kind {0}".format(self.kind))
+
+    def _g_square_bin(self, i, j):
+        # same as the order-0 test of gsq.binary.g_square_bin
+        from scipy.stats import chi2
+        n = self.n_samples
+        if n < 10:
+            return 1
+        n_i = self.sums[i]
+        n_j = self.sums[j]
+        n_ij = self.cross[i, j]
+        nijk = np.array([[n - n_i - n_j + n_ij, n_j - n_ij],
+                         [n_i - n_ij, n_ij]])
+        tx = np.array([nijk.sum(axis=1)]).T
+        ty = np.array([nijk.sum(axis=0)])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            tlog = nijk * n / tx.dot(ty)
+            g2 = np.nansum(2 * nijk * np.log(tlog))
+        return chi2.sf(g2, 1)
+
+    def _fisher_z(self, i, j, cond):
+        # Fisher-z test of partial correlation (gaussCItest in pcalg)
+        from scipy.stats import norm
+        n = self.n_samples
+        cond = list(cond)
+        if n - len(cond) - 3 <= 0:
+            return 1
+        idxs = [i, j] + cond
+        sums = self.sums[idxs]
+        cov = self.cross[np.ix_(idxs, idxs)] - np.outer(sums, sums) / n
+        std = np.sqrt(np.diag(cov))
+        if np.any(std == 0):
+            # constant variables: correlation undefined
+            r = 0
+        else:
+            corr = cov / np.outer(std, std)
+            if len(cond) == 0:
+                r = corr[0, 1]
+            else:
+                pm = np.linalg.pinv(corr)
+                with np.errstate(invalid="ignore"):
+                    r = -pm[0, 1] / np.sqrt(pm[0, 0] * pm[1, 1])
+            if np.isnan(r):
+                r = 0
+        r = min(0.9999999, max(-0.9999999, r))
+        z = np.sqrt(n - len(cond) - 3) * 0.5 * np.log1p(2 * r / (1 - r))
+        return 2 * norm.sf(abs(z))
+
+
+class StatisticsTest:
+    """CI test function answering the tests from CIStatistics
+    if available, otherwise with func."""
+
+    def __init__(self, func, statistics):
+        self._func = func
+        self._statistics = statistics
+        self.n_answered = 0
+
+    def __call__(self, data_matrix, i, j, cond):
+        p_val = self._statistics.p_value(i, j, cond)
+        if p_val is None:
+            return self._func(data_matrix, i, j, cond)
+        self.n_answered += 1
+        return p_val
+
+    def identity(self):
+        from . import pc_skeleton
+        return ("statistics", self._statistics.kind,
+                pc_skeleton.ci_test_identity(self._func))
+
+
+def statistics_kind(ci_func):
+    if ci_func == "gsq":
+        return KIND_BINARY
+    elif ci_func in ("fisherz", "fisherz_bin"):
+        return KIND_GAUSSIAN
+    else:
+        raise ValueError("ci_func invalid ({0})".format(ci_func))
+
+
+def input_values(input_df, kind):
+    """Input matrix of the tests (binarized for G-square tests)."""
+    values = np.asarray(input_df.values)
+    if kind == KIND_BINARY:
+        return (values >= 1).astype(np.int8)
+    else:
+        return values.astype(float)
+
+
+def init_statistics(conf, args, input_df, evmap):
+    """CIStatistics of the input of job args (None if disabled).
+    The statistics of the previous window of the same area
+    in this process are updated to the window."""
+    method = conf.get("dag", "ci_statistics")
+    if method == "none":
+        return None
+    elif method != "incremental":
+        raise ValueError("invalid dag.ci_statistics")
+    if conf.get("dag", "cause_algorithm") not in ("pc", "pc-corr"):
+        return None
+
+    area = args[2]
+    kind = statistics_kind(conf.get("dag", "ci_func"))
+    key = (area, kind) + tuple(conf.get("dag", option)
+                               for option in log2event.INPUT_OPTIONS)
+    max_nodes = conf.getint("dag", "ci_statistics_max_nodes")
+    if 0 < max_nodes < input_df.shape[1]:
+        _logger.warning("CI statistics disabled: {0} nodes exceeds "
+                        "ci_statistics_max_nodes".format(input_df.shape[1]))
+        _windows.pop(key, None)
+        return None
+    if key not in _windows:
+        _windows[key] = WindowStatistics(kind)
+    window = _windows[key]
+    identifiers = [evmap.evdef(node).identifier for node in input_df.columns]
+    mode = window.update(input_df.index, identifiers,
+                         input_values(input_df, kind))
+    _logger.info("CI statistics of {0} nodes ({1} update)".format(
+        len(identifiers), mode))
+    return window.statistics()
+
+
+def clear_statistics():
+    _windows.clear()
@@ -588,12 +588,10 @@ def convert_binsize(array, org_binsize, new_binsize):
         return array
 
     ratio = int(new_binsize.total_seconds() / org_binsize.total_seconds())
-    l = []
-    i = 0
-    while i < array.size:
-        l.append(array[i:i + ratio].sum())
-        i += ratio
-    return np.array(l)
+    if len(array) == 0:
+        return np.array(array)
+    # sum of every ratio bins (along the first axis for 2d arrays)
+    return np.add.reduceat(array, np.arange(0, len(array), ratio), axis=0)
 
 
 def rand_uniform(top_dt, end_dt, lambd):
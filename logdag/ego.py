@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""DAG estimation around given events (e.g., a trouble ticket).
+
+Instead of the whole window, the causal discovery runs only on the
+ego-network of the given (seed) events: the events on hosts within
+dag.ego_hops of the seed hosts in the network topology, and the events
+appearing within dag.ego_radius bins of the seed events (or of the
+messages of the trouble). The input matrix of the window is taken
+from the input cache if available (see dag.input_cache).
+"""
+
+import logging
+
+import numpy as np
+import pandas as pd
+import networkx as nx
+
+from . import arguments
+from . import log2event
+from . import showdag
+
+_logger = logging.getLogger(__package__)
+
+
+def trouble_events(conf, tr, evmap):
+    """Events of the messages of trouble tr.
+
+    Returns:
+        seeds (list): event ids in evmap of the messages
+        l_dt (list): timestamps of the messages
+    """
+    from amulog import log_db
+    ld = log_db.LogData(arguments.open_amulog_config(conf))
+    gid_name = conf.get("database_amulog", "event_gid")
+
+    # merged events (merge_syncevent) are found with their members
+    d_eid = {}
+    for eid, evdef in evmap.items():
+        for member in getattr(evdef, "members", [evdef]):
+            if member.source == log2event.SRCCLS_LOG:
+                d_eid[(member.host, str(member.gid))] = eid
+
+    s_eid = set()
+    l_dt = []
+    for lid in tr.get():
+        lm = ld.get_line(lid)
+        l_dt.append(lm.dt)
+        key = (lm.host, str(lm.lt.get(gid_name)))
+        if key in d_eid:
+            s_eid.add(d_eid[key])
+    return sorted(s_eid), l_dt
+
+
+def _cooccur_bins(input_df, seeds, l_dt, radius):
+    n_bins = input_df.shape[0]
+    if l_dt is None or len(l_dt) == 0:
+        col_idxs = input_df.columns.get_indexer(seeds)
+        bins = np.flatnonzero((input_df.values[:, col_idxs] > 0).any(axis=1))
+    else:
+        bins = input_df.index.searchsorted(pd.to_datetime(l_dt),
+                                           side="right") - 1
+        bins = bins[bins >= 0]
+    mask = np.zeros(n_bins, dtype=bool)
+    for offset in range(-radius, radius + 1):
+        mask[np.clip(bins + offset, 0, n_bins - 1)] = True
+    return mask
+
+
+def select_nodes(input_df, evmap, seeds, l_dt=None,
+                 topology=None, hops=1, radius=0):
+    """Nodes in the ego-network of the seed events.
+
+    Args:
+        input_df (pd.DataFrame): input of the window
+        evmap (log2event.EventDefinitionMap): evmap of input_df
+        seeds (list): event ids
+        l_dt (list, optional): timestamps of the seed messages;
+            if not given, the bins with seed events are used
+        topology (topology.TopologyIndex, optional): if not given,
+            only the events of the seed hosts are selected by hosts
+        hops (int): topology distance from the seed hosts
+        radius (int): number of bins around the seed bins
+
+    Returns:
+        list: selected nodes in the order of input_df columns
+    """
+    columns = input_df.columns
+    hosts = [evmap.evdef(node).host for node in columns]
+    seed_hosts = {evmap.evdef(node).host for node in seeds}
+    selected = np.array([host in seed_hosts for host in hosts], dtype=bool)
+    selected |= columns.isin(seeds)
+
+    if topology is not None and hops > 0:
+        seed_idxs = topology.host_indexes(sorted(seed_hosts, key=str))
+        seed_idxs = seed_idxs[seed_idxs >= 0]
+        if len(seed_idxs) > 0:
+            near = topology.neighborhood(seed_idxs, hops)
+            host_idxs = topology.host_indexes(hosts)
+            selected |= (host_idxs >= 0) & near[host_idxs]
+
+    bins = _cooccur_bins(input_df, seeds, l_dt, radius)
+    selected |= (input_df.values[bins] > 0).any(axis=0)
+    return list(columns[selected])
+
+
+def _init_topology(conf):
+    from . import topology
+    try:
+        return topology.init_topology(conf)
+    except IOError:
+        _logger.warning("topology file not found, "
+                        "ego-network is selected only by co-occurrence")
+        return None
+
+
+def estimate_ego(args, seeds, l_dt=None, input_df=None, evmap=None):
+    """Estimate the DAG of the ego-network of seed events in window args.
+
+    Args:
+        args: job arguments of the window
+        seeds (list): event ids in the evmap of the window
+        l_dt (list, optional): timestamps of the seed messages
+        input_df, evmap (optional): input of the window;
+            loaded (from the input cache if available) if not given
+
+    Returns:
+        showdag.LogDAG: nodes are the event ids of the window
+            (not dumped), or None if the estimation fails
+    """
+    from . import makedag
+    from . import pc_skeleton
+    from . import pknowledge
+
+    jobname = arguments.args2name(args)
+    conf, dt_range, area = args
+    if input_df is None:
+        input_df, evmap = log2event.makeinput_cached(args, False)
+        if input_df is None:
+            return None
+    if l_dt is not None:
+        l_dt = [dt for dt in l_dt if dt_range[0] <= dt < dt_range[1]]
+    if len(seeds) == 0 and not l_dt:
+        _logger.warning("no seed events of ego-network in job({0})".format(
+            jobname))
+        return None
+
+    hops = conf.getint("dag", "ego_hops")
+    radius = conf.getint("dag", "ego_radius")
+    nodes = select_nodes(input_df, evmap, seeds, l_dt,
+                         topology=_init_topology(conf),
+                         hops=hops, radius=radius)
+    _logger.info("job({0}) ego-network of {1} events: "
+                 "{2} of {3} nodes".format(jobname, len(seeds), len(nodes),
+                                           input_df.shape[1]))
+
+    # the subset is relabeled to estimate it as an independent input
+    sub_evmap = log2event.EventDefinitionMap()
+    for node in nodes:
+        sub_evmap.add_evdef(evmap.evdef(node))
+    sub_df = input_df[nodes]
+    sub_df.columns = list(sub_evmap.eids())
+
+    ci_func = conf.get("dag", "ci_func")
+    prior_knowledge = pknowledge.init_prior_knowledge(conf, sub_evmap, args)
+    budget = pc_skeleton.init_budget(conf)
+    graph = makedag.estimate_dag(conf, sub_df, ci_func, prior_knowledge,
+                                 budget=budget, evmap=sub_evmap)
+    if graph is None:
+        _logger.info("job({0}) failed on causal inference".format(jobname))
+        return None
+
+    graph = nx.relabel_nodes(graph, dict(enumerate(nodes)))
+    graph.graph["ego_seeds"] = list(seeds)
+    return showdag.LogDAG(args, graph, evmap=evmap)
@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Event dictionary shared by the jobs of one output_dir.
+
+With dag.evmap_format = columnar, the event definitions of all jobs
+are stored once in the event dictionary of output_dir (evdict.npz),
+which gives each event (identified with its class and identifier)
+a global event id. The attributes of the events are stored in columns
+(one array for each attribute), and the members of merged events
+(MultipleEventDefinition) as global event ids.
+The evmap of each job is an int array (evdef.npy in the job directory)
+mapping the local event ids to the global event ids (-1 for unused ids).
+
+The dictionary is loaded once in a process (reloaded if the file
+is updated by other jobs), and the event definitions are created
+on demand from the columns (the global ids are looked up with
+the identifier column without creating them).
+"""
+
+import fcntl
+import importlib
+import logging
+import os
+from contextlib import contextmanager
+
+import numpy as np
+from amulog import common
+
+from . import arguments
+from . import log2event
+
+_logger = logging.getLogger(__package__)
+
+# value types in the attribute columns
+_TYPE_MISSING = 0
+_TYPE_NONE = 1
+_TYPE_STR = 2
+_TYPE_INT = 3
+_TYPE_FLOAT = 4
+
+# key: dictionary path, val: (file stat, EventDictionary)
+_dictionaries = {}
+
+
+class EventDictionary:
+    """Global event ids of the event definitions."""
+
+    def __init__(self):
+        self._classes = []  # class paths
+        self._cls = []  # class index of each global id
+        self._states = []  # attributes (except members) of each global id
+        self._members = []  # member global ids of each global id (or None)
+        self._identifiers = []  # identifier of each global id
+        self._gmap = {}  # key: (class index, identifier), val: global id
+        self._evdefs = {}  # key: global id, val: evdef (created on demand)
+        self.modified = False
+
+    def __len__(self):
+        return len(self._cls)
+
+    @staticmethod
+    def _class_path(evdef):
+        cls = type(evdef)
+        return "{0}:{1}".format(cls.__module__, cls.__qualname__)
+
+    @staticmethod
+    def _import_class(path):
+        module_name, qualname = path.split(":")
+        obj = importlib.import_module(module_name)
+        for name in qualname.split("."):
+            obj = getattr(obj, name)
+        return obj
+
+    def _class_index(self, evdef):
+        path = self._class_path(evdef)
+        if path not in self._classes:
+            self._classes.append(path)
+        return self._classes.index(path)
+
+    def get_gid(self, evdef):
+        """Returns the global id of evdef (KeyError if not added)."""
+        path = self._class_path(evdef)
+        if path not in self._classes:
+            raise KeyError(evdef.identifier)
+        return self._gmap[(self._classes.index(path), evdef.identifier)]
+
+    def add(self, evdef):
+        """Returns the global id of evdef, added if not found."""
+        try:
+            return self.get_gid(evdef)
+        except KeyError:
+            pass
+        state = evdef.__getstate__()
+        members = state.pop("_members", None)
+        if members is not None:
+            members = tuple(self.add(member) for member in members)
+        cls_idx = self._class_index(evdef)
+        gid = len(self._cls)
+        self._cls.append(cls_idx)
+        self._states.append(state)
+        self._members.append(members)
+        self._identifiers.append(evdef.identifier)
+        self._gmap[(cls_idx, evdef.identifier)] = gid
+        self._evdefs[gid] = evdef
+        self.modified = True
+        return gid
+
+    def evdef(self, gid):
+        if gid not in self._evdefs:
+            cls = self._import_class(self._classes[self._cls[gid]])
+            state = dict(self._states[gid])
+            if self._members[gid] is not None:
+                state["_members"] = tuple(self.evdef(member_gid)
+                                          for member_gid
+                                          in self._members[gid])
+            evdef = cls.__new__(cls)
+            evdef.__setstate__(state)
+            self._evdefs[gid] = log2event.intern(evdef)
+        return self._evdefs[gid]
+
+    @staticmethod
+    def _encode(value):
+        if value is None:
+            return _TYPE_NONE, ""
+        elif isinstance(value, str):
+            return _TYPE_STR, value
+        elif isinstance(value, (int, np.integer)) and \
+                not isinstance(value, bool):
+            return _TYPE_INT, str(value)
+        elif isinstance(value, (float, np.floating)):
+            return _TYPE_FLOAT, repr(float(value))
+        else:
+            raise TypeError("unsupported attribute type {0}".format(
+                type(value)))
+
+    @staticmethod
+    def _decode(code, value):
+        if code == _TYPE_NONE:
+            return None
+        elif code == _TYPE_STR:
+            return value
+        elif code == _TYPE_INT:
+            return int(value)
+        elif code == _TYPE_FLOAT:
+            return float(value)
+        else:
+            raise ValueError("invalid attribute type {0}".format(code))
+
+    def dump(self, fp):
+        attrs = sorted({attr for state in self._states for attr in state})
+        d_array = {"classes": np.array(self._classes, dtype=str),
+                   "cls": np.array(self._cls, dtype=np.int32),
+                   "identifiers": np.array(self._identifiers, dtype=str),
+                   "attributes": np.array(attrs, dtype=str)}
+        for attr in attrs:
+            codes = []
+            values = []
+            for state in self._states:
+                if attr in state:
+                    code, value = self._encode(state[attr])
+                else:
+                    code, value = _TYPE_MISSING, ""
+                codes.append(code)
+                values.append(value)
+            d_array["type_" + attr] = np.array(codes, dtype=np.int8)
+            d_array["value_" + attr] = np.array(values, dtype=str)
+        l_members = [members if members is not None else ()
+                     for members in self._members]
+        d_array["members_ptr"] = np.cumsum(
+            [0] + [len(members) for members in l_members], dtype=np.int64)
+        d_array["members"] = np.array(
+            [gid for members in l_members for gid in members],
+            dtype=np.int64)
+        d_array["is_multiple"] = np.array(
+            [members is not None for members in self._members], dtype=bool)
+
+        # written atomically: other processes may read it
+        tmp_fp = "{0}.{1}.tmp".format(fp, os.getpid())
+        with open(tmp_fp, "wb") as f:
+            np.savez(f, **d_array)
+        os.replace(tmp_fp, fp)
+        self.modified = False
+
+    @classmethod
+    def load(cls, fp):
+        evdict = cls()
+        with np.load(fp) as npz:
+            evdict._classes = npz["classes"].tolist()
+            evdict._cls = npz["cls"].tolist()
+            n_gid = len(evdict._cls)
+            evdict._states = [{} for _ in range(n_gid)]
+            for attr in npz["attributes"].tolist():
+                codes = npz["type_" + attr].tolist()
+                values = npz["value_" + attr].tolist()
+                for state, code, value in zip(evdict._states, codes, values):
+                    if code != _TYPE_MISSING:
+                        state[attr] = cls._decode(code, value)
+            ptr = npz["members_ptr"]
+            members = npz["members"].tolist()
+            is_multiple = npz["is_multiple"].tolist()
+            evdict._members = [tuple(members[ptr[gid]:ptr[gid + 1]])
+                               if is_multiple[gid] else None
+                               for gid in range(n_gid)]
+            evdict._identifiers = npz["identifiers"].tolist()
+        evdict._gmap = {key: gid for gid, key
+                        in enumerate(zip(evdict._cls, evdict._identifiers))}
+        return evdict
+
+
+def _stat(fp):
+    st = os.stat(fp)
+    return st.st_mtime_ns, st.st_size
+
+
+def load_dictionary(conf):
+    """EventDictionary of output_dir (empty if not stored yet)."""
+    fp = arguments.ArgumentManager.evdict_path(conf)
+    try:
+        stat = _stat(fp)
+    except FileNotFoundError:
+        return EventDictionary()
+    if fp in _dictionaries and _dictionaries[fp][0] == stat:
+        return _dictionaries[fp][1]
+    evdict = EventDictionary.load(fp)
+    _dictionaries[fp] = (stat, evdict)
+    return evdict
+
+
+@contextmanager
+def _lock(fp):
+    with open(fp + ".lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def dump_evmap(evmap, args):
+    """Store evmap of job args as global ids in the event dictionary."""
+    conf = args[0]
+    fp = arguments.ArgumentManager.evdict_path(conf)
+    common.mkdir(os.path.dirname(fp))
+    # the jobs of make-dag can add events in parallel
+    with _lock(fp):
+        evdict = load_dictionary(conf)
+        eids = list(evmap.eids())
+        gids = np.full(max(eids) + 1 if len(eids) > 0 else 0, -1,
+                       dtype=np.int64)
+        for eid, evdef in evmap.items():
+            gids[eid] = evdict.add(evdef)
+        if evdict.modified:
+            evdict.dump(fp)
+            _dictionaries[fp] = (_stat(fp), evdict)
+    evmap_fp = arguments.ArgumentManager.evdef_columnar_path(args)
+    common.mkdir(os.path.dirname(evmap_fp))
+    np.save(evmap_fp, gids)
+
+
+def load_evmap(evmap, args):
+    """Load evmap of job args from the event dictionary
+    (FileNotFoundError if not stored in columnar format)."""
+    conf = args[0]
+    gids = np.load(arguments.ArgumentManager.evdef_columnar_path(args),
+                   mmap_mode="r")
+    evdict = load_dictionary(conf)
+    emap = {}
+    for eid, gid in enumerate(gids.tolist()):
+        if gid >= 0:
+            emap[eid] = evdict.evdef(gid)
+    evmap._emap = emap
+    evmap._ermap = {evdef.identifier: eid for eid, evdef in emap.items()}
+
+
+def clear_dictionaries():
+    _dictionaries.clear()
@@ -4,9 +4,11 @@
 Use LiNGAM https://github.com/cdt15/lingam
 """
 
+import logging
 import numpy as np
 import networkx as nx
-from itertools import combinations
+
+_logger = logging.getLogger(__package__)
 
 
 def _fit_back(data, cls, kwargs, limit=3):
@@ -23,14 +25,24 @@ def _fit_back(data, cls, kwargs, limit=3):
 
 
 def estimate(data, algorithm="ica", lower_limit=0.01,
-             ica_max_iter=1000, prior_knowledge=None):
-    """Generate DAG with LiNGAM"""
+             ica_max_iter=1000, prior_knowledge=None,
+             ica_restarts=3, ica_selection="first", processes=1,
+             n_bootstrap=0):
+    """Generate DAG with LiNGAM
+
+    If n_bootstrap > 0, the edges have the results of the bootstrap
+    (see function bootstrap) as attributes bootstrap_probability
+    and bootstrap_median.
+    """
     import lingam
+    l_result = None
+    pmatrix = None
     if algorithm == "ica":
         if prior_knowledge is not None:
-            raise Warning("ICA-LiNGAM does not use prior knowledge")
-        kwargs = {"max_iter": ica_max_iter}
-        model = _fit_back(data, lingam.ICALiNGAM, kwargs)
+            _logger.warning("ICA-LiNGAM does not use prior knowledge")
+        model, l_result = fit_ica_lingam(data.values, ica_max_iter,
+                                         ica_restarts, ica_selection,
+                                         processes)
     elif algorithm == "direct":
         if prior_knowledge is None:
             kwargs = {}
@@ -49,50 +61,428 @@ def estimate(data, algorithm="ica", lower_limit=0.01,
     for i in range(adj.shape[0]):
         g.add_node(i)
 
+    if n_bootstrap > 0:
+        fit_args = (algorithm, ica_max_iter, pmatrix,
+                    ica_restarts, ica_selection)
+        n_success, probability, median = bootstrap(
+            data.values, n_bootstrap, lower_limit, fit_args, processes)
+        g.graph["bootstrap"] = n_success
+
     idx = np.abs(adj) > lower_limit
     dirs = np.where(idx)
     for to_idx, from_idx, coef in zip(dirs[0], dirs[1], adj[idx]):
         to = data.columns[to_idx]
         from_ = data.columns[from_idx]
         g.add_edge(from_, to, weight=coef, label=str(round(coef, 2)))
+        if n_bootstrap > 0:
+            g.edges[from_, to]["bootstrap_probability"] = \
+                float(probability[to_idx, from_idx])
+            g.edges[from_, to]["bootstrap_median"] = \
+                float(median[to_idx, from_idx])
 
+    if l_result is not None:
+        g.graph["ica_n_iter"] = [None if result is None else result[1]
+                                 for result in l_result]
+        g.graph["ica_restart"] = _select_restart(l_result, ica_max_iter,
+                                                 ica_selection)
     return g
 
 
-def estimate_corr(data, algorithm="ica", lower_limit=0.01, prior_knowledge=None):
-    """Generate DAG of pair-wise LiNGAM coefficient"""
+# input data of bootstrap given to each worker process
+_bootstrap_data = None
+
+
+def _init_bootstrap(shared):
+    global _bootstrap_data
+    _bootstrap_data = None if shared is None else shared.array()
+
+
+def bootstrap(mat, n_sampling, lower_limit, fit_args, processes=1):
+    """Fit LiNGAM on resampled data (with replacement) in parallel.
+    The input matrix is shared with the worker processes
+    (see parallel.share), and the resamples are generated
+    in the workers from random seeds.
+
+    Args:
+        fit_args (tuple): algorithm, ica_max_iter, prior knowledge matrix,
+            ica_restarts, ica_selection
+
+    Returns:
+        n_success (int): number of successful fits
+        probability (np.ndarray): ratio of the fits with
+            abs(B[i, j]) > lower_limit
+        median (np.ndarray): median of B[i, j] in those fits
+            (0 if no such fits)
+    """
+    from . import parallel
+    seeds = np.random.randint(np.iinfo(np.int32).max, size=n_sampling)
+    n_tasks = min(n_sampling, max(1, processes) * 4)
+    l_args = [(l_seed, lower_limit, fit_args)
+              for l_seed in np.array_split(seeds, n_tasks)]
+    with parallel.share(mat, processes) as shared:
+        results = parallel.pool_starmap(_bootstrap_task, l_args, processes,
+                                        initializer=_init_bootstrap,
+                                        initargs=(shared,))
+        _init_bootstrap(None)
+
+    n_nodes = mat.shape[1]
+    n_success = 0
+    d_coef = {}
+    for l_arcs in results:
+        for rows, cols, values in l_arcs:
+            n_success += 1
+            for key, val in zip(zip(rows, cols), values):
+                d_coef.setdefault(key, []).append(val)
+    _logger.info("LiNGAM bootstrap: {0} / {1} successful fits".format(
+        n_success, n_sampling))
+
+    probability = np.zeros((n_nodes, n_nodes))
+    median = np.zeros((n_nodes, n_nodes))
+    for (i, j), l_val in d_coef.items():
+        probability[i, j] = len(l_val) / n_success
+        median[i, j] = np.median(l_val)
+    return n_success, probability, median
+
+
+def _bootstrap_task(seeds, lower_limit, fit_args):
+    """Returns:
+        list of (rows, cols, values) of the arcs of each successful fit"""
+    n_samples = _bootstrap_data.shape[0]
+    ret = []
+    for seed in seeds:
+        rs = np.random.RandomState(seed)
+        sample = _bootstrap_data[rs.randint(n_samples, size=n_samples)]
+        adj = _fit_adjacency(sample, *fit_args)
+        if adj is None:
+            continue
+        rows, cols = np.nonzero(np.abs(adj) > lower_limit)
+        ret.append((rows, cols, adj[rows, cols]))
+    return ret
+
+
+def _fit_adjacency(mat, algorithm, ica_max_iter=1000, pmatrix=None,
+                   ica_restarts=3, ica_selection="first"):
     import lingam
+    if algorithm == "ica":
+        model, _ = fit_ica_lingam(mat, ica_max_iter,
+                                  ica_restarts, ica_selection)
+    else:
+        if pmatrix is None:
+            kwargs = {}
+        else:
+            kwargs = {"prior_knowledge": pmatrix}
+        model = _fit_back(mat, lingam.DirectLiNGAM, kwargs)
+    if model is None:
+        return None
+    return np.nan_to_num(model.adjacency_matrix_)
+
+
+def fit_ica_lingam(mat, max_iter=1000, n_restarts=3, selection="first",
+                   processes=1):
+    """ICA-LiNGAM with randomized restarts of FastICA.
+
+    The data is whitened once (same as FastICA), and the restarts
+    with different random initial matrices share the whitened data.
+    A restart fails on LinAlgError.
+    If selection is first, the successful restart with the smallest
+    index is used, and the restarts after it are not run (cancelled
+    if parallelized, see parallel.pool_first). If selection is
+    likelihood, the converged restart with the largest log-likelihood
+    is used. The whitened data is shared with the worker processes
+    (see parallel.share).
 
-    def _model(alg, _kwargs):
-        if alg == "ica":
-            return lingam.ICALiNGAM(**_kwargs)
-        elif alg == "direct":
-            return lingam.DirectLiNGAM(**_kwargs)
+    Returns:
+        model (lingam.ICALiNGAM): None if all restarts fail
+        l_result (list): (unmixing matrix, iterations, log-likelihood)
+            of each run restart, None for failures
+    """
+    from . import parallel
+    if selection not in ("first", "likelihood"):
+        raise ValueError("invalid ica selection {0}".format(selection))
+    mat = np.asarray(mat, dtype=float)
+    whitening, mat_white = _whiten(mat)
+    seeds = np.random.randint(np.iinfo(np.int32).max, size=n_restarts)
+    l_args = [(max_iter, seed) for seed in seeds]
+    if selection == "first":
+        pool_func = parallel.pool_first
+    else:
+        pool_func = parallel.pool_starmap
+    with parallel.share(mat_white, processes) as shared:
+        l_result = pool_func(_ica_restart, l_args, processes,
+                             initializer=_init_ica, initargs=(shared,))
+        _init_ica(None)
+
+    for restart, result in enumerate(l_result):
+        if result is None:
+            _logger.info("ICA restart {0}: failed".format(restart))
         else:
-            raise ValueError("invalid lingam algorithm name")
+            _logger.info("ICA restart {0}: {1} iterations{2}".format(
+                restart, result[1],
+                "" if result[1] < max_iter else " (not converged)"))
+    selected = _select_restart(l_result, max_iter, selection)
+    if selected is None:
+        return None, l_result
+
+    unmixing = np.dot(l_result[selected][0], whitening)
+    # unit-variance sources, same as FastICA(whiten="unit-variance")
+    sources = np.dot(mat - mat.mean(axis=0), unmixing.T)
+    unmixing /= np.std(sources, axis=0)[:, np.newaxis]
+    return _ica_lingam_model(mat, unmixing), l_result
+
+
+def _whiten(mat):
+    """Centering and PCA whitening, same as FastICA (whiten_solver eigh).
+
+    Returns:
+        whitening (np.ndarray): whitening matrix K
+        mat_white (np.ndarray): whitened data in (n_features, n_samples)
+    """
+    from scipy import linalg
+    mat_t = (mat - mat.mean(axis=0)).T
+    d, u = linalg.eigh(mat_t.dot(mat_t.T))
+    sort_indices = np.argsort(d)[::-1]
+    d[d < np.finfo(d.dtype).eps] = np.finfo(d.dtype).eps
+    d = np.sqrt(d)
+    d, u = d[sort_indices], u[:, sort_indices]
+    u *= np.sign(u[0])
+    whitening = (u / d).T
+    mat_white = np.dot(whitening, mat_t) * np.sqrt(mat.shape[0])
+    return whitening, mat_white
+
+
+# whitened data given to the workers of fit_ica_lingam
+_ica_data = None
+
+
+def _init_ica(shared):
+    global _ica_data
+    _ica_data = None if shared is None else shared.array()
+
+
+def _ica_restart(max_iter, seed):
+    """Returns:
+        tuple: unmixing matrix of the whitened data, number of
+            iterations, log-likelihood with logcosh contrast;
+            None if failed"""
+    import warnings
+    from sklearn.decomposition import FastICA
+    from sklearn.exceptions import ConvergenceWarning
+    mat_white = _ica_data
+    ica = FastICA(whiten=False, max_iter=max_iter, random_state=seed)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", ConvergenceWarning)
+            ica.fit(mat_white.T)
+    except np.linalg.LinAlgError:
+        return None
+    # the unmixing matrix is orthogonal for whitened data,
+    # so the determinant term is constant
+    sources = np.dot(ica.components_, mat_white)
+    logcosh = np.logaddexp(sources, -sources) - np.log(2)
+    loglik = -np.mean(np.sum(logcosh, axis=0))
+    return ica.components_, int(ica.n_iter_), float(loglik)
+
+
+def _select_restart(l_result, max_iter, selection="first"):
+    """Returns index of the restart to use, None if all failed."""
+    l_idx = [idx for idx, result in enumerate(l_result)
+             if result is not None]
+    if len(l_idx) == 0:
+        return None
+    if selection == "first":
+        return l_idx[0]
+    else:
+        return max(l_idx, key=lambda idx: (l_result[idx][1] < max_iter,
+                                           l_result[idx][2]))
+
+
+def _ica_lingam_model(mat, unmixing):
+    # same as ICALiNGAM.fit after FastICA
+    import lingam
+    from scipy.optimize import linear_sum_assignment
+    model = lingam.ICALiNGAM()
+    _, col_index = linear_sum_assignment(1 / np.abs(unmixing))
+    pw_ica = np.zeros_like(unmixing)
+    pw_ica[col_index] = unmixing
+    b_estimate = np.eye(len(pw_ica)) - pw_ica / np.diag(pw_ica)[:, np.newaxis]
+    model._causal_order = model._estimate_causal_order(b_estimate)
+    return model._estimate_adjacency_matrix(mat)
+
+
+def estimate_corr(data, algorithm="ica", lower_limit=0.01,
+                  prior_knowledge=None, corr_prescreen=0., processes=1):
+    """Generate DAG of pair-wise LiNGAM coefficient.
+
+    Pairs are skipped before fitting if prior knowledge forbids
+    paths in both directions, if a node has constant values,
+    or if the absolute correlation is smaller than corr_prescreen.
+    With direct algorithm, pairs without prior knowledge rules are
+    estimated in batches with a closed form of 2-variable DirectLiNGAM
+    (see _direct_pairs); the other pairs are fitted one by one.
+    The batches are processed over a process pool of given size.
+    """
+    from . import parallel
+    if algorithm not in ("ica", "direct"):
+        raise ValueError("invalid lingam algorithm name")
+
+    mat = np.asarray(data.values, dtype=float)
+    n_nodes = mat.shape[1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        corr = np.corrcoef(mat, rowvar=False).reshape(n_nodes, n_nodes)
+    valid = np.std(mat, axis=0) > 0
+
+    src, dst = np.triu_indices(n_nodes, k=1)
+    n_pairs = len(src)
+    mask = valid[src] & valid[dst]
+    mask &= np.abs(corr[src, dst]) >= corr_prescreen
+    n_prescreen = n_pairs - int(mask.sum())
+    if prior_knowledge:
+        nopath, constrained = prior_knowledge.pair_rules(list(data.columns))
+        excluded = nopath[src, dst] & nopath[dst, src]
+        n_excluded = int((mask & excluded).sum())
+        mask &= ~excluded
+        constrained = constrained[src, dst]
+    else:
+        n_excluded = 0
+        constrained = np.zeros(n_pairs, dtype=bool)
+
+    if algorithm == "direct":
+        batch_pairs = np.column_stack((src, dst))[mask & ~constrained]
+        fit_pairs = np.column_stack((src, dst))[mask & constrained]
+    else:
+        batch_pairs = np.empty((0, 2), dtype=int)
+        fit_pairs = np.column_stack((src, dst))[mask]
+    _logger.debug("pair-wise lingam: {0} pairs, {1} prescreened, "
+                  "{2} excluded by prior knowledge, {3} in batches, "
+                  "{4} fitted".format(n_pairs, n_prescreen, n_excluded,
+                                      len(batch_pairs), len(fit_pairs)))
+
+    with parallel.share(mat, processes) as shared:
+        l_args = []
+        for pairs in _split_pairs(batch_pairs, mat.shape[0], processes):
+            cols, local_pairs = _local_pairs(pairs)
+            l_args.append((_direct_pairs, shared, local_pairs, cols))
+        for pairs in _split_pairs(fit_pairs, mat.shape[0], processes):
+            cols, local_pairs = _local_pairs(pairs)
+            kwargs = []
+            for i, j in pairs:
+                if algorithm == "direct":
+                    pmatrix = prior_knowledge.lingam_prior_knowledge(
+                        node_ids=[data.columns[i], data.columns[j]])
+                    kwargs.append({"prior_knowledge": pmatrix})
+                else:
+                    kwargs.append({})
+            l_args.append((_fit_pairs, shared, local_pairs, cols,
+                           algorithm, kwargs))
+        results = parallel.pool_starmap(_run_pairs, l_args, processes)
 
     g = nx.DiGraph()
     g.add_nodes_from(data.columns)
-    for i, j in combinations(data.columns, 2):
-        if algorithm == "direct" and prior_knowledge:
-            pmatrix = prior_knowledge.lingam_prior_knowledge(node_ids=[i, j])
-            kwargs = {"prior_knowledge": pmatrix}
-        else:
-            kwargs = {}
+    for l_arc in results:
+        for from_idx, to_idx, coef in l_arc:
+            if np.abs(coef) > lower_limit:
+                from_ = data.columns[from_idx]
+                to = data.columns[to_idx]
+                g.add_edge(from_, to, weight=coef,
+                           label=str(round(coef, 2)))
+    return g
 
-        tmp_data = data[[i, j]]
-        model = _model(algorithm, kwargs)
-        model.fit(tmp_data)
-        adj = np.nan_to_num(model.adjacency_matrix_)
 
-        idx = np.abs(adj) > lower_limit
-        dirs = np.where(idx)
-        for to_idx, from_idx, coef in zip(dirs[0], dirs[1], adj[idx]):
-            to = tmp_data.columns[to_idx]
-            from_ = tmp_data.columns[from_idx]
-            g.add_edge(from_, to, weight=coef, label=str(round(coef, 2)))
+def _split_pairs(pairs, n_samples, processes, max_size=2 ** 22):
+    """Split pairs into batches with at most max_size values
+    of a (n_samples, n_pairs) array, and at least 4 batches
+    per process for load balancing."""
+    if len(pairs) == 0:
+        return []
+    batch_size = max(1, max_size // max(n_samples, 1))
+    if processes > 1:
+        batch_size = min(batch_size,
+                         -(-len(pairs) // (processes * 4)))
+    return [pairs[i:i + batch_size]
+            for i in range(0, len(pairs), batch_size)]
 
-    return g
+
+def _local_pairs(pairs):
+    """Returns used columns and pairs relabeled into the column indexes,
+    so that the workers take only the used columns of the matrix."""
+    cols, inverse = np.unique(pairs, return_inverse=True)
+    return cols, inverse.reshape(pairs.shape)
+
+
+def _run_pairs(func, shared, pairs, cols, *args):
+    """Returns:
+        list of (cause, effect, coefficient) in the original indexes"""
+    mat = shared.array()[:, cols]
+    return [(int(cols[i]), int(cols[j]), coef)
+            for i, j, coef in func(mat, pairs, *args)]
+
+
+def _entropy(u):
+    # maximum entropy approximation used in DirectLiNGAM, for each column
+    k1 = 79.047
+    k2 = 7.4129
+    gamma = 0.37457
+    return (1 + np.log(2 * np.pi)) / 2 - \
+        k1 * (np.mean(np.log(np.cosh(u)), axis=0) - gamma) ** 2 - \
+        k2 * (np.mean(u * np.exp((-u ** 2) / 2), axis=0)) ** 2
+
+
+def _direct_pairs(mat, pairs):
+    """Closed form of DirectLiNGAM (without prior knowledge)
+    for pairs of 2 variables, vectorized over the pairs.
+
+    The causal order is given by the sign of the difference of
+    mutual information measures (same as DirectLiNGAM._search_causal_order).
+    The coefficient is selected by the adaptive lasso with BIC
+    (predict_adaptive_lasso); with one predictor, the LARS path has
+    only the null model and the OLS model, and the OLS model is
+    selected iff r^2 / (1 - r^2) > log(n) / (n - 2).
+    """
+    n_samples = mat.shape[0]
+    if n_samples <= 2 or len(pairs) == 0:
+        return []
+    std = np.std(mat, axis=0)
+    z = (mat - np.mean(mat, axis=0)) / std
+    h = _entropy(z)
+    i, j = pairs[:, 0], pairs[:, 1]
+    zi = z[:, i]
+    zj = z[:, j]
+    r = np.mean(zi * zj, axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        res_std = np.sqrt(1 - r ** 2)
+        diff = h[j] + _entropy((zi - r * zj) / res_std) - \
+            h[i] - _entropy((zj - r * zi) / res_std)
+        selected = r ** 2 / (1 - r ** 2) > np.log(n_samples) / (n_samples - 2)
+    # DirectLiNGAM takes the first variable on ties (and on nan)
+    forward = ~(diff < 0)
+
+    ret = []
+    for k in np.flatnonzero(selected):
+        if forward[k]:
+            cause, effect = i[k], j[k]
+        else:
+            cause, effect = j[k], i[k]
+        coef = r[k] * std[effect] / std[cause]
+        ret.append((cause, effect, float(coef)))
+    return ret
+
+
+def _fit_pairs(mat, pairs, algorithm, l_kwargs):
+    import lingam
+    if algorithm == "ica":
+        cls = lingam.ICALiNGAM
+    else:
+        cls = lingam.DirectLiNGAM
+    ret = []
+    for (i, j), kwargs in zip(pairs, l_kwargs):
+        model = _fit_back(mat[:, [i, j]], cls, kwargs)
+        if model is None:
+            continue
+        adj = np.nan_to_num(model.adjacency_matrix_)
+        for to_idx, from_idx in zip(*np.nonzero(adj)):
+            ret.append(((i, j)[from_idx], (i, j)[to_idx],
+                        float(adj[to_idx, from_idx])))
+    return ret
 
 
 #def _convert_init_graph(init_graph):
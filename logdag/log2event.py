@@ -1,5 +1,7 @@
 import logging
+import os
 import pickle
+import weakref
 from abc import ABC, abstractmethod
 import pandas as pd
 import numpy as np
@@ -16,26 +18,90 @@ SRCCLS_SNMP = "snmp"
 
 
 class EventDefinition(ABC):
+    """Definition of an event (a node of DAGs).
+
+    Evdefs are immutable and compared with their identifiers,
+    which are computed once. Subclasses define __slots__ for
+    the attributes in _l_attr (and their own attributes).
+    Equal evdefs can be shared in a process with intern().
+    """
+    __slots__ = ("source", "host", "group", "_identifier", "__weakref__")
     _l_attr = ["source", "host", "group"]
 
     def __init__(self, **kwargs):
         for attr in self._l_attr:
-            setattr(self, attr, kwargs[attr])
+            object.__setattr__(self, attr, kwargs[attr])
+
+    def __setattr__(self, name, value):
+        raise AttributeError("{0} is immutable (use replace())".format(
+            self.__class__.__name__))
+
+    def __delattr__(self, name):
+        raise AttributeError("{0} is immutable".format(
+            self.__class__.__name__))
+
+    def __eq__(self, other):
+        if not isinstance(other, EventDefinition):
+            return NotImplemented
+        return type(self) is type(other) and \
+            self.identifier == other.identifier
+
+    def __hash__(self):
+        return hash(self.identifier)
+
+    def _slots(self):
+        for cls in type(self).__mro__:
+            for name in cls.__dict__.get("__slots__", ()):
+                if name not in ("_identifier", "__weakref__"):
+                    yield name
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self._slots()
+                if hasattr(self, name)}
+
+    def __setstate__(self, state):
+        # evdefs pickled before slots have their __dict__ as the state
+        if isinstance(state, tuple):
+            d_state, slot_state = state
+            state = dict(d_state or {}, **(slot_state or {}))
+        for name, value in state.items():
+            if name != "_identifier":
+                object.__setattr__(self, name, value)
 
     def key(self):
         return None
 
+    def _make_identifier(self):
+        return self.__str__()
+
     @property
     def identifier(self):
-        return self.__str__()
+        try:
+            return self._identifier
+        except AttributeError:
+            identifier = self._make_identifier()
+            object.__setattr__(self, "_identifier", identifier)
+            return identifier
+
+    def replace(self, **kwargs):
+        """Returns a copy with the given attributes replaced."""
+        state = self.__getstate__()
+        state.update(kwargs)
+        return type(self)(**state)
 
 
 class MultipleEventDefinition(EventDefinition):
+    __slots__ = ("_members",)
     _l_attr = []
+    # attributes shared by the members (see merge_sync_event)
+    _l_attr_optional = ["source", "host", "group"]
 
     def __init__(self, members, **kwargs):
         super().__init__(**kwargs)
-        self._members = members
+        object.__setattr__(self, "_members", tuple(members))
+        for attr in self._l_attr_optional:
+            if attr in kwargs:
+                object.__setattr__(self, attr, kwargs[attr])
 
     def __str__(self):
         return "|".join([str(evdef) for evdef in self._members])
@@ -44,13 +110,33 @@ class MultipleEventDefinition(EventDefinition):
     def members(self):
         return self._members
 
-    @property
-    def identifier(self):
+    def _make_identifier(self):
         return "|".join(sorted([str(evdef) for evdef in self._members]))
 
     def all_attr(self, key):
         return {getattr(evdef, key) for evdef in self._members}
 
+    def replace(self, **kwargs):
+        state = self.__getstate__()
+        members = state.pop("_members")
+        state.update(kwargs)
+        return MultipleEventDefinition(members, **state)
+
+
+# key: (class, identifier), val: EventDefinition
+_evdefs = weakref.WeakValueDictionary()
+
+
+def intern(evdef):
+    """Returns the evdef equal to the given one that is shared
+    in this process (e.g., among the evmaps of windows)."""
+    key = (type(evdef), evdef.identifier)
+    try:
+        return _evdefs[key]
+    except KeyError:
+        _evdefs[key] = evdef
+        return evdef
+
 
 class EventDefinitionMap(object):
     """This class defines classified groups as "Event", and provide
@@ -85,10 +171,19 @@ class EventDefinitionMap(object):
 
     def add_evdef(self, evdef):
         eid = self._next_eid()
+        evdef = intern(evdef)
         self._emap[eid] = evdef
         self._ermap[evdef.identifier] = eid
         return eid
 
+    def replace_evdef(self, eid, evdef):
+        """Replace the evdef of eid (e.g., with updated attributes)."""
+        old_evdef = self._emap[eid]
+        del self._ermap[old_evdef.identifier]
+        evdef = intern(evdef)
+        self._emap[eid] = evdef
+        self._ermap[evdef.identifier] = eid
+
     def has_eid(self, eid):
         return eid in self._emap
 
@@ -112,12 +207,36 @@ class EventDefinitionMap(object):
             yield self._emap[eid]
 
     def dump(self, args):
+        conf = args[0]
+        evmap_format = conf.get("dag", "evmap_format")
+        if evmap_format == "columnar":
+            from . import evdict
+            evdict.dump_evmap(self, args)
+            return
+        elif evmap_format != "pickle":
+            raise ValueError("invalid dag.evmap_format")
         fp = arguments.ArgumentManager.evdef_path(args)
         obj = (self._emap, self._ermap)
         with open(fp, "wb") as f:
             pickle.dump(obj, f)
 
     def load(self, args):
+        # the other format is also tried (e.g., jobs before changing format)
+        from . import evdict
+        conf = args[0]
+        if conf.get("dag", "evmap_format") == "columnar":
+            try:
+                evdict.load_evmap(self, args)
+                return
+            except FileNotFoundError:
+                self._load_pickle(args)
+        else:
+            try:
+                self._load_pickle(args)
+            except FileNotFoundError:
+                evdict.load_evmap(self, args)
+
+    def _load_pickle(self, args):
         fp = arguments.ArgumentManager.evdef_path(args)
         try:
             with open(fp, "rb") as f:
@@ -129,6 +248,8 @@ class EventDefinitionMap(object):
             with open(fp, "rb") as f:
                 obj = pickle.load(f)
             self._emap, self._ermap = obj
+        self._emap = {eid: intern(evdef)
+                      for eid, evdef in self._emap.items()}
 
 
 class AreaTest:
@@ -283,6 +404,14 @@ def load_event_all(sources, conf, dt_range, area, binarize):
 
 
 def makeinput(conf, dt_range, area, binarize):
+    evlist, evmap = load_input_events(conf, dt_range, area, binarize)
+    return build_input(conf, evlist, evmap)
+
+
+def load_input_events(conf, dt_range, area, binarize):
+    """Returns:
+        evlist (list of pd.DataFrame): time-series of each event
+        evmap (EventDefinitionMap)"""
     evmap = EventDefinitionMap()
     evlist = []
     sources = config.getlist(conf, "dag", "source")
@@ -293,7 +422,12 @@ def makeinput(conf, dt_range, area, binarize):
         msg = "loaded event {0} {1} (sum: {2})".format(eid, evmap.evdef(eid),
                                                        df[eid].sum())
         _logger.debug(msg)
+    return evlist, evmap
+
 
+def build_input(conf, evlist, evmap):
+    """Generate input DataFrame from loaded event time-series.
+    Note that the columns of DataFrames in evlist can be overwritten."""
     if len(evlist) == 0:
         _logger.warning("No data loaded")
         return None, None
@@ -332,13 +466,9 @@ def merge_sync_event(evlist, evmap, rules):
     for l_old_eid in hashmap.values():
         l_evdef = [evmap.evdef(eid) for eid in l_old_eid]
 
-        new_evdef = MultipleEventDefinition(l_evdef)
-        if "source" in rules:
-            new_evdef.source = l_evdef[0].source
-        if "host" in rules:
-            new_evdef.host = l_evdef[0].host
-        if "group" in rules:
-            new_evdef.group = l_evdef[0].group
+        d_attr = {attr: getattr(l_evdef[0], attr)
+                  for attr in ("source", "host", "group") if attr in rules}
+        new_evdef = MultipleEventDefinition(l_evdef, **d_attr)
         new_eid = new_evmap.add_evdef(new_evdef)
         new_df = evlist[l_old_eid[0]]
         new_df.columns = [new_eid, ]
@@ -348,6 +478,80 @@ def merge_sync_event(evlist, evmap, rules):
     return new_evlist, new_evmap
 
 
+# options of dag section that change the input (other than the window)
+INPUT_OPTIONS = ["source", "snmp_features", "area_def", "ci_bin_method",
+                 "ci_bin_size", "ci_bin_diff",
+                 "merge_syncevent", "merge_syncevent_rules"]
+# options of general section read by the event loaders
+INPUT_GENERAL_OPTIONS = ["log_source", "snmp_source", "evdb",
+                         "snmp_feature_def", "host_alias_filename",
+                         "evdb_unit_diff", "evdb_binsize",
+                         "evdb_convolve_radius"]
+# sections read by the event loaders (all options except credentials)
+INPUT_SECTIONS = ["filter", "database_amulog", "database_sql",
+                  "database_influx", "database_rrd"]
+_CREDENTIAL_OPTIONS = ("username", "passwd", "mysql_user", "mysql_passwd")
+
+
+def _input_key(conf, binarize, exclude=()):
+    sections = []
+    for section in INPUT_SECTIONS:
+        if conf.has_section(section):
+            sections.append((section, tuple(sorted(
+                (key, val) for key, val in conf[section].items()
+                if key not in _CREDENTIAL_OPTIONS))))
+    return (tuple(conf.get("dag", option) for option in INPUT_OPTIONS
+                  if option not in exclude),
+            tuple(conf["general"].get(option)
+                  for option in INPUT_GENERAL_OPTIONS),
+            tuple(sections), binarize)
+
+
+def load_input_cache(args, binarize):
+    """Input of job args stored in the job directory by dump_input_cache.
+
+    Returns:
+        input_df, evmap: or (None, None) if not available
+            (or stored with different input options)
+    """
+    fp = arguments.ArgumentManager.input_path(args)
+    try:
+        with open(fp, "rb") as f:
+            key, input_df, evmap = pickle.load(f)
+    except (IOError, EOFError, pickle.UnpicklingError):
+        return None, None
+    if key != _input_key(args[0], binarize):
+        _logger.info("input cache {0} is outdated, ignored".format(fp))
+        return None, None
+    return input_df, evmap
+
+
+def dump_input_cache(args, input_df, evmap, binarize):
+    fp = arguments.ArgumentManager.input_path(args)
+    common.mkdir(os.path.dirname(fp))
+    obj = (_input_key(args[0], binarize), input_df, evmap)
+    with open(fp, "wb") as f:
+        pickle.dump(obj, f)
+
+
+def makeinput_cached(args, binarize):
+    """makeinput of job args, with the input cache
+    if dag.input_cache is true (otherwise same as makeinput)."""
+    conf, dt_range, area = args
+    use_cache = conf.getboolean("dag", "input_cache")
+    if use_cache:
+        input_df, evmap = load_input_cache(args, binarize)
+        if input_df is not None:
+            _logger.info("input of job({0}) loaded from cache".format(
+                arguments.args2name(args)))
+            return input_df, evmap
+
+    input_df, evmap = makeinput(conf, dt_range, area, binarize)
+    if input_df is not None and use_cache:
+        dump_input_cache(args, input_df, evmap, binarize)
+    return input_df, evmap
+
+
 def evdef_instruction(conf, evdef, d_el=None):
     if d_el is None:
         d_el = init_evloaders(conf)
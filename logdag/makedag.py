@@ -1,11 +1,15 @@
 #!/usr/bin/env python
 # coding: utf-8
 
+import contextlib
 import logging
 from itertools import combinations
 
+import numpy as np
+
 from . import arguments
 from . import log2event
+from . import parallel
 from . import pc_input
 from . import showdag
 from amulog import common
@@ -32,36 +36,111 @@ def makedag_main(args, do_dump=False):
 
     # generate time-series nodes
 #   input_format = conf.get("dag", "input_format")
-    ci_func = conf.get("dag", "ci_func")
 #   binarize = is_binarize(input_format, ci_func)
     # generate event set and evmap, and apply preprocessing
     # d_input, evmap = log2event.ts2input(conf, dt_range, area, binarize)
-    input_df, evmap = log2event.makeinput(conf, dt_range, area, False)
+    input_df, evmap = log2event.makeinput_cached(args, False)
     if input_df is None:
         return None
+    timer.lap("load-nodes")
+
+    ldag = makedag_input(args, input_df, evmap, timer, do_dump=do_dump)
+    timer.stop()
+    return ldag
+
+
+def makedag_input(args, input_df, evmap, timer, do_dump=False,
+                  ci_cache=None):
+    """Estimate DAG of job args from loaded input data."""
+    jobname = arguments.args2name(args)
+    conf, dt_range, area = args
+    from . import pc_skeleton
+    budget = pc_skeleton.init_budget(conf)
+    ci_func = conf.get("dag", "ci_func")
+
     _logger.info("{0} pc input shape: {1}".format(jobname, input_df.shape))
     if do_dump:
         evmap.dump(args)
-    timer.lap("load-nodes")
 
     # generate prior knowledge
     from . import pknowledge
-    prior_knowledge = pknowledge.init_prior_knowledge(conf, evmap)
+    prior_knowledge = pknowledge.init_prior_knowledge(conf, evmap, args)
 #   init_graph = _init_graph(conf, evmap, jobname)
     timer.lap("make-prior-knowledge")
 
+    # load separating sets of the previous window
+    warm_start = pc_skeleton.init_warm_start(conf, args, evmap)
+    record = pc_skeleton.init_record(conf, input_df)
+    # resume from the checkpoint of the killed job (if available)
+    checkpoint = pc_skeleton.init_checkpoint(conf, args) if do_dump else None
+    # sufficient statistics updated from the previous window
+    from . import ci_stats
+    statistics = ci_stats.init_statistics(conf, args, input_df, evmap)
+
     # generate dag
-    graph = estimate_dag(conf, input_df, ci_func, prior_knowledge)
+    # the input matrix is placed in shared memory for parallel processing
+    processes = conf.getint("dag", "estimate_parallel")
+    with parallel.shared_frame(input_df, processes) as shared_df:
+        graph = estimate_dag(conf, shared_df, ci_func, prior_knowledge,
+                             warm_start=warm_start, budget=budget,
+                             record=record, ci_cache=ci_cache,
+                             checkpoint=checkpoint, evmap=evmap,
+                             statistics=statistics)
     timer.lap("estimate-dag")
     if graph is None:
         _logger.info("job({0}) failed on causal inference".format(jobname))
         return None
+    if "ci_shortcuts" in graph.graph:
+        _logger.info("job({0}) rare event shortcuts: {1}".format(
+            jobname, graph.graph["ci_shortcuts"]))
+    if "ci_stats_tests" in graph.graph:
+        _logger.info("job({0}) {1} of {2} CI tests answered from "
+                     "sufficient statistics".format(
+                         jobname, graph.graph["ci_stats_tests"],
+                         graph.graph["ci_tests"]))
+    if "ci_enum_tests" in graph.graph:
+        _logger.info("job({0}) conditioning set order: {1} tests "
+                     "(upper bound in default order: {2})".format(
+                         jobname, graph.graph["ci_enum_tests"],
+                         graph.graph["ci_enum_default_max"]))
 
     # record dag
     ldag = showdag.LogDAG(args, graph)
     if do_dump:
         ldag.dump()
-    timer.stop()
+        if record is not None:
+            record.dump(args)
+        if graph.graph.get("depth_truncated", False):
+            arguments.ArgumentManager.add_ledger(
+                args, "depth_truncated",
+                "depth={0}".format(graph.graph["skeleton_depth"]))
+        else:
+            arguments.ArgumentManager.remove_ledger(args, "depth_truncated")
+        if checkpoint is not None:
+            checkpoint.remove()
+    timer.lap("dump")
+    return ldag
+
+
+def rethreshold_main(args, dest_args, threshold):
+    """Derive DAG of a stricter skeleton_threshold from the skeleton record
+    of job args, and dump it (with the evmap) as job dest_args."""
+    from . import pc_skeleton
+    jobname = arguments.args2name(args)
+    record = pc_skeleton.SkeletonRecord.load(args)
+    if record is None:
+        _logger.warning("no skeleton record of job({0}), "
+                        "passed".format(jobname))
+        return None
+    graph = pc_input.rethreshold(record, threshold)
+
+    evmap = log2event.EventDefinitionMap()
+    evmap.load(args)
+    evmap.dump(dest_args)
+    ldag = showdag.LogDAG(dest_args, graph)
+    ldag.dump()
+    _logger.info("job({0}) rethreshold {1} -> {2}: {3} edges".format(
+        jobname, record.alpha, threshold, ldag.number_of_edges()))
     return ldag
 
 
@@ -84,8 +163,8 @@ def makedag_prune_test(args):
     _logger.info("pc input shape: {0}".format(input_df.shape))
     evmap.dump(conf, args)
 
-    node_ids = evmap.eids()
-    g = _complete_graph(node_ids)
+    from . import adjgraph
+    g = adjgraph.AdjacencyGraph.complete(len(evmap))
     if conf.getboolean("pc_prune", "do_pruning"):
         from . import prune
         n_edges_before = g.number_of_edges()
@@ -95,7 +174,7 @@ def makedag_prune_test(args):
                      "{0} -> {1}".format(n_edges_before, n_edges_after))
     else:
         n_edges = g.number_of_edges()
-        init_graph = g
+        init_graph = g.to_nx(directed=False)
         _logger.info("{0} DAG edge candidates: ".format(jobname) +
                      "{0}".format(n_edges))
 
@@ -140,12 +219,325 @@ def makedag_prune_test(args):
 #        raise ValueError("invalid dag.cause_algorithm")
 
 
-def estimate_dag(conf, input_df, ci_func, prior_knowledge=None):
+def estimate_dag(conf, input_df, ci_func, prior_knowledge=None,
+                 warm_start=None, budget=None, record=None, ci_cache=None,
+                 checkpoint=None, evmap=None, statistics=None):
     if input_df.shape[1] < 2:
         _logger.info("input too small({0} nodes), return empty dag".format(
             input_df.shape[1]))
         return showdag.empty_dag()
 
+    partition = conf.get("dag", "decompose_partition")
+    if partition == "khop":
+        if evmap is None:
+            raise ValueError("decompose_partition requires evmap")
+        return estimate_dag_partitions(conf, input_df, ci_func, evmap,
+                                       prior_knowledge, warm_start, budget,
+                                       record, ci_cache, checkpoint,
+                                       statistics)
+    elif partition != "none":
+        raise ValueError("invalid dag.decompose_partition")
+
+    if conf.getboolean("dag", "decompose_components"):
+        if ci_cache is None and \
+                conf.get("dag", "decompose_skeleton") == "depth0":
+            # the depth-0 tests of the decomposition are reused
+            # in the searches of the components
+            from . import pc_skeleton
+            ci_cache = pc_skeleton.CITestCache()
+        skeleton = _decompose_skeleton(conf, input_df, ci_func,
+                                       prior_knowledge, ci_cache, statistics)
+        if skeleton is not None:
+            return estimate_dag_components(conf, input_df, ci_func,
+                                           prior_knowledge, warm_start,
+                                           budget, record, ci_cache,
+                                           skeleton=skeleton,
+                                           checkpoint=checkpoint,
+                                           statistics=statistics)
+    return _estimate_dag(conf, input_df, ci_func, prior_knowledge,
+                         warm_start, budget, record, ci_cache, checkpoint,
+                         statistics)
+
+
+def _decompose_skeleton(conf, input_df, ci_func, prior_knowledge=None,
+                        ci_cache=None, statistics=None):
+    method = conf.get("dag", "decompose_skeleton")
+    if method == "prior":
+        if prior_knowledge is None:
+            return None
+        return prior_knowledge.pruned_initial_skeleton()
+    elif method == "depth0":
+        skel_th = conf.getfloat("dag", "skeleton_threshold")
+        return pc_input.depth0_skeleton(input_df, skel_th, ci_func,
+                                        prior_knowledge, ci_cache=ci_cache,
+                                        statistics=statistics,
+                                        **_rare_event_options(conf))
+    else:
+        raise ValueError("invalid dag.decompose_skeleton")
+
+
+def estimate_dag_components(conf, input_df, ci_func, prior_knowledge,
+                            warm_start=None, budget=None, record=None,
+                            ci_cache=None, skeleton=None, checkpoint=None,
+                            statistics=None):
+    """Estimate DAGs independently for each connected component
+    of the given skeleton (default: initial skeleton given by
+    prior knowledge), and compose them into one DAG.
+    The components with only one node are not processed."""
+    import networkx as nx
+
+    if skeleton is None:
+        skeleton = prior_knowledge.pruned_initial_skeleton()
+    l_nodes = sorted([sorted(nodes)
+                      for nodes in skeleton.connected_components()
+                      if len(nodes) > 1], key=len, reverse=True)
+    _logger.info("{0} components (largest {1} nodes) of {2} nodes".format(
+        len(l_nodes), len(l_nodes[0]) if len(l_nodes) > 0 else 0,
+        input_df.shape[1]))
+
+    l_graph = _estimate_subsets(conf, input_df, l_nodes, ci_func,
+                                prior_knowledge, warm_start, budget,
+                                record, ci_cache, checkpoint,
+                                statistics=statistics)
+    if l_graph is None:
+        return None
+
+    graph = showdag.empty_dag()
+    graph.add_nodes_from(input_df.columns)
+    graph = nx.compose_all([graph] + l_graph)
+    _merge_metadata(graph, l_graph)
+    return graph
+
+
+def estimate_dag_partitions(conf, input_df, ci_func, evmap,
+                            prior_knowledge=None, warm_start=None,
+                            budget=None, record=None, ci_cache=None,
+                            checkpoint=None, statistics=None):
+    """Approximate DAG estimation on overlapping partitions of the nodes
+    given by k-hop neighborhoods of the hosts in the network topology
+    (see topology.TopologyIndex.khop_partitions). Events on hosts
+    not in the topology make a partition for each host.
+
+    The DAGs of the partitions are stitched: a pair of nodes is
+    adjacent only if all partitions including both nodes agree,
+    and the edge is directed only if the partitions agree on
+    the direction. Pairs not included in any partition are not adjacent.
+    The agreement statistics are stored in graph attribute
+    partition_agreement.
+    """
+    from collections import Counter
+    from scipy import sparse
+    from . import topology
+
+    hops = conf.getint("dag", "partition_hops")
+    topo = topology.init_topology(conf)
+    hosts = [evmap.evdef(node).host for node in input_df.columns]
+    host_idxs = topo.host_indexes(hosts)
+    d_host_nodes = {}
+    d_other_nodes = {}  # nodes of hosts not in the topology
+    for node, host, host_idx in zip(input_df.columns, hosts, host_idxs):
+        if host_idx >= 0:
+            d_host_nodes.setdefault(host_idx, []).append(node)
+        else:
+            d_other_nodes.setdefault(host, []).append(node)
+
+    l_nodes = []
+    for l_host_idx in topo.khop_partitions(hops):
+        nodes = [node for host_idx in l_host_idx
+                 for node in d_host_nodes.get(host_idx, [])]
+        l_nodes.append(sorted(nodes))
+    l_nodes += [sorted(nodes) for nodes in d_other_nodes.values()]
+    # partitions included in other partitions are redundant
+    l_nodes = sorted([nodes for nodes in l_nodes if len(nodes) > 1],
+                     key=len, reverse=True)
+    l_set = []
+    for nodes in l_nodes:
+        node_set = set(nodes)
+        if not any(node_set <= other for other in l_set):
+            l_set.append(node_set)
+    l_nodes = [sorted(node_set) for node_set in l_set]
+    _logger.info("{0} partitions (largest {1} nodes) of {2} nodes "
+                 "with {3}-hop neighborhoods".format(
+                     len(l_nodes), len(l_nodes[0]) if len(l_nodes) > 0
+                     else 0, input_df.shape[1], hops))
+
+    l_graph = _estimate_subsets(conf, input_df, l_nodes, ci_func,
+                                prior_knowledge, warm_start, budget,
+                                record, ci_cache, checkpoint,
+                                statistics=statistics, key="p")
+    if l_graph is None:
+        return None
+
+    # votes of the partitions
+    adj_votes = Counter()
+    arc_votes = Counter()
+    for sub_graph in l_graph:
+        for u, v in sub_graph.edges():
+            arc_votes[(u, v)] += 1
+            if not sub_graph.has_edge(v, u) or u < v:
+                adj_votes[(min(u, v), max(u, v))] += 1
+    pairs = sorted(adj_votes.keys())
+
+    # number of partitions including both nodes of each pair
+    d_col = {node: idx for idx, node in enumerate(input_df.columns)}
+    rows = [d_col[node] for nodes in l_nodes for node in nodes]
+    cols = [part_idx for part_idx, nodes in enumerate(l_nodes)
+            for _ in nodes]
+    membership = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.int32), (rows, cols)),
+        shape=(input_df.shape[1], len(l_nodes)))
+    if len(pairs) > 0:
+        src = [d_col[u] for u, _ in pairs]
+        dst = [d_col[v] for _, v in pairs]
+        n_contain = np.asarray(membership[src].multiply(
+            membership[dst]).sum(axis=1)).ravel()
+    else:
+        n_contain = np.zeros(0, dtype=int)
+
+    graph = showdag.empty_dag()
+    graph.add_nodes_from(input_df.columns)
+    stats = {"partitions": len(l_nodes), "pairs": len(pairs),
+             "overlapped": 0, "agreed": 0, "disagreed": 0,
+             "direction_conflicts": 0}
+    for (u, v), n_part in zip(pairs, n_contain):
+        if n_part > 1:
+            stats["overlapped"] += 1
+        if adj_votes[(u, v)] < n_part:
+            stats["disagreed"] += 1
+            continue
+        if n_part > 1:
+            stats["agreed"] += 1
+        forward = arc_votes[(u, v)]
+        backward = arc_votes[(v, u)]
+        if forward == n_part and backward == 0:
+            graph.add_edge(u, v)
+        elif backward == n_part and forward == 0:
+            graph.add_edge(v, u)
+        else:
+            if forward != backward:
+                stats["direction_conflicts"] += 1
+            graph.add_edge(u, v)
+            graph.add_edge(v, u)
+    _merge_metadata(graph, l_graph)
+    graph.graph["partition_agreement"] = stats
+    _logger.info("partition agreement: {0} pairs in multiple partitions, "
+                 "{1} agreed, {2} disagreed (removed), "
+                 "{3} direction conflicts".format(
+                     stats["overlapped"], stats["agreed"],
+                     stats["disagreed"], stats["direction_conflicts"]))
+    return graph
+
+
+def _estimate_subsets(conf, input_df, l_nodes, ci_func, prior_knowledge,
+                      warm_start=None, budget=None, record=None,
+                      ci_cache=None, checkpoint=None, statistics=None,
+                      key=""):
+    """Estimate DAGs of the subsets of nodes in parallel.
+
+    Returns:
+        list of nx.DiGraph: DAGs with the original node labels,
+            or None if any estimation fails
+    """
+    import networkx as nx
+    from . import pc_skeleton
+
+    # the workers take the columns of each subset from the shared matrix
+    processes = conf.getint("dag", "estimate_parallel")
+    if budget is None:
+        budget_context = contextlib.nullcontext([None] * len(l_nodes))
+    else:
+        # the tests of all subsets are counted in the budget of the job
+        budget_context = budget.share(len(l_nodes), processes)
+    with parallel.share(input_df.values, processes) as shared, \
+            budget_context as l_budget:
+        l_args = []
+        for sub_idx, nodes in enumerate(l_nodes):
+            col_idxs = input_df.columns.get_indexer(nodes)
+            if prior_knowledge is None:
+                sub_pk = None
+            else:
+                sub_pk = prior_knowledge.subset(nodes)
+            if warm_start is None:
+                sub_ws = None
+            else:
+                sub_ws = warm_start.subset(nodes)
+            if record is None:
+                sub_record = None
+            else:
+                sub_record = pc_skeleton.SkeletonRecord(len(nodes),
+                                                        record.alpha)
+            if ci_cache is None:
+                sub_cache = None
+            else:
+                sub_cache = ci_cache.subset(nodes)
+            if checkpoint is None:
+                sub_checkpoint = None
+            else:
+                sub_checkpoint = checkpoint.subset(
+                    "{0}{1}".format(key, sub_idx))
+            if statistics is None:
+                sub_statistics = None
+            else:
+                sub_statistics = statistics.subset(col_idxs)
+            l_args.append((conf, shared, col_idxs, input_df.index, ci_func,
+                           sub_pk, sub_ws, l_budget[sub_idx], sub_record,
+                           sub_cache, sub_checkpoint, sub_statistics))
+        results = parallel.pool_starmap(_estimate_component, l_args,
+                                        processes=processes)
+
+    l_graph = []
+    for nodes, (sub_graph, sub_record, sub_cache) in zip(l_nodes, results):
+        if sub_graph is None:
+            return None
+        mapping = dict(enumerate(nodes))
+        l_graph.append(nx.relabel_nodes(sub_graph, mapping))
+        if record is not None:
+            record.merge(sub_record, nodes)
+        if ci_cache is not None:
+            ci_cache.merge(sub_cache, nodes)
+    return l_graph
+
+
+def _merge_metadata(graph, l_graph):
+    """Summarize graph attributes of estimation results of
+    the subgraphs."""
+    l_depth = [g.graph["skeleton_depth"] for g in l_graph
+               if "skeleton_depth" in g.graph]
+    if len(l_depth) > 0:
+        graph.graph["skeleton_depth"] = max(l_depth)
+    graph.graph["depth_truncated"] = any(
+        g.graph.get("depth_truncated", False) for g in l_graph)
+    graph.graph["ci_tests"] = sum(
+        g.graph.get("ci_tests", 0) for g in l_graph)
+    shortcuts = {}
+    for g in l_graph:
+        for key, cnt in g.graph.get("ci_shortcuts", {}).items():
+            shortcuts[key] = shortcuts.get(key, 0) + cnt
+    if len(shortcuts) > 0:
+        graph.graph["ci_shortcuts"] = shortcuts
+    for key in ("ci_enum_tests", "ci_enum_default_max", "ci_stats_tests"):
+        if any(key in g.graph for g in l_graph):
+            graph.graph[key] = sum(g.graph.get(key, 0) for g in l_graph)
+
+
+def _estimate_component(conf, shared, col_idxs, index, ci_func,
+                        prior_knowledge, warm_start=None, budget=None,
+                        record=None, ci_cache=None, checkpoint=None,
+                        statistics=None):
+    import pandas as pd
+    input_df = pd.DataFrame(shared.array()[:, col_idxs], index=index,
+                            columns=list(range(len(col_idxs))))
+    # record and ci_cache are returned because the updates
+    # in the worker processes are not visible from the parent process
+    graph = _estimate_dag(conf, input_df, ci_func, prior_knowledge,
+                          warm_start, budget, record, ci_cache, checkpoint,
+                          statistics)
+    return graph, record, ci_cache
+
+
+def _estimate_dag(conf, input_df, ci_func, prior_knowledge=None,
+                  warm_start=None, budget=None, record=None, ci_cache=None,
+                  checkpoint=None, statistics=None):
     cause_algorithm = conf.get("dag", "cause_algorithm")
     if cause_algorithm == "pc":
         # apply pc algorithm to estimate dag
@@ -154,25 +546,40 @@ def estimate_dag(conf, input_df, ci_func, prior_knowledge=None):
         skel_depth = conf.getint("dag", "skeleton_depth")
         skel_verbose = conf.getboolean("dag", "skeleton_verbose")
         return pc_input.pc(input_df, skel_th, ci_func, skel_method,
-                           skel_depth, skel_verbose, prior_knowledge)
+                           skel_depth, skel_verbose, prior_knowledge,
+                           warm_start=warm_start, budget=budget,
+                           record=record, ci_cache=ci_cache,
+                           checkpoint=checkpoint, statistics=statistics,
+                           **_rare_event_options(conf),
+                           **_cond_order_options(conf))
     elif cause_algorithm == "lingam":
         from . import lingam_input
         alg = conf.get("lingam", "algorithm")
         lower_limit = conf.getfloat("lingam", "lower_limit")
         ica_max_iter = conf.getint("lingam", "ica_max_iter")
+        ica_restarts = conf.getint("lingam", "ica_restarts")
+        ica_selection = conf.get("lingam", "ica_selection")
+        n_bootstrap = conf.getint("lingam", "bootstrap")
+        processes = conf.getint("dag", "estimate_parallel")
         return lingam_input.estimate(input_df, algorithm=alg,
                                      lower_limit=lower_limit,
                                      ica_max_iter=ica_max_iter,
-                                     prior_knowledge=prior_knowledge)
+                                     prior_knowledge=prior_knowledge,
+                                     ica_restarts=ica_restarts,
+                                     ica_selection=ica_selection,
+                                     processes=processes,
+                                     n_bootstrap=n_bootstrap)
     elif cause_algorithm == "mixedlingam":
         from . import mixedlingam_input
         skel_method = conf.get("dag", "skeleton_method")
         skel_th = conf.getfloat("dag", "skeleton_threshold")
         skel_depth = conf.getint("dag", "skeleton_depth")
         skel_verbose = conf.getboolean("dag", "skeleton_verbose")
+        processes = conf.getint("dag", "estimate_parallel")
         return mixedlingam_input.estimate(input_df, skel_th,
                                           skel_method, skel_depth,
-                                          skel_verbose, prior_knowledge)
+                                          skel_verbose, prior_knowledge,
+                                          processes=processes)
 #    elif cause_algorithm == "cdt":
 #        from . import cdt_input
 #        category = conf.get("cdt", "category")
@@ -191,18 +598,34 @@ def estimate_dag(conf, input_df, ci_func, prior_knowledge=None):
         skel_depth = 0
         skel_verbose = conf.getboolean("dag", "skeleton_verbose")
         return pc_input.pc(input_df, skel_th, ci_func, skel_method,
-                           skel_depth, skel_verbose, prior_knowledge)
+                           skel_depth, skel_verbose, prior_knowledge,
+                           record=record, ci_cache=ci_cache,
+                           statistics=statistics,
+                           **_rare_event_options(conf))
     elif cause_algorithm == "lingam-corr":
         from . import lingam_input
         alg = conf.get("lingam", "algorithm")
         lower_limit = conf.getfloat("lingam", "lower_limit")
+        corr_prescreen = conf.getfloat("lingam", "corr_prescreen")
+        processes = conf.getint("dag", "estimate_parallel")
         return lingam_input.estimate_corr(input_df, algorithm=alg,
                                           lower_limit=lower_limit,
-                                          prior_knowledge=prior_knowledge)
+                                          prior_knowledge=prior_knowledge,
+                                          corr_prescreen=corr_prescreen,
+                                          processes=processes)
     else:
         raise ValueError("invalid dag.cause_algorithm")
 
 
+def _rare_event_options(conf):
+    return {"rare_policy": conf.get("dag", "ci_rare_policy"),
+            "rare_min_count": conf.getint("dag", "ci_rare_min_count")}
+
+
+def _cond_order_options(conf):
+    return {"cond_order": conf.get("dag", "skeleton_cond_order")}
+
+
 #def is_binarize(input_format, ci_func):
 #    if input_format == "auto":
 #        if ci_func == "fisherz":
@@ -15,14 +15,15 @@ _logger = logging.getLogger(__package__)
 
 
 def estimate(data, skel_th=0.01, skel_method="stable", pc_depth=None,
-             skel_verbose=False, prior_knowledge=None):
-    import pcalg
+             skel_verbose=False, prior_knowledge=None, processes=1):
     from gsq.ci_tests import ci_test_bin
+    from . import pc_skeleton
 
     if prior_knowledge:
         init_graph = prior_knowledge.pruned_initial_skeleton()
     else:
-        init_graph = nx.complete_graph(data.columns)
+        # complete graph in SkeletonSearch
+        init_graph = None
 
     from . import pc_input
     pc_data_matrix = pc_input.binarize_input(data).values
@@ -44,37 +45,47 @@ def estimate(data, skel_th=0.01, skel_method="stable", pc_depth=None,
     if init_graph is not None:
         pc_args["init_graph"] = init_graph
 
-    (graph, sep_set) = pcalg.estimate_skeleton(**pc_args)
-    graph_final = estimate_direction(data, graph)
+    (graph, sep_set) = pc_skeleton.estimate_skeleton(**pc_args)
+    graph_final = estimate_direction(data, graph, processes=processes)
     return graph_final
 
 
-def estimate_direction(data, skeleton):
+def estimate_direction(data, skeleton, processes=1):
+    """Estimate directions for each weakly connected component
+    of the skeleton in parallel (larger components first).
+    The data is shared with the worker processes keeping the dtype
+    of each column (see parallel.share_frame)."""
+    from . import parallel
     mapping = {k: v for k, v in zip(skeleton.nodes(), data.columns.astype(int))}
     graph = MixedGraph(nx.relabel_nodes(skeleton, mapping))
-    subgraphs = [
-        graph.subgraph(nodes)
-        for nodes in nx.weakly_connected_components(graph)
-        if len(nodes) > 1
-    ]
-    graph_final = MixedGraph()
-    for sub in subgraphs:
-        graph_n = MixedGraph(sub)
-        data_n = data[list(graph_n.nodes())]
-        # data_n = data[data.columns[np.array(graph_n.nodes())]]
-        graph_n, data_n, mapping_n, invmap_n = normalize(graph_n, data_n)
-        graph_n = select(graph_n, data_n)
-        # invmap_n = {v: k for k, v in mapping_n.items()}
-        graph_n = nx.relabel_nodes(graph_n, invmap_n)
-        graph_final = nx.compose(graph_final, graph_n)
+    col_index = {node: idx for idx, node
+                 in enumerate(data.columns.astype(int))}
+    l_nodes = sorted([[node for node in graph.nodes() if node in nodes]
+                      for nodes in nx.weakly_connected_components(graph)
+                      if len(nodes) > 1], key=len, reverse=True)
+
+    with parallel.share_frame(data, processes) as shared:
+        l_args = [(MixedGraph(graph.subgraph(nodes)), shared,
+                   [col_index[node] for node in nodes])
+                  for nodes in l_nodes]
+        results = parallel.pool_starmap(_estimate_component, l_args,
+                                        processes=processes)
+    return nx.compose_all([MixedGraph()] + results)
 
-    return graph_final
+
+def _estimate_component(graph_n, shared, col_idxs):
+    data_n = shared.frame(col_idxs, columns=list(graph_n.nodes()))
+    graph_n, data_n, mapping_n, invmap_n = normalize(graph_n, data_n)
+    graph_n = select(graph_n, data_n)
+    return nx.relabel_nodes(graph_n, invmap_n)
 
 
 def normalize(graph: MixedGraph, data):
+    """Relabel nodes and data columns into 0, ..., n-1
+    (the given data is not modified)."""
     mapping = dict(zip(graph.nodes(), range(len(graph.nodes()))))
     inv_mapping = {v: k for k, v in mapping.items()}
     graph = nx.relabel_nodes(graph, mapping)
-    data.columns = [str(n) for n in graph.nodes()]
+    # renamed without data.values, which merges the dtypes of the columns
+    data = data.set_axis([str(n) for n in graph.nodes()], axis=1)
     return graph, data, mapping, inv_mapping
-
@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Process pool for parallel processing inside one makedag job."""
+
+import atexit
+import logging
+import multiprocessing
+import os
+from contextlib import contextmanager, ExitStack
+
+import numpy as np
+
+_logger = logging.getLogger(__package__)
+
+
+def available(processes):
+    """Intra-job parallelism is not available in the worker processes
+    of multiprocessing.Pool (e.g., make-dag -p), because daemonic
+    processes are not allowed to have children."""
+    if processes is None or processes <= 1:
+        return False
+    if multiprocessing.current_process().daemon:
+        _logger.debug("in a daemonic process, "
+                      "intra-job parallel processing disabled")
+        return False
+    return True
+
+
+def pool_starmap(func, l_args, processes=1, initializer=None, initargs=()):
+    """Apply func to each args in l_args, and return the results
+    in the same order as l_args.
+    Larger tasks should be given earlier for better load balancing.
+
+    initializer(*initargs) is called once in each worker process
+    (or in the current process if not parallelized), e.g., to give
+    large data common to all tasks without copying it per task."""
+    l_args = list(l_args)
+    if not available(processes) or len(l_args) <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        return [func(*args) for args in l_args]
+    processes = min(processes, len(l_args))
+    with multiprocessing.Pool(processes=processes, initializer=initializer,
+                              initargs=initargs) as pool:
+        return pool.starmap(func, l_args, chunksize=1)
+
+
+def _star_call(func_args):
+    func, args = func_args
+    return func(*args)
+
+
+def pool_first(func, l_args, processes=1, initializer=None, initargs=()):
+    """Apply func to each args in l_args in order, until the first
+    result that is not None (e.g., randomized restarts that can fail).
+    If parallelized, the tasks run ahead in the workers, and the tasks
+    left at the first result are cancelled (the pool is terminated).
+
+    Returns:
+        list: results in the order of l_args until the first result
+            that is not None (all results if none of them)
+    """
+    l_args = list(l_args)
+    ret = []
+    if not available(processes) or len(l_args) <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        for args in l_args:
+            ret.append(func(*args))
+            if ret[-1] is not None:
+                break
+        return ret
+    processes = min(processes, len(l_args))
+    # the workers are terminated on exit of the with statement
+    with multiprocessing.Pool(processes=processes, initializer=initializer,
+                              initargs=initargs) as pool:
+        for result in pool.imap(_star_call,
+                                [(func, args) for args in l_args]):
+            ret.append(result)
+            if result is not None:
+                break
+    return ret
+
+
+class SharedMatrix:
+    """2-D array in shared memory for worker processes.
+
+    Only the descriptor (name, shape and dtype of the block) is pickled
+    into the tasks, and the workers attach to the block without copying.
+    The creator unlinks the block on exit of the with statement
+    (also on exceptions such as KeyboardInterrupt, and at exit of
+    the interpreter). Workers never unlink the block, so crashed
+    workers leave nothing behind. If the creator is killed,
+    the resource tracker of multiprocessing unlinks the block.
+
+    Example:
+        with SharedMatrix.create(mat) as shared:
+            pool_starmap(func, [(shared, ...), ...], processes)
+        # in func: mat = shared.array()
+    """
+
+    # blocks created in this process, key: name
+    _owned = {}
+
+    def __init__(self, name, shape, dtype):
+        self.name = name
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype).str
+        self._shm = None
+        self._owner = None
+
+    @classmethod
+    def create(cls, array):
+        from multiprocessing import shared_memory
+        array = np.asarray(array)
+        shm = shared_memory.SharedMemory(create=True,
+                                         size=max(array.nbytes, 1))
+        shared = cls(shm.name, array.shape, array.dtype)
+        shared._shm = shm
+        shared._owner = os.getpid()
+        cls._owned[shared.name] = shared
+        shared.array()[:] = array
+        return shared
+
+    @classmethod
+    def lookup(cls, array):
+        """Returns the block created in this process whose array is
+        the given array (same memory and layout), or None."""
+        array = np.asarray(array)
+        address = array.__array_interface__["data"][0]
+        for shared in cls._owned.values():
+            mat = shared.array()
+            if mat.__array_interface__["data"][0] == address and \
+                    mat.shape == array.shape and \
+                    mat.dtype == array.dtype and \
+                    mat.strides == array.strides:
+                return shared
+        return None
+
+    def __getstate__(self):
+        return {"name": self.name, "shape": self.shape, "dtype": self.dtype}
+
+    def __setstate__(self, state):
+        self.__init__(state["name"], state["shape"], state["dtype"])
+
+    def _attach(self):
+        from multiprocessing import shared_memory
+        self._shm = shared_memory.SharedMemory(name=self.name)
+
+    def array(self):
+        """Returns:
+            np.ndarray: view of the shared block (do not keep it
+                after the block is unlinked)"""
+        if self._shm is None:
+            self._attach()
+        return np.ndarray(self.shape, dtype=self.dtype, buffer=self._shm.buf)
+
+    def unlink(self):
+        if self._shm is None:
+            return
+        self._shm.close()
+        if self._owner == os.getpid():
+            self._shm.unlink()
+            self._owned.pop(self.name, None)
+        self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.unlink()
+
+
+class _LocalMatrix:
+    """Same interface as SharedMatrix for an array
+    in the current process (used if not parallelized)."""
+
+    def __init__(self, array):
+        self._array = array
+        self.shape = array.shape
+
+    def array(self):
+        return self._array
+
+
+@atexit.register
+def _unlink_all():
+    for shared in list(SharedMatrix._owned.values()):
+        if shared._owner == os.getpid():
+            shared.unlink()
+
+
+@contextmanager
+def share(array, processes=1):
+    """Give an array to the tasks of pool_starmap.
+
+    If parallelized, the array is given as a SharedMatrix:
+    the block already holding the array (e.g., with shared_frame)
+    is reused, otherwise a new block is created and unlinked on exit.
+    If not parallelized, the array is given as is.
+    In both cases, the tasks get the array with array().
+    """
+    array = np.asarray(array)
+    if not available(processes):
+        yield _LocalMatrix(array)
+        return
+    shared = SharedMatrix.lookup(array)
+    if shared is not None:
+        yield shared
+    else:
+        with SharedMatrix.create(array) as shared:
+            yield shared
+
+
+@contextmanager
+def shared_frame(df, processes=1):
+    """Place the values of a DataFrame in shared memory
+    for the whole estimation of a job, if parallelized.
+
+    Yields:
+        pd.DataFrame: same as df, whose values are on the block
+            (share() reuses the block without copying)
+    """
+    if not available(processes):
+        yield df
+        return
+    if df.dtypes.nunique() > 1:
+        # df.values would merge the dtypes of the columns
+        # (the tasks share the columns with share_frame)
+        _logger.debug("input matrix with mixed dtypes not placed "
+                      "in shared memory")
+        yield df
+        return
+    import pandas as pd
+    with SharedMatrix.create(df.values) as shared:
+        _logger.debug("input matrix {0} placed in shared memory".format(
+            shared.shape))
+        yield pd.DataFrame(shared.array(), index=df.index,
+                           columns=df.columns, copy=False)
+
+
+class SharedFrame:
+    """Columns of a DataFrame given to the tasks of pool_starmap
+    with their own dtypes: the columns of each dtype are given
+    as one matrix (see share).
+
+    Example:
+        with share_frame(df, processes) as shared:
+            pool_starmap(func, [(shared, col_idxs, ...), ...], processes)
+        # in func: sub_df = shared.frame(col_idxs)
+    """
+
+    def __init__(self, l_shared, locations, index, columns):
+        self._l_shared = l_shared  # matrix of each dtype
+        self._locations = locations  # (matrix, column) of each column
+        self._index = index
+        self._columns = columns
+
+    def frame(self, col_idxs, columns=None):
+        """Returns:
+            pd.DataFrame: the given columns (indexes in the original
+                DataFrame), named with columns (default: original names)
+        """
+        import pandas as pd
+        if columns is None:
+            columns = [self._columns[idx] for idx in col_idxs]
+        l_array = [shared.array() for shared in self._l_shared]
+        return pd.DataFrame(
+            {name: l_array[self._locations[idx][0]][:,
+                                                   self._locations[idx][1]]
+             for name, idx in zip(columns, col_idxs)},
+            index=self._index, columns=columns)
+
+
+@contextmanager
+def share_frame(df, processes=1):
+    """Give a DataFrame to the tasks of pool_starmap as SharedFrame,
+    without merging the dtypes of the columns (as df.values does)."""
+    groups = {}  # key: dtype, val: column indexes
+    for idx, dtype in enumerate(df.dtypes):
+        groups.setdefault(dtype, []).append(idx)
+    locations = [None] * df.shape[1]
+    with ExitStack() as stack:
+        l_shared = []
+        for dtype, l_idx in groups.items():
+            if len(groups) == 1:
+                # the block of shared_frame is reused
+                array = df.values
+            else:
+                array = df.iloc[:, l_idx].to_numpy(dtype=dtype)
+            l_shared.append(stack.enter_context(share(array, processes)))
+            for pos, idx in enumerate(l_idx):
+                locations[idx] = (len(l_shared) - 1, pos)
+        yield SharedFrame(l_shared, locations, df.index, list(df.columns))
@@ -3,30 +3,93 @@
 
 import logging
 import numpy as np
-import networkx as nx
 
 _logger = logging.getLogger(__package__)
 
 
 def pc(data, threshold, mode="gsq", skel_method="stable",
-       pc_depth=None, verbose=False, prior_knowledge=None):
+       pc_depth=None, verbose=False, prior_knowledge=None,
+       warm_start=None, budget=None, record=None, ci_cache=None,
+       rare_policy="none", rare_min_count=5, cond_order="default",
+       checkpoint=None, statistics=None):
 
+    init_graph = _init_graph(prior_knowledge)
+    required_graph = _required_graph(prior_knowledge)
+    depth0_graph = _depth0_graph(prior_knowledge)
+    data, func = _ci_test_func(data, mode, rare_policy, rare_min_count,
+                               statistics)
+    return estimate_dag(data, threshold, func, skel_method,
+                        pc_depth, verbose, init_graph, warm_start, budget,
+                        record, ci_cache, cond_order, required_graph,
+                        checkpoint, depth0_graph)
+
+
+def depth0_skeleton(data, threshold, mode="gsq", prior_knowledge=None,
+                    ci_cache=None, rare_policy="none", rare_min_count=5,
+                    statistics=None):
+    """Skeleton with only the order-0 CI tests, e.g., to decompose
+    the nodes into connected components before the estimation.
+
+    Returns:
+        AdjacencyGraph: nodes are the indexes of data columns
+    """
+    from . import pc_skeleton
+    init_graph = _init_graph(prior_knowledge)
+    data, func = _ci_test_func(data, mode, rare_policy, rare_min_count,
+                               statistics)
+    search = pc_skeleton.SkeletonSearch(
+        func, data.values, threshold, max_reach=0, init_graph=init_graph,
+        ci_cache=ci_cache, required_graph=_required_graph(prior_knowledge))
+    g, _ = search.run()
+    return g
+
+
+def _init_graph(prior_knowledge):
+    if prior_knowledge:
+        return prior_knowledge.pruned_initial_skeleton()
+    else:
+        # complete graph in SkeletonSearch
+        return None
+
+
+def _required_graph(prior_knowledge):
     if prior_knowledge:
-        init_graph = prior_knowledge.pruned_initial_skeleton()
+        return prior_knowledge.required_skeleton()
     else:
-        init_graph = nx.complete_graph(data.columns)
+        return None
 
+
+def _depth0_graph(prior_knowledge):
+    if prior_knowledge:
+        return prior_knowledge.depth0_only_skeleton()
+    else:
+        return None
+
+
+def _ci_test_func(data, mode, rare_policy="none", rare_min_count=5,
+                  statistics=None):
+    """Returns:
+        data (pd.DataFrame): input data converted for the test
+        func: CI test function"""
     if mode == "gsq":
         from gsq.ci_tests import ci_test_bin
         func = ci_test_bin
         data = binarize_input(data)
+        if statistics is not None:
+            from . import ci_stats
+            func = ci_stats.StatisticsTest(func, statistics)
+        if rare_policy != "none":
+            func = RareEventTest(func, data.values,
+                                 rare_policy, rare_min_count)
     elif mode in ("fisherz", "fisherz_bin"):
         from citestfz.ci_tests import ci_test_gauss
         func = ci_test_gauss
+        if statistics is not None:
+            from . import ci_stats
+            func = ci_stats.StatisticsTest(func, statistics)
     else:
         raise ValueError("ci_func invalid ({0})".format(mode))
-    return estimate_dag(data, threshold, func, skel_method,
-                        pc_depth, verbose, init_graph)
+    return data, func
 
 
 # def pc(data, threshold, mode="pylib", skel_method="default",
@@ -46,13 +109,99 @@ def pc(data, threshold, mode="gsq", skel_method="stable",
 #    return graph
 
 
+def rethreshold(record, threshold):
+    """Estimate DAG for a stricter threshold from the stored p-values
+    of the skeleton search (see pc_skeleton.SkeletonRecord)."""
+    if threshold > record.alpha:
+        raise ValueError("threshold {0} is looser than that of "
+                         "the record ({1})".format(threshold, record.alpha))
+    g, sep_set = record.skeleton(threshold)
+    g = estimate_cpdag(g, sep_set)
+    g.graph["skeleton_threshold"] = threshold
+    return g
+
+
+class RareEventTest:
+    """G-square test function with a shortcut policy for
+    under-powered tests of rare events.
+
+    A test of pair (i, j) is under-powered if the number of bins
+    with value 1 (or 0) of i or j is smaller than min_count.
+    The margins are counted once from the binary data matrix.
+
+    Policies:
+        none: run the tests as usual.
+        independent: declare the pair independent (p-value 1).
+        exact: use Fisher's exact test instead of the order-0 G-square
+            test. Higher-order tests are run as usual.
+        no-condition: run only the order-0 test, and do not separate
+            the pair with conditioning sets (p-value 0).
+    """
+
+    policies = ("none", "independent", "exact", "no-condition")
+
+    def __init__(self, func, data_matrix, policy="none", min_count=5):
+        if policy not in self.policies:
+            raise ValueError("invalid rare event policy {0}".format(policy))
+        self.func = func
+        self.policy = policy
+        self._min_count = min_count
+        n_samples = data_matrix.shape[0]
+        n_ones = data_matrix.sum(axis=0)
+        self._margin = np.minimum(n_ones, n_samples - n_ones)
+        self.counts = {}
+
+    def is_rare(self, i, j):
+        return min(self._margin[i], self._margin[j]) < self._min_count
+
+    def _count(self, key):
+        self.counts[key] = self.counts.get(key, 0) + 1
+
+    def identity(self):
+        from . import pc_skeleton
+        return ("rare_event", self.policy, self._min_count,
+                pc_skeleton.ci_test_identity(self.func))
+
+    @staticmethod
+    def _fisher_exact(data_matrix, i, j):
+        from scipy.stats import fisher_exact
+        x = data_matrix[:, i].astype(bool)
+        y = data_matrix[:, j].astype(bool)
+        table = [[np.sum(~x & ~y), np.sum(~x & y)],
+                 [np.sum(x & ~y), np.sum(x & y)]]
+        _, p_val = fisher_exact(table)
+        return p_val
+
+    def __call__(self, data_matrix, i, j, cond):
+        if self.policy == "none" or not self.is_rare(i, j):
+            return self.func(data_matrix, i, j, cond)
+        elif self.policy == "independent":
+            self._count(self.policy)
+            return 1.0
+        elif self.policy == "exact":
+            if len(cond) == 0:
+                self._count(self.policy)
+                return self._fisher_exact(data_matrix, i, j)
+            else:
+                return self.func(data_matrix, i, j, cond)
+        elif self.policy == "no-condition":
+            if len(cond) == 0:
+                return self.func(data_matrix, i, j, cond)
+            else:
+                self._count(self.policy)
+                return 0.0
+        else:
+            raise ValueError
+
+
 def binarize_input(data):
     return data.apply(lambda s: s.map(lambda x: 1 if x >= 1 else 0))
 
 
 def estimate_skeleton(data, threshold, func, skel_method="stable",
-                      pc_depth=None, verbose=False, init_graph=None):
-    import pcalg
+                      pc_depth=None, verbose=False, init_graph=None,
+                      warm_start=None):
+    from . import pc_skeleton
     args = {"indep_test_func": func,
             "data_matrix": data.values,
             "alpha": threshold,
@@ -62,28 +211,64 @@ def estimate_skeleton(data, threshold, func, skel_method="stable",
         args["max_reach"] = pc_depth
     if init_graph is not None:
         args["init_graph"] = init_graph
-    g, _ = pcalg.estimate_skeleton(**args)
-    return g.to_directed()
+    if warm_start is not None:
+        args["warm_start"] = warm_start
+    search = pc_skeleton.SkeletonSearch(**args)
+    g, _ = search.run()
+    return g.to_nx(directed=True)
 
 
 def estimate_dag(data, threshold, func, skel_method="stable",
-                 pc_depth=None, verbose=False, init_graph=None):
+                 pc_depth=None, verbose=False, init_graph=None,
+                 warm_start=None, budget=None, record=None,
+                 ci_cache=None, cond_order="default", required_graph=None,
+                 checkpoint=None, depth0_graph=None):
 
-    import pcalg
-    args = {"indep_test_func": func,
-            "data_matrix": data.values,
-            "alpha": threshold,
-            "method": skel_method,
-            "verbose": verbose}
-    if pc_depth is not None and pc_depth >= 0:
-        args["max_reach"] = pc_depth
-    if init_graph is not None:
-        args["init_graph"] = init_graph
-    g, sep_set = pcalg.estimate_skeleton(**args)
-    g = pcalg.estimate_cpdag(skel_graph=g, sep_set=sep_set)
+    from . import pc_skeleton
+    search = pc_skeleton.SkeletonSearch(func, data.values, threshold,
+                                        method=skel_method,
+                                        max_reach=pc_depth,
+                                        init_graph=init_graph,
+                                        warm_start=warm_start,
+                                        budget=budget,
+                                        ci_cache=ci_cache,
+                                        cond_order=cond_order,
+                                        required_graph=required_graph,
+                                        checkpoint=checkpoint,
+                                        verbose=verbose,
+                                        depth0_graph=depth0_graph)
+    g, sep_set = search.run()
+    if record is not None:
+        record.update(search)
+    g = estimate_cpdag(g, sep_set)
+    g.graph["skeleton_depth"] = search.depth
+    g.graph["depth_truncated"] = search.truncated
+    g.graph["ci_tests"] = search.n_tests
+    if cond_order != "default":
+        g.graph["ci_enum_tests"] = search.n_enum_tests
+        g.graph["ci_enum_default_max"] = search.n_enum_default_max
+    if isinstance(func, RareEventTest):
+        g.graph["ci_shortcuts"] = dict(func.counts)
+        func = func.func
+    from . import ci_stats
+    if isinstance(func, ci_stats.StatisticsTest):
+        g.graph["ci_stats_tests"] = func.n_answered
     return g
 
 
+def estimate_cpdag(skeleton, sep_set):
+    """Orient the skeleton (AdjacencyGraph) into CPDAG.
+
+    Returns:
+        nx.DiGraph: undirected edges are represented as arcs
+            in both directions
+    """
+    from . import pc_orient
+    g = pc_orient.estimate_cpdag(skeleton, sep_set)
+    g.graph.update(skeleton.graph)
+    return g.to_nx(directed=True)
+
+
 #def pc_gsq(data, threshold, skel_method, pc_depth=None,
 #           verbose=False, init_graph=None):
 #    import pcalg
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Orientation phase of PC algorithm (skeleton to CPDAG) on adjacency arrays.
+
+The results are same as pcalg.estimate_cpdag, including the order
+dependence of conflicting v-structures and Meek rules.
+pcalg visits all pairs of nodes in every sweep; here, only the pairs
+that can be changed are visited in the same order:
+
+- v-structures: the pairs of nonadjacent nodes with common neighbors
+  (detected with sparse matrix product), and the pairs that lose
+  both arcs by conflicting v-structures.
+- Meek rules (R1-R3): a worklist of undirected edges. An orientation of
+  edge (a, b) revisits only the undirected edges incident to a or b,
+  in the current sweep if they come later in the pcalg order,
+  otherwise in the next sweep.
+"""
+
+import heapq
+import logging
+
+import numpy as np
+
+from . import adjgraph
+
+_logger = logging.getLogger(__package__)
+
+
+def _candidate_pairs(skeleton):
+    """Nonadjacent pairs (i, j), i < j, with any common neighbor."""
+    from scipy import sparse
+    adj = skeleton.adj | skeleton.adj.T
+    mat = sparse.csr_matrix(adj, dtype=np.int32)
+    common = (mat @ mat).tocoo()
+    pairs = [(int(i), int(j)) for i, j in zip(common.row, common.col)
+             if i < j and not adj[i, j]]
+    return sorted(pairs)
+
+
+def orient_v_structures(dag, sep_set):
+    """Orient unshielded colliders i -> k <- j (in place)."""
+    adj = dag.adj
+    heap = _candidate_pairs(dag)
+    queued = set(heap)
+    while len(heap) > 0:
+        current = heapq.heappop(heap)
+        i, j = current
+        if adj[i, j] or adj[j, i]:
+            continue
+        if sep_set[i][j] is None:
+            continue
+        for k in np.flatnonzero(adj[i] & adj[j]):
+            k = int(k)
+            if k in sep_set[i][j]:
+                continue
+            for x in (i, j):
+                if adj[k, x]:
+                    _logger.debug("S: remove edge ({0}, {1})".format(k, x))
+                    adj[k, x] = False
+                    # pairs without arcs are nonadjacent for latter pairs
+                    pair = (min(k, x), max(k, x))
+                    if not adj[x, k] and pair > current \
+                            and pair not in queued:
+                        heapq.heappush(heap, pair)
+                        queued.add(pair)
+    return dag
+
+
+def _rule1(adj, i, j):
+    # i-j into i->j if k->i such that k and j are nonadjacent
+    directed_to_i = adj[:, i] & ~adj[i, :]
+    nonadjacent_j = ~(adj[:, j] | adj[j, :])
+    return bool(np.any(directed_to_i & nonadjacent_j))
+
+
+def _rule2(adj, i, j):
+    # i-j into i->j if i->k->j
+    succs_i = adj[i, :] & ~adj[:, i]
+    preds_j = adj[:, j] & ~adj[j, :]
+    return bool(np.any(succs_i & preds_j))
+
+
+def _rule3(adj, i, j):
+    # i-j into i->j if i-k->j and i-l->j such that k and l are nonadjacent
+    undirected_i = adj[i, :] & adj[:, i]
+    directed_to_j = adj[:, j] & ~adj[j, :]
+    cand = np.flatnonzero(undirected_i & directed_to_j)
+    if len(cand) < 2:
+        return False
+    sub = adj[np.ix_(cand, cand)] | adj[np.ix_(cand, cand)].T
+    np.fill_diagonal(sub, True)
+    return not bool(np.all(sub))
+
+
+def apply_meek_rules(dag):
+    """Apply Meek rules R1-R3 until no more edges are oriented (in place).
+    R4 is not necessary for PC algorithm (same as pcalg)."""
+    adj = dag.adj
+    undirected = np.argwhere(adj & adj.T)
+    heap = [(int(i), int(j)) for i, j in undirected]
+    heapq.heapify(heap)
+    queued = set(heap)
+    n_sweep = 0
+    while len(heap) > 0:
+        n_sweep += 1
+        next_pairs = set()
+        while len(heap) > 0:
+            current = heapq.heappop(heap)
+            queued.remove(current)
+            i, j = current
+            if not (adj[i, j] and adj[j, i]):
+                continue
+            if not (_rule1(adj, i, j) or _rule2(adj, i, j) or
+                    _rule3(adj, i, j)):
+                continue
+            _logger.debug("R: remove edge ({0}, {1})".format(j, i))
+            adj[j, i] = False
+            # revisit undirected edges incident to i or j
+            for x in (i, j):
+                for y in np.flatnonzero(adj[x, :] & adj[:, x]):
+                    y = int(y)
+                    for pair in ((x, y), (y, x)):
+                        if pair > current:
+                            if pair not in queued:
+                                heapq.heappush(heap, pair)
+                                queued.add(pair)
+                        else:
+                            next_pairs.add(pair)
+        heap = list(next_pairs)
+        heapq.heapify(heap)
+        queued = set(heap)
+    _logger.debug("meek rules converged in {0} sweeps".format(n_sweep))
+    return dag
+
+
+def estimate_cpdag(skeleton, sep_set):
+    """Same as pcalg.estimate_cpdag, on AdjacencyGraph.
+
+    Args:
+        skeleton (AdjacencyGraph or nx.Graph): skeleton graph
+        sep_set: 2D-array of separation sets (None for pruned pairs)
+
+    Returns:
+        AdjacencyGraph: undirected edges are represented as arcs
+            in both directions
+    """
+    dag = adjgraph.AdjacencyGraph.from_graph(skeleton)
+    dag.adj |= dag.adj.T
+    orient_v_structures(dag, sep_set)
+    apply_meek_rules(dag)
+    return dag
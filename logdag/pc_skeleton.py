@@ -0,0 +1,925 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Skeleton estimation of PC algorithm.
+
+The search order and the stable-PC behavior follow
+pcalg.estimate_skeleton, so that the results are same as pcalg
+with same arguments. This module additionally provides hooks
+for logdag-specific speed-up, such as the warm start with
+separating sets found in the previous overlapping window.
+"""
+
+import logging
+import time
+from contextlib import contextmanager
+from itertools import combinations
+from scipy.special import comb
+
+import numpy as np
+
+from . import adjgraph
+from . import arguments
+
+_logger = logging.getLogger(__package__)
+
+
+class SkeletonSearch:
+    """Estimate a skeleton graph with conditional independence tests.
+
+    Args:
+        indep_test_func: conditional independence test function
+            in the pcalg style: func(data_matrix, i, j, set(k)) -> p-value.
+        data_matrix (np.ndarray): input data, columns are nodes.
+        alpha (float): significance level of the tests.
+        method (str): "stable" for stable-PC, otherwise original PC.
+        max_reach (int, optional): maximum size of conditioning sets.
+            If None or negative, no limit is set.
+        init_graph (AdjacencyGraph or nx.Graph, optional): initial
+            skeleton. If None, a complete graph is used.
+        warm_start (WarmStart, optional): separating sets of
+            the previous window, tested prior to the full enumeration.
+        budget (SearchBudget, optional): limit of time and tests.
+            If exhausted, the search stops after the current level
+            and the result is marked as truncated.
+        ci_cache (CITestCache, optional): p-values shared with
+            other searches on the same data.
+        cond_order (str): order of conditioning sets in a level.
+            "default" enumerates them in the combination order of
+            node ids (same as pcalg). "association" tries the nodes
+            strongly associated (in depth-0 tests) with both ends first.
+            The separating sets (and the CPDAG) can differ from
+            the default order.
+        required_graph (AdjacencyGraph or nx.Graph, optional): edges
+            kept in the skeleton without tests (e.g., stable edges
+            of the previous windows), if given in init_graph.
+        depth0_graph (AdjacencyGraph or nx.Graph, optional): edges
+            tested only at depth 0, and kept without the tests
+            with conditioning sets if not removed at depth 0
+            (e.g., pairs never connected in the previous windows).
+        checkpoint (SkeletonCheckpoint, optional): the state of
+            the search is saved at the end of each level, and
+            the search resumes from the saved state if available.
+        verbose (bool): log every test (with info level).
+    """
+
+    def __init__(self, indep_test_func, data_matrix, alpha,
+                 method="stable", max_reach=None, init_graph=None,
+                 warm_start=None, budget=None, ci_cache=None,
+                 cond_order="default", required_graph=None,
+                 checkpoint=None, verbose=False, depth0_graph=None):
+        self._func = indep_test_func
+        self._data = data_matrix
+        self._alpha = alpha
+        self._stable = (method == "stable")
+        if max_reach is not None and max_reach < 0:
+            max_reach = None
+        self._max_reach = max_reach
+        if warm_start is not None and not self._stable:
+            # the cached sets can change the skeleton of original PC,
+            # because the removal order of edges in a level differs
+            _logger.warning("skeleton warm start ignored: "
+                            "available only with stable method")
+            warm_start = None
+        self._warm_start = warm_start
+        self._verbose = verbose
+        # separating sets found from each side of the pairs
+        # (with strict warm start), to recover the sets of a cold start
+        # key: (i, j) for the side i, val: (conditioning set, depth,
+        # adjacency of i in the level if the set is cached, otherwise None)
+        self._warm_sides = {}
+        self._budget = budget
+        self._ci_cache = ci_cache
+        if cond_order not in ("default", "association"):
+            raise ValueError("invalid cond_order {0}".format(cond_order))
+        self._cond_order = cond_order
+        # p-values of depth-0 tests, key: (i, j) with i < j
+        self._assoc = None
+
+        self.node_ids = list(range(data_matrix.shape[1]))
+        node_size = len(self.node_ids)
+        self.sep_set = [[set() for _ in range(node_size)]
+                        for _ in range(node_size)]
+        if init_graph is None:
+            self.graph = adjgraph.AdjacencyGraph.complete(node_size)
+        else:
+            if not init_graph.number_of_nodes() == node_size:
+                raise ValueError("init_graph not matching data_matrix shape")
+            self.graph = adjgraph.AdjacencyGraph.from_graph(init_graph,
+                                                            node_size)
+            noedges = ~(self.graph.adj | self.graph.adj.T)
+            np.fill_diagonal(noedges, False)
+            for i, j in np.argwhere(noedges):
+                self.sep_set[i][j] = None
+
+        # maximum p-values of the tests for each pair of nodes
+        # key: (i, j) with i < j, val: (p-value, depth, conditioning set)
+        # p-value is inf if separated with a cached set without test,
+        # and -inf if the edge is required without test
+        self.pvalues = {}
+        self.n_tests = 0
+        if required_graph is None:
+            self._required = None
+        else:
+            required = adjgraph.AdjacencyGraph.from_graph(required_graph,
+                                                          node_size)
+            self._required = required.adj | required.adj.T
+            for i, j in np.argwhere(np.triu(self._required, k=1)):
+                if self.graph.has_edge(i, j):
+                    self._record(int(i), int(j), (), -np.inf)
+        if depth0_graph is None:
+            self._depth0 = None
+        else:
+            depth0 = adjgraph.AdjacencyGraph.from_graph(depth0_graph,
+                                                        node_size)
+            self._depth0 = depth0.adj | depth0.adj.T
+        self.depth = None
+        self.truncated = False
+        # tests in the enumeration of conditioning sets, and an upper
+        # bound of the tests in the default order (for evaluation of
+        # cond_order): for each separated pair, the rank of the found set
+        # in the default order, which is not less than that of the first
+        # separating set on the same adjacency (not measured, to avoid
+        # the extra tests)
+        self.n_enum_tests = 0
+        self.n_enum_default_max = 0
+
+        self._checkpoint = checkpoint
+        if checkpoint is not None:
+            self._fingerprint = checkpoint.fingerprint(
+                data_matrix, [self.graph.adj, self._required, self._depth0],
+                ci_test_identity(indep_test_func),
+                alpha, method, max_reach, cond_order)
+
+    def _record(self, i, j, cond, p_val):
+        key = (min(i, j), max(i, j))
+        if key not in self.pvalues or p_val > self.pvalues[key][0]:
+            self.pvalues[key] = (p_val, len(cond), tuple(sorted(cond)))
+
+    def _run_test(self, i, j, cond):
+        self.n_tests += 1
+        if self._budget is not None:
+            self._budget.add_tests(1)
+        return self._func(self._data, i, j, set(cond))
+
+    def _test(self, i, j, cond):
+        if self._ci_cache is None:
+            p_val = self._run_test(i, j, cond)
+        else:
+            p_val = self._ci_cache.get(i, j, cond)
+            if p_val is None:
+                p_val = self._run_test(i, j, cond)
+                self._ci_cache.add(i, j, cond, p_val)
+        if self._verbose:
+            _logger.info("p: test ({0}, {1}) | {2}: p-value {3}".format(
+                i, j, sorted(cond), p_val))
+        self._record(i, j, cond, p_val)
+        return p_val
+
+    def _separate(self, i, j, cond, remove_edges):
+        if self.graph.has_edge(i, j):
+            _logger.debug("p: remove edge ({0}, {1})".format(i, j))
+            if self._stable:
+                remove_edges.append((i, j))
+            else:
+                self.graph.remove_edge(i, j)
+        self.sep_set[i][j] |= set(cond)
+        self.sep_set[j][i] |= set(cond)
+
+    def _test_cached(self, i, j, adj_i, depth):
+        """Returns conditioning set if the separating set
+        of the previous window is still available, otherwise None."""
+        cond = self._warm_start.candidate(i, j, depth)
+        if cond is None or not set(cond) <= set(adj_i):
+            return None
+        if self._warm_start.strict:
+            p_val = self._test(i, j, cond)
+            if p_val > self._alpha:
+                self._warm_start.n_hit += 1
+                return cond
+            else:
+                self._warm_start.n_miss += 1
+                return None
+        else:
+            self._warm_start.n_hit += 1
+            self._record(i, j, cond, np.inf)
+            return cond
+
+    def _search_level(self, depth):
+        cont = False
+        remove_edges = []
+        for i in self.node_ids:
+            for j in self.graph.neighbors(i):
+                if not self.graph.has_edge(i, j):
+                    # removed in this level (not stable)
+                    continue
+                if self._required is not None and self._required[i, j]:
+                    continue
+                if depth > 0 and self._depth0 is not None and \
+                        self._depth0[i, j]:
+                    continue
+                adj_i = [k for k in self.graph.neighbors(i) if k != j]
+                if len(adj_i) < depth:
+                    continue
+
+                cached = None
+                if self._warm_start is not None and depth > 0:
+                    cached = self._test_cached(i, j, adj_i, depth)
+                if cached is not None:
+                    self._separate(i, j, cached, remove_edges)
+                    if self._warm_start.strict:
+                        self._warm_sides[(i, j)] = (tuple(cached), depth,
+                                                    tuple(adj_i))
+                    cont = True
+                    continue
+
+                cond = self._enumerate(i, j, adj_i, depth, remove_edges)
+                if cond is not None and self._warm_start is not None:
+                    self._warm_sides[(i, j)] = (tuple(cond), depth, None)
+                cont = True
+        if self._stable:
+            self.graph.remove_edges_from(remove_edges)
+        return cont
+
+    def _association(self, i, j, k):
+        # larger p-value of depth-0 tests of (i, k) and (j, k)
+        return max(self._assoc.get((min(i, k), max(i, k)), 1.),
+                   self._assoc.get((min(j, k), max(j, k)), 1.))
+
+    def _candidates(self, i, j, adj_i, depth):
+        if self._cond_order == "association" and depth > 0:
+            candidates = sorted(adj_i, key=lambda k: (
+                self._association(i, j, k), k))
+        else:
+            candidates = adj_i
+        return combinations(candidates, depth)
+
+    def _enumerate(self, i, j, adj_i, depth, remove_edges):
+        """Returns the separating set, or None if not separated."""
+        n_total = comb(len(adj_i), depth, exact=True)
+        for cnt, cond in enumerate(self._candidates(i, j, adj_i, depth)):
+            p_val = self._test(i, j, cond)
+            if p_val > self._alpha:
+                self._separate(i, j, cond, remove_edges)
+                self.n_enum_tests += cnt + 1
+                # default order finds cond (or other sets) until its rank
+                self.n_enum_default_max += _combination_rank(
+                    [adj_i.index(k) for k in sorted(cond)],
+                    len(adj_i)) + 1
+                return cond
+        self.n_enum_tests += n_total
+        self.n_enum_default_max += n_total
+        return None
+
+    def _first_separating_set(self, i, j, adj_i, depth):
+        """Separating set of (i, j) found first in the enumeration
+        (i.e., in a cold start), or None."""
+        for cond in self._candidates(i, j, adj_i, depth):
+            if self._test(i, j, cond) > self._alpha:
+                return cond
+        return None
+
+    def _recover_sep_sets(self):
+        """Replace the cached separating sets (strict warm start) with
+        the sets of a cold start, if they are used in the orientation
+        (i.e., the pair has common neighbors in the skeleton).
+        With stable method, a pair separated with a cached set
+        is also separated in the same level of a cold start,
+        so the CPDAG is same as that of a cold start."""
+        pairs = {(min(i, j), max(i, j))
+                 for (i, j), (_, _, adj) in self._warm_sides.items()
+                 if adj is not None}
+        n_recovered = 0
+        for i, j in sorted(pairs):
+            if not set(self.graph.neighbors(i)) & \
+                    set(self.graph.neighbors(j)):
+                continue
+            new_cond = set()
+            for a, b in ((i, j), (j, i)):
+                if (a, b) not in self._warm_sides:
+                    continue
+                cond, depth, adj = self._warm_sides[(a, b)]
+                if adj is not None:
+                    first_cond = self._first_separating_set(
+                        a, b, list(adj), depth)
+                    if first_cond is not None:
+                        cond = first_cond
+                new_cond |= set(cond)
+            self.sep_set[i][j] = new_cond
+            self.sep_set[j][i] = set(new_cond)
+            n_recovered += 1
+        return n_recovered
+
+    def _expected_tests(self, depth):
+        """Upper bound of the number of tests in the level."""
+        n_tests = 0
+        for i in self.node_ids:
+            degree = self.graph.degree(i)
+            n_tests += degree * comb(degree - 1, depth, exact=True)
+        return n_tests
+
+    def _affordable(self, depth, elapsed):
+        """Test whether the level can be completed in the remaining budget
+        (used in adaptive policy)."""
+        n_expected = self._expected_tests(depth)
+        if n_expected == 0:
+            return True
+        test_time = elapsed / self.n_tests if self.n_tests > 0 else 0
+        n_remain = self._budget.remaining_tests(test_time)
+        return n_remain is None or n_expected <= n_remain
+
+    def _stop(self, depth, cont, time_start):
+        """Test whether the search stops before the level of depth."""
+        if not cont:
+            return True
+        if self._max_reach is not None and depth > self._max_reach:
+            return True
+        if self._budget is not None:
+            if self._budget.exhausted() or \
+                    (self._budget.adaptive and not self._affordable(
+                        depth, time.time() - time_start)):
+                _logger.warning("skeleton search truncated at depth "
+                                "{0} ({1} tests)".format(self.depth,
+                                                         self.n_tests))
+                self.truncated = True
+                return True
+        return False
+
+    def _state(self, depth, done):
+        n_nodes = len(self.node_ids)
+        # only non-trivial separating sets (None or not empty)
+        sep_set = {(i, j): self.sep_set[i][j]
+                   for i in range(n_nodes) for j in range(i + 1, n_nodes)
+                   if self.sep_set[i][j] is None or
+                   len(self.sep_set[i][j]) > 0}
+        return {"depth": depth, "done": done,
+                "completed_depth": self.depth,
+                "truncated": self.truncated,
+                "adj": self.graph.adj,
+                "sep_set": sep_set,
+                "pvalues": self.pvalues,
+                "assoc": self._assoc,
+                "n_tests": self.n_tests,
+                "n_enum_tests": self.n_enum_tests,
+                "n_enum_default_max": self.n_enum_default_max,
+                "warm_sides": self._warm_sides,
+                "ci_cache": None if self._ci_cache is None
+                else self._ci_cache._cache}
+
+    def _restore(self, state):
+        """Returns:
+            depth (int): the next level to search
+            done (bool): True if the search has been finished"""
+        n_nodes = len(self.node_ids)
+        self.graph.adj[:] = state["adj"]
+        self.sep_set = [[set() for _ in range(n_nodes)]
+                        for _ in range(n_nodes)]
+        for (i, j), cond in state["sep_set"].items():
+            self.sep_set[i][j] = None if cond is None else set(cond)
+            self.sep_set[j][i] = None if cond is None else set(cond)
+        self.pvalues = state["pvalues"]
+        self._assoc = state["assoc"]
+        self.depth = state["completed_depth"]
+        self.truncated = state["truncated"]
+        self.n_tests = state["n_tests"]
+        self.n_enum_tests = state["n_enum_tests"]
+        self.n_enum_default_max = state["n_enum_default_max"]
+        self._warm_sides = state["warm_sides"]
+        if self._budget is not None:
+            # the tests before the restart are counted in the budget
+            self._budget.add_tests(self.n_tests)
+        if self._ci_cache is not None and state["ci_cache"] is not None:
+            self._ci_cache._cache.update(state["ci_cache"])
+        _logger.info("skeleton search resumed from the checkpoint "
+                     "of depth {0} ({1} tests)".format(self.depth,
+                                                       self.n_tests))
+        return state["depth"], state["done"]
+
+    def run(self):
+        time_start = time.time()
+        depth = 0
+        done = False
+        if self._checkpoint is not None:
+            state = self._checkpoint.load(self._fingerprint)
+            if state is not None:
+                depth, done = self._restore(state)
+        while not done:
+            cont = self._search_level(depth)
+            self.depth = depth
+            if depth == 0 and self._cond_order == "association":
+                self._assoc = {key: val[0]
+                               for key, val in self.pvalues.items()}
+            depth += 1
+            done = self._stop(depth, cont, time_start)
+            if self._checkpoint is not None:
+                self._checkpoint.save(self._fingerprint,
+                                      self._state(depth, done))
+
+        if self._warm_start is not None:
+            n_recovered = 0
+            if self._warm_start.strict:
+                n_recovered = self._recover_sep_sets()
+            _logger.info("skeleton warm start: {0} hit, {1} miss, "
+                         "{2} separating sets recovered".format(
+                             self._warm_start.n_hit, self._warm_start.n_miss,
+                             n_recovered))
+        if self._cond_order != "default":
+            _logger.info("conditioning set order {0}: {1} tests "
+                         "(upper bound in default order: {2})".format(
+                             self._cond_order, self.n_enum_tests,
+                             self.n_enum_default_max))
+        return self.graph, self.sep_set
+
+
+def ci_test_identity(func):
+    """Identity of a CI test function, e.g., for the fingerprint
+    of SkeletonCheckpoint. Wrappers of test functions
+    (e.g., pc_input.RareEventTest) give their parameters
+    and the identity of the wrapped function with identity()."""
+    if hasattr(func, "identity"):
+        return func.identity()
+    name = getattr(func, "__qualname__", type(func).__qualname__)
+    return "{0}.{1}".format(getattr(func, "__module__", ""), name)
+
+
+def _combination_rank(positions, n):
+    """Rank of a combination (sorted positions in range(n)) in
+    the lexicographic order of itertools.combinations."""
+    k = len(positions)
+    rank = 0
+    prev = -1
+    for t, pos in enumerate(positions):
+        for v in range(prev + 1, pos):
+            rank += comb(n - 1 - v, k - 1 - t, exact=True)
+        prev = pos
+    return rank
+
+
+def estimate_skeleton(indep_test_func, data_matrix, alpha, **kwargs):
+    """Same interface as pcalg.estimate_skeleton.
+
+    Returns:
+        g: a skeleton graph (as a networkx.Graph).
+        sep_set: a separation set (as an 2D-array of set()).
+    """
+    search = SkeletonSearch(indep_test_func, data_matrix, alpha, **kwargs)
+    g, sep_set = search.run()
+    return g.to_nx(directed=False), sep_set
+
+
+class SearchBudget:
+    """Limit of time and the number of tests in skeleton estimation
+    of one job. The tests are counted over all searches given
+    the budget (e.g., connected components of the job), including
+    those in worker processes (see share()).
+
+    Args:
+        time_limit (datetime.timedelta, optional): time limit from
+            the initialization of this object (i.e., job start).
+        test_limit (int, optional): limit of the number of tests.
+        adaptive (bool): If True, the search also stops before a level
+            whose expected number of tests (estimated from
+            the current adjacency sizes) exceeds the remaining budget
+            (the affordability check only: PC ends anyway at a level
+            with no pairs to test).
+    """
+
+    def __init__(self, time_limit=None, test_limit=None, adaptive=False):
+        if time_limit:
+            self.deadline = time.time() + time_limit.total_seconds()
+        else:
+            self.deadline = None
+        if test_limit is not None and test_limit <= 0:
+            test_limit = None
+        self.test_limit = test_limit
+        self.adaptive = adaptive
+        self._n_tests = 0
+        # test counts of parallel tasks (one slot for each task)
+        self._slots = None
+        self._slot = None
+
+    @property
+    def n_tests(self):
+        n_tests = self._n_tests
+        if self._slots is not None:
+            n_tests += int(self._slots.array().sum())
+        return n_tests
+
+    def add_tests(self, n_tests):
+        if self._slots is None:
+            self._n_tests += n_tests
+        else:
+            self._slots.array()[self._slot] += n_tests
+
+    @contextmanager
+    def share(self, n_tasks, processes=1):
+        """Budgets of n_tasks tasks of parallel.pool_starmap,
+        counting the tests in one budget.
+
+        Yields:
+            list of SearchBudget: the budget for each task
+        """
+        from . import parallel
+        if not parallel.available(processes) or n_tasks <= 1:
+            # the tasks run in this process
+            yield [self] * n_tasks
+            return
+        import copy
+        counts = np.zeros(n_tasks, dtype=np.int64)
+        with parallel.SharedMatrix.create(counts) as slots:
+            l_budget = []
+            for task_idx in range(n_tasks):
+                budget = copy.copy(self)
+                budget._n_tests = self.n_tests
+                budget._slots = slots
+                budget._slot = task_idx
+                l_budget.append(budget)
+            try:
+                yield l_budget
+            finally:
+                self.add_tests(int(slots.array().sum()))
+
+    def exhausted(self):
+        if self.test_limit is not None and self.n_tests >= self.test_limit:
+            return True
+        if self.deadline is not None and time.time() >= self.deadline:
+            return True
+        return False
+
+    def remaining_tests(self, test_time):
+        """Estimated number of tests available in the remaining budget,
+        or None if no limit is given."""
+        l_remain = []
+        if self.test_limit is not None:
+            l_remain.append(self.test_limit - self.n_tests)
+        if self.deadline is not None and test_time > 0:
+            l_remain.append((self.deadline - time.time()) / test_time)
+        if len(l_remain) == 0:
+            return None
+        return min(l_remain)
+
+
+class SkeletonRecord:
+    """Maximum p-values of the conditional independence tests
+    for each pair of nodes, with the depth and the conditioning set
+    of the test. It is stored in the job directory as a compact
+    side file of the DAG (skeleton.npz).
+
+    With the record, the skeleton and the CPDAG for stricter (smaller)
+    thresholds can be derived without re-running the tests:
+    a pair is separated if its maximum p-value exceeds the threshold.
+    Note that this is an approximation for depth > 0, because the search
+    with the stricter threshold can use different conditioning sets.
+    """
+
+    def __init__(self, n_nodes=0, alpha=None):
+        self.n_nodes = n_nodes
+        self.alpha = alpha
+        # key: (i, j) with i < j, val: (p-value, depth, conditioning set)
+        self.pvalues = {}
+
+    def __len__(self):
+        return len(self.pvalues)
+
+    def update(self, search):
+        self.n_nodes = max(self.n_nodes, len(search.node_ids))
+        self.pvalues.update(search.pvalues)
+
+    def merge(self, record, node_ids):
+        """Add a record of the subgraph of given nodes,
+        whose node ids are their indexes in node_ids.
+        For pairs in multiple (overlapping) subgraphs,
+        the maximum p-value is kept."""
+        if self.alpha is None:
+            self.alpha = record.alpha
+        for (i, j), (p_val, depth, cond) in record.pvalues.items():
+            key = tuple(sorted((node_ids[i], node_ids[j])))
+            if key in self.pvalues and self.pvalues[key][0] >= p_val:
+                continue
+            new_cond = tuple(sorted(node_ids[k] for k in cond))
+            self.pvalues[key] = (p_val, depth, new_cond)
+
+    def separations(self, alpha=None):
+        """Returns:
+            dict: key: (i, j), val: (depth, conditioning set)"""
+        if alpha is None:
+            alpha = self.alpha
+        return {key: (depth, cond) for key, (p_val, depth, cond)
+                in self.pvalues.items() if p_val > alpha}
+
+    def number_of_edges(self, alpha=None):
+        if alpha is None:
+            alpha = self.alpha
+        return sum(1 for p_val, _, _ in self.pvalues.values()
+                   if p_val <= alpha)
+
+    def skeleton(self, alpha=None):
+        """Returns skeleton graph (AdjacencyGraph) and separation sets
+        in the format of pcalg.estimate_skeleton."""
+        if alpha is None:
+            alpha = self.alpha
+        node_ids = list(range(self.n_nodes))
+        g = adjgraph.AdjacencyGraph.empty(self.n_nodes)
+        sep_set = [[None for _ in node_ids] for _ in node_ids]
+        for (i, j), (p_val, depth, cond) in self.pvalues.items():
+            if p_val > alpha:
+                sep_set[i][j] = set(cond)
+                sep_set[j][i] = set(cond)
+            else:
+                g.add_edge(i, j)
+                sep_set[i][j] = set()
+                sep_set[j][i] = set()
+        return g, sep_set
+
+    def dump(self, args):
+        keys = sorted(self.pvalues.keys())
+        values = [self.pvalues[key] for key in keys]
+        l_cond = [cond for _, _, cond in values]
+        obj = {
+            "n_nodes": self.n_nodes,
+            "alpha": self.alpha,
+            "src": np.array([i for i, _ in keys], dtype=np.int32),
+            "dst": np.array([j for _, j in keys], dtype=np.int32),
+            "pvalue": np.array([p for p, _, _ in values], dtype=np.float64),
+            "depth": np.array([d for _, d, _ in values], dtype=np.int16),
+            "cond_indptr": np.cumsum([0] + [len(cond) for cond in l_cond],
+                                     dtype=np.int64),
+            "cond_indices": np.array([k for cond in l_cond for k in cond],
+                                     dtype=np.int32),
+        }
+        fp = arguments.ArgumentManager.skeleton_path(args)
+        with open(fp, "wb") as f:
+            np.savez_compressed(f, **obj)
+
+    @classmethod
+    def load(cls, args):
+        """Returns None if the record of the job is not available."""
+        fp = arguments.ArgumentManager.skeleton_path(args)
+        try:
+            with np.load(fp) as obj:
+                record = cls(int(obj["n_nodes"]), float(obj["alpha"]))
+                indptr = obj["cond_indptr"]
+                indices = obj["cond_indices"]
+                iterobj = zip(obj["src"], obj["dst"],
+                              obj["pvalue"], obj["depth"])
+                for idx, (i, j, p_val, depth) in enumerate(iterobj):
+                    cond = tuple(int(k) for k
+                                 in indices[indptr[idx]:indptr[idx + 1]])
+                    record.pvalues[(int(i), int(j))] = (float(p_val),
+                                                        int(depth), cond)
+        except IOError:
+            return None
+        return record
+
+
+class SkeletonCheckpoint:
+    """State of a skeleton search saved in the job directory
+    at the end of each level (see SkeletonSearch), so that a killed job
+    (e.g., OOM kill) resumes from the last completed level.
+
+    The state is saved with a fingerprint of the input data,
+    the CI test (see ci_test_identity) and the search parameters,
+    and it is not used for different searches.
+    The checkpoints of the job are removed when the DAG is dumped.
+
+    Args:
+        args: job arguments
+        key (optional): identifier of the search in the job
+            (e.g., the index of the connected component)
+    """
+
+    def __init__(self, args, key=None):
+        self.args = args
+        self.key = key
+
+    def subset(self, key):
+        """Returns SkeletonCheckpoint for a part of the job
+        (e.g., a connected component)."""
+        if self.key is not None:
+            key = "{0}_{1}".format(self.key, key)
+        return SkeletonCheckpoint(self.args, key)
+
+    @property
+    def path(self):
+        return arguments.ArgumentManager.checkpoint_path(self.args, self.key)
+
+    @staticmethod
+    def fingerprint(data_matrix, l_adj, *params):
+        """Hash of the input data, adjacency matrices
+        (e.g., initial graph, None if not given) and other parameters."""
+        import hashlib
+        h = hashlib.sha1()
+        mat = np.ascontiguousarray(data_matrix)
+        h.update(str((mat.shape, mat.dtype.str) + params).encode())
+        h.update(mat.tobytes())
+        for adj in l_adj:
+            if adj is None:
+                h.update(b"none")
+            else:
+                h.update(np.packbits(adj).tobytes())
+        return h.hexdigest()
+
+    def load(self, fingerprint):
+        """Returns the saved state, or None if not available."""
+        import pickle
+        try:
+            with open(self.path, "rb") as f:
+                saved_fingerprint, state = pickle.load(f)
+        except (IOError, EOFError, pickle.UnpicklingError):
+            return None
+        if saved_fingerprint != fingerprint:
+            _logger.info("checkpoint {0} ignored: different search".format(
+                self.path))
+            return None
+        return state
+
+    def save(self, fingerprint, state):
+        import os
+        import pickle
+        fp = self.path
+        tmp_fp = fp + ".tmp"
+        with open(tmp_fp, "wb") as f:
+            pickle.dump((fingerprint, state), f)
+        os.replace(tmp_fp, fp)
+
+    def remove(self):
+        """Remove all checkpoints of the job."""
+        import glob
+        import os
+        fp = arguments.ArgumentManager.checkpoint_path(self.args)
+        dirname = os.path.dirname(fp)
+        for fp in glob.glob(os.path.join(dirname, "checkpoint*.pickle*")):
+            os.remove(fp)
+
+
+class CITestCache:
+    """p-values of conditional independence tests on one input data,
+    shared by multiple searches with different parameters
+    (e.g., skeleton_threshold) on the same data (see sweep.py)."""
+
+    def __init__(self):
+        self.n_hit = 0
+        self.n_miss = 0
+        self._cache = {}  # key: (i, j, conditioning set), val: p-value
+
+    def __len__(self):
+        return len(self._cache)
+
+    @staticmethod
+    def _key(i, j, cond):
+        return (min(i, j), max(i, j), tuple(sorted(cond)))
+
+    def get(self, i, j, cond):
+        p_val = self._cache.get(self._key(i, j, cond), None)
+        if p_val is None:
+            self.n_miss += 1
+        else:
+            self.n_hit += 1
+        return p_val
+
+    def add(self, i, j, cond, p_val):
+        self._cache[self._key(i, j, cond)] = p_val
+
+    def subset(self, node_ids):
+        """Returns CITestCache for the subgraph of given nodes.
+        The node ids are relabeled into their indexes in node_ids."""
+        d_idx = {node: idx for idx, node in enumerate(node_ids)}
+        cache = CITestCache()
+        for (i, j, cond), p_val in self._cache.items():
+            if i in d_idx and j in d_idx and all(k in d_idx for k in cond):
+                cache.add(d_idx[i], d_idx[j], [d_idx[k] for k in cond], p_val)
+        return cache
+
+    def merge(self, cache, node_ids):
+        """Add a cache of the subgraph of given nodes,
+        whose node ids are their indexes in node_ids."""
+        self.n_hit += cache.n_hit
+        self.n_miss += cache.n_miss
+        for (i, j, cond), p_val in cache._cache.items():
+            self.add(node_ids[i], node_ids[j],
+                     [node_ids[k] for k in cond], p_val)
+
+
+class WarmStart:
+    """Separating sets found in the previous overlapping window.
+
+    Consecutive windows (e.g., 30h term with 24h step) share most of
+    their data, and the edges removed with conditioning sets in one window
+    are usually removed with same conditioning sets in the next window.
+    Events are mapped across windows with EventDefinition.identifier.
+
+    The cached sets are used only with stable method (stable-PC).
+
+    Args:
+        strict (bool): If True, every cached separating set is re-tested
+            on the current data before it is used to remove an edge.
+            The skeleton is then same as that of a cold start.
+            The separating sets used in the orientation (pairs with
+            common neighbors) are replaced with those of a cold start
+            after the search, so that the CPDAG is also same.
+            If False, the skeleton and the CPDAG can differ.
+    """
+
+    def __init__(self, strict=True):
+        self.strict = strict
+        self.n_hit = 0
+        self.n_miss = 0
+        self._cache = {}  # key: (eid, eid), val: conditioning set
+
+    def __len__(self):
+        return len(self._cache)
+
+    def candidate(self, i, j, depth):
+        key = (min(i, j), max(i, j))
+        cond = self._cache.get(key, None)
+        if cond is None or len(cond) != depth:
+            return None
+        return cond
+
+    def subset(self, node_ids):
+        """Returns WarmStart for the subgraph of given nodes.
+        The node ids are relabeled into their indexes in node_ids."""
+        d_idx = {node: idx for idx, node in enumerate(node_ids)}
+        ws = WarmStart(strict=self.strict)
+        for (i, j), cond in self._cache.items():
+            if i in d_idx and j in d_idx and all(k in d_idx for k in cond):
+                new_cond = tuple(sorted(d_idx[k] for k in cond))
+                ws._cache[(d_idx[i], d_idx[j])] = new_cond
+        return ws
+
+    def load(self, args, evmap):
+        """Load separating sets of the job args, and map them
+        into the event ids of the given evmap."""
+        from . import log2event
+        jobname = arguments.args2name(args)
+        record = SkeletonRecord.load(args)
+        prev_evmap = log2event.EventDefinitionMap()
+        if record is not None:
+            try:
+                prev_evmap.load(args)
+            except IOError:
+                record = None
+        if record is None:
+            _logger.info("no skeleton record of job({0}), "
+                         "cold start".format(jobname))
+            return self
+
+        d_eid = {evdef.identifier: eid for eid, evdef in evmap.items()}
+        d_map = {prev_eid: d_eid.get(evdef.identifier, None)
+                 for prev_eid, evdef in prev_evmap.items()}
+        for (i, j), (depth, cond) in record.separations().items():
+            if depth == 0:
+                # single test for depth 0, nothing to be saved
+                continue
+            new_nodes = [d_map.get(node, None) for node in (i, j) + cond]
+            if None in new_nodes:
+                continue
+            new_i, new_j = new_nodes[:2]
+            key = (min(new_i, new_j), max(new_i, new_j))
+            self._cache[key] = tuple(sorted(new_nodes[2:]))
+        _logger.info("{0} separating sets loaded from job({1})".format(
+            len(self), jobname))
+        return self
+
+
+def init_warm_start(conf, args, evmap):
+    if not conf.getboolean("dag", "skeleton_warm_start"):
+        return None
+    strict = conf.getboolean("dag", "skeleton_warm_start_strict")
+    prev_args = arguments.ArgumentManager.previous_args(args)
+    return WarmStart(strict=strict).load(prev_args, evmap)
+
+
+def init_record(conf, input_df):
+    if conf.getboolean("dag", "skeleton_record") or \
+            conf.getboolean("dag", "skeleton_warm_start"):
+        alpha = conf.getfloat("dag", "skeleton_threshold")
+        return SkeletonRecord(input_df.shape[1], alpha)
+    else:
+        return None
+
+
+def init_checkpoint(conf, args):
+    if not conf.getboolean("dag", "skeleton_checkpoint"):
+        return None
+    return SkeletonCheckpoint(args)
+
+
+def init_budget(conf):
+    from amulog import config
+    time_budget = conf.get("dag", "skeleton_time_budget").strip()
+    time_limit = config.str2dur(time_budget) if time_budget else None
+    test_limit = conf.getint("dag", "skeleton_test_budget")
+    policy = conf.get("dag", "skeleton_depth_policy")
+    if policy == "fixed":
+        adaptive = False
+    elif policy == "adaptive":
+        adaptive = True
+    else:
+        raise ValueError("invalid skeleton_depth_policy {0}".format(policy))
+    if time_limit is None and test_limit <= 0:
+        if adaptive:
+            raise ValueError("skeleton_depth_policy adaptive requires "
+                             "skeleton_time_budget or skeleton_test_budget")
+        return None
+    return SearchBudget(time_limit, test_limit, adaptive)
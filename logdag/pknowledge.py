@@ -1,115 +1,237 @@
 
 import logging
-import json
-from itertools import combinations, permutations
+from itertools import combinations_with_replacement
 from abc import ABC, abstractmethod
-import networkx as nx
+import numpy as np
+
+from . import arguments
+from . import topology
 
 _logger = logging.getLogger(__package__)
 
 
 class PriorKnowledge:
+    """Rules of prior knowledge on a matrix of node indexes.
+
+    rules[i, j] has bit flags of the arc i -> j
+    (PATH: path i -> j, NOPATH: no path i -> j,
+    DEPTH0: the pair is tested only at depth 0 in PC).
+    An edge rule is a pair of path rules in both directions,
+    and a noedge rule is a pair of nopath rules.
+    A pair is an edge (or a noedge) if any path (or nopath) rule
+    is given in either direction.
+    """
+
+    PATH = 1
+    NOPATH = 2
+    DEPTH0 = 4
 
     def __init__(self, node_ids):
         self._node_ids = node_ids
-        # edges
-        self._edges = set()
-        # noedges
-        self._noedges = set()
-        # paths
-        self._paths = set()
-        # nopaths
-        self._nopaths = set()
-        # exogenous_variables
-        self._exogenous_variables = set()
-        # sink_variables
-        self._sink_variables = set()
+        self._index = {node: idx for idx, node in enumerate(node_ids)}
+        n_nodes = len(node_ids)
+        self._rules = np.zeros((n_nodes, n_nodes), dtype=np.int8)
+        self._exogenous = np.zeros(n_nodes, dtype=bool)
+        self._sink = np.zeros(n_nodes, dtype=bool)
 
     @property
     def node_ids(self):
         return self._node_ids
 
-    @staticmethod
-    def _reorder_edge(edge):
-        return tuple(sorted(list(edge)))
+    def _indexes(self, nodes):
+        return np.array([self._index[node] for node in nodes], dtype=int)
 
-    @staticmethod
-    def _reverse_edge(edge):
-        return edge[1], edge[0]
+    def _add_rule(self, edge, flag):
+        i, j = self._index[edge[0]], self._index[edge[1]]
+        self._rules[i, j] |= flag
+
+    def _has_rule(self, edge, flag):
+        i, j = self._index[edge[0]], self._index[edge[1]]
+        return bool(self._rules[i, j] & flag)
 
     def add_noedge_rule(self, edge):
-        self._noedges.add(self._reorder_edge(edge))
-        self._nopaths.add(edge)
-        self._nopaths.add(self._reverse_edge(edge))
+        self._add_rule(edge, self.NOPATH)
+        self._add_rule(edge[::-1], self.NOPATH)
 
     def add_edge_rule(self, edge):
-        self._edges.add(self._reorder_edge(edge))
-        self._paths.add(edge)
-        self._paths.add(self._reverse_edge(edge))
+        self._add_rule(edge, self.PATH)
+        self._add_rule(edge[::-1], self.PATH)
 
     def add_nopath_rule(self, edge):
-        self._noedges.add(self._reorder_edge(edge))
-        self._nopaths.add(edge)
+        self._add_rule(edge, self.NOPATH)
 
     def add_path_rule(self, edge):
-        self._edges.add(self._reorder_edge(edge))
-        self._paths.add(edge)
+        self._add_rule(edge, self.PATH)
+
+    def add_noedge_block(self, nodes1, nodes2):
+        """Add noedge rules for all pairs of nodes1 and nodes2
+        (pairs of the same node are ignored)."""
+        idxs1 = self._indexes(nodes1)
+        idxs2 = self._indexes(nodes2)
+        block = np.ix_(idxs1, idxs2)
+        self._rules[block] |= self.NOPATH
+        self._rules[block[::-1]] |= self.NOPATH
+        diag = np.intersect1d(idxs1, idxs2)
+        self._rules[diag, diag] &= ~self.NOPATH
+
+    def add_noedge_groups(self, labels, group_noedge):
+        """Add noedge rules for all pairs of nodes in the groups
+        with group_noedge[g1, g2] (pairs of the same node are ignored).
+
+        Args:
+            labels (np.ndarray): group index of each node (in node_ids order)
+            group_noedge (np.ndarray): symmetric boolean matrix of groups
+        """
+        labels = np.asarray(labels, dtype=int)
+        self.add_noedge_matrix(group_noedge[labels][:, labels])
+
+    def add_noedge_matrix(self, noedge):
+        """Add noedge rules for pairs with symmetric boolean matrix
+        noedge[i, j] (in node_ids order, diagonal is ignored)."""
+        noedge = np.array(noedge, dtype=bool)
+        np.fill_diagonal(noedge, False)
+        self._rules[noedge] |= self.NOPATH
+
+    def add_edge_matrix(self, edge):
+        """Add edge rules for pairs with symmetric boolean matrix
+        edge[i, j] (in node_ids order, diagonal is ignored)."""
+        edge = np.array(edge, dtype=bool)
+        np.fill_diagonal(edge, False)
+        self._rules[edge] |= self.PATH
+
+    def add_depth0_matrix(self, depth0):
+        """Add depth0 rules for pairs with symmetric boolean matrix
+        depth0[i, j] (in node_ids order, diagonal is ignored):
+        the pairs are removed only by the depth-0 CI test in PC,
+        and kept without the tests with conditioning sets."""
+        depth0 = np.array(depth0, dtype=bool)
+        np.fill_diagonal(depth0, False)
+        self._rules[depth0] |= self.DEPTH0
 
     def add_exogenous_variable(self, node):
-        self._exogenous_variables.add(node)
+        self._exogenous[self._index[node]] = True
 
     def add_sink_variable(self, node):
-        self._sink_variables.add(node)
+        self._sink[self._index[node]] = True
 
     def is_edge(self, edge):
-        return self._reorder_edge(edge) in self._edges
+        return self._has_rule(edge, self.PATH) or \
+            self._has_rule(edge[::-1], self.PATH)
 
     def is_noedge(self, edge):
-        return self._reorder_edge(edge) in self._noedges
+        return self._has_rule(edge, self.NOPATH) or \
+            self._has_rule(edge[::-1], self.NOPATH)
 
     def is_path(self, edge):
-        return edge in self._paths
+        return self._has_rule(edge, self.PATH)
 
     def is_nopath(self, edge):
-        return edge in self._nopaths
+        return self._has_rule(edge, self.NOPATH)
 
     def is_exogenous_variable(self, node):
-        return node in self._exogenous_variables
+        return bool(self._exogenous[self._index[node]])
 
     def is_sink_variable(self, node):
-        return node in self._sink_variables
+        return bool(self._sink[self._index[node]])
+
+    def path_matrix(self):
+        """Returns:
+            np.ndarray: path[i, j] if path i -> j"""
+        return (self._rules & self.PATH).astype(bool)
+
+    def nopath_matrix(self):
+        """Returns:
+            np.ndarray: nopath[i, j] if no path i -> j"""
+        return (self._rules & self.NOPATH).astype(bool)
+
+    def subset(self, node_ids):
+        """Returns PriorKnowledge of the given nodes.
+        The node ids are relabeled into their indexes in node_ids."""
+        idxs = self._indexes(node_ids)
+        pk = PriorKnowledge(list(range(len(node_ids))))
+        pk._rules = self._rules[np.ix_(idxs, idxs)]
+        pk._exogenous = self._exogenous[idxs]
+        pk._sink = self._sink[idxs]
+        return pk
 
     def pruned_initial_skeleton(self):
         # make initial graph for skeleton estimation methods
         # this is pruning-based approach: only considering no-edge rules
         # currently designed for python pcalg library and cnsm2020
-        g = nx.Graph()
-        g.add_nodes_from(self._node_ids)
-        for i, j in combinations(self._node_ids, 2):
-            if (i, j) not in self._noedges:
-                g.add_edge(i, j)
+        # nodes of the graph are the indexes of node_ids
+        from . import adjgraph
+        g = adjgraph.AdjacencyGraph.complete(len(self._node_ids))
+        nopath = self.nopath_matrix()
+        g.adj &= ~(nopath | nopath.T)
         return g
 
+    def required_skeleton(self):
+        """Pairs with edge rules (path rules in both directions)
+        that must be kept in the skeleton without tests.
+
+        Returns:
+            AdjacencyGraph or None: nodes are the indexes of node_ids,
+                None if no edge rules are given
+        """
+        from . import adjgraph
+        path = self.path_matrix()
+        required = path & path.T
+        if not required.any():
+            return None
+        return adjgraph.AdjacencyGraph(required)
+
+    def depth0_only_skeleton(self):
+        """Pairs with depth0 rules (see add_depth0_matrix).
+
+        Returns:
+            AdjacencyGraph or None: nodes are the indexes of node_ids,
+                None if no depth0 rules are given
+        """
+        from . import adjgraph
+        depth0 = (self._rules & self.DEPTH0).astype(bool)
+        if not depth0.any():
+            return None
+        return adjgraph.AdjacencyGraph(depth0 | depth0.T)
+
     def lingam_prior_knowledge(self, node_ids=None):
-        from lingam.utils import make_prior_knowledge
+        """Prior knowledge matrix same as that of
+        lingam.utils.make_prior_knowledge: pk[j, i] is 1 if path i -> j,
+        0 if no path i -> j, and -1 if unknown
+        (path rules are prior to nopath rules on the same arc)."""
         if node_ids is None:
-            kwargs = {"n_variables": len(self._node_ids),
-                      "exogenous_variables": self._exogenous_variables,
-                      "sink_variables": self._sink_variables,
-                      "paths": self._paths,
-                      "nopaths": self._nopaths}
+            pk = self
         else:
-            possible_paths = set(permutations(node_ids, 2))
-            exv = set(node_ids) & self._exogenous_variables
-            siv = set(node_ids) & self._sink_variables
-            paths = possible_paths & self._paths
-            nopaths = possible_paths & self._nopaths
-            kwargs = {"n_variables": len(node_ids),
-                      "exogenous_variables": exv,
-                      "sink_variables": siv,
-                      "paths": paths,
-                      "nopaths": nopaths}
-        return make_prior_knowledge(**kwargs)
+            pk = self.subset(node_ids)
+        n_nodes = len(pk.node_ids)
+        path = pk.path_matrix()
+        pmatrix = np.full((n_nodes, n_nodes), -1)
+        pmatrix[pk.nopath_matrix().T] = 0
+        pmatrix[path.T] = 1
+        pmatrix[:, pk._sink] = 0
+        pmatrix[pk._exogenous, :] = 0
+        np.fill_diagonal(pmatrix, -1)
+        return pmatrix
+
+    def pair_rules(self, node_ids=None):
+        """Rules on pairs of nodes as boolean matrices
+        in the order of node_ids, for pair-wise estimation.
+
+        Returns:
+            nopath (np.ndarray): nopath[i, j] if no path i -> j
+            constrained (np.ndarray): constrained[i, j] if any rule
+                is given on node i, node j, or the pair
+        """
+        if node_ids is None:
+            pk = self
+        else:
+            pk = self.subset(node_ids)
+        nopath = pk.nopath_matrix()
+        constrained = (pk._rules & (self.PATH | self.NOPATH)) != 0
+        constrained |= constrained.T
+        nodes = pk._exogenous | pk._sink
+        constrained[nodes, :] = True
+        constrained[:, nodes] = True
+        return nopath, constrained
 
 
 class KnowledgeGenerator(ABC):
@@ -119,11 +241,115 @@ class KnowledgeGenerator(ABC):
 
 
 class ImportDAG(KnowledgeGenerator):
-    """Import DAGs generated by other logdag results"""
-
-    def __init__(self, args):
+    """Import DAGs of the previous windows generated by logdag
+    as the priors of the search space.
+
+    Events are mapped across windows with EventDefinition.identifier.
+
+    With src_conf (DAGs estimated independently of this rule),
+    pairs of events observed together in the imported windows but
+    never connected are given noedge rules, and edges found in at least
+    stable_ratio of the imported windows are given edge rules
+    (required edges, kept without tests in PC).
+
+    Without src_conf, the imported DAGs are estimated with this rule
+    itself, so hard rules would be a fixed point (a pruned pair is never
+    connected again, and a required edge is never removed).
+    The never connected pairs are given depth0 rules instead
+    (tested only at depth 0, see PriorKnowledge.add_depth0_matrix):
+    a pair dependent at depth 0 is kept, and then tested as usual
+    in the following windows. No required edges are given.
+
+    Args:
+        args: job arguments of the current window
+        n_windows (int): number of previous windows to import
+        stable_ratio (float): ratio of the imported windows
+            for the required edges (0 to disable)
+        src_conf (optional): config of the imported DAGs
+            (e.g., long-term results), same as args if None
+    """
+
+    def __init__(self, args, n_windows=1, stable_ratio=0., src_conf=None):
         super().__init__()
-        raise NotImplementedError
+        self._stable_ratio = stable_ratio
+        # hard rules only on the DAGs independent of this rule
+        self._hard = src_conf is not None
+        # list of (set of identifiers, set of identifier pairs)
+        self._windows = []
+
+        conf, dt_range, area = args
+        if src_conf is None:
+            src_conf = conf
+        prev_args = (src_conf, dt_range, area)
+        for _ in range(n_windows):
+            prev_args = arguments.ArgumentManager.previous_args(prev_args)
+            window = self._load_window(prev_args)
+            if window is not None:
+                self._windows.append(window)
+        _logger.info("import DAGs of {0} windows (in {1})".format(
+            len(self._windows), n_windows))
+
+    @staticmethod
+    def _load_window(args):
+        from . import showdag
+        jobname = arguments.args2name(args)
+        ldag = showdag.LogDAG(args)
+        try:
+            ldag.load()
+            evmap = ldag._evmap()
+        except (IOError, EOFError):
+            _logger.info("no DAG of job({0}) to import".format(jobname))
+            return None
+
+        identifiers = {evdef.identifier for _, evdef in evmap.items()}
+        edges = set()
+        for edge in ldag.graph.to_undirected().edges():
+            edges.add(frozenset(evmap.evdef(node).identifier
+                                for node in edge))
+        return identifiers, edges
+
+    def update(self, pk, evmap):
+        if len(self._windows) == 0:
+            return pk
+
+        n_nodes = len(pk.node_ids)
+        d_idx = {evmap.evdef(node).identifier: idx
+                 for idx, node in enumerate(pk.node_ids)}
+        observed = np.zeros((n_nodes, n_nodes), dtype=bool)
+        n_connected = np.zeros((n_nodes, n_nodes), dtype=np.int32)
+        for identifiers, edges in self._windows:
+            present = np.zeros(n_nodes, dtype=bool)
+            present[[d_idx[key] for key in identifiers if key in d_idx]] = True
+            observed |= np.outer(present, present)
+            idxs = np.array([[d_idx[key] for key in edge]
+                             for edge in edges
+                             if len(edge) == 2 and all(key in d_idx
+                                                       for key in edge)],
+                            dtype=int).reshape(-1, 2)
+            n_connected[idxs[:, 0], idxs[:, 1]] += 1
+            n_connected[idxs[:, 1], idxs[:, 0]] += 1
+
+        unconnected = observed & (n_connected == 0)
+        n_unconnected = int(np.triu(unconnected, k=1).sum())
+        if not self._hard:
+            pk.add_depth0_matrix(unconnected)
+            if self._stable_ratio > 0:
+                _logger.info("stable edges are not required "
+                             "without import_dag_config")
+            _logger.info("imported DAGs: {0} depth0 pairs".format(
+                n_unconnected))
+            return pk
+
+        pk.add_noedge_matrix(unconnected)
+        n_stable = 0
+        if self._stable_ratio > 0:
+            min_count = self._stable_ratio * len(self._windows)
+            stable = n_connected >= min_count
+            pk.add_edge_matrix(stable)
+            n_stable = int(np.triu(stable, k=1).sum())
+        _logger.info("imported DAGs: {0} noedge pairs, "
+                     "{1} stable edges".format(n_unconnected, n_stable))
+        return pk
 
 
 class RuleBasedPruning(KnowledgeGenerator, ABC):
@@ -132,30 +358,55 @@ class RuleBasedPruning(KnowledgeGenerator, ABC):
         super().__init__()
         pass
 
-    @staticmethod
-    def _load_graph(fp):
-        with open(fp, 'r', encoding='utf-8') as f:
-            js = json.load(f)
-        return nx.node_link_graph(js)
-
     @abstractmethod
     def _is_adjacent(self, evdef1, evdef2):
         raise NotImplementedError
 
+    def _group_key(self, evdef):
+        """Nodes with the same key must have the same adjacency
+        (i.e., the key includes all attributes used in _is_adjacent).
+        The default key is the event definition itself."""
+        return evdef
+
     def update(self, pk, evmap):
-        for node1, node2 in combinations(pk.node_ids, 2):
-            evdef1, evdef2 = [evmap.evdef(n) for n in (node1, node2)]
-            # prune edges that are not topologically adjacent
-            if not self._is_adjacent(evdef1, evdef2):
-                pk.add_noedge_rule((node1, node2))
+        # group nodes by key (e.g., host), and
+        # evaluate the adjacency for each pair of groups
+        d_label = {}
+        l_evdef = []
+        labels = np.empty(len(pk.node_ids), dtype=int)
+        for idx, node in enumerate(pk.node_ids):
+            evdef = evmap.evdef(node)
+            key = self._group_key(evdef)
+            if key not in d_label:
+                d_label[key] = len(l_evdef)
+                l_evdef.append(evdef)
+            labels[idx] = d_label[key]
+
+        # prune edges that are not topologically adjacent
+        pk.add_noedge_groups(labels, self._group_noedge(l_evdef))
         return pk
 
+    def _group_noedge(self, l_evdef):
+        """Returns:
+            np.ndarray: symmetric boolean matrix, True if the groups
+                represented by the event definitions are not adjacent"""
+        n_groups = len(l_evdef)
+        group_noedge = np.zeros((n_groups, n_groups), dtype=bool)
+        for g1, g2 in combinations_with_replacement(range(n_groups), 2):
+            if not self._is_adjacent(l_evdef[g1], l_evdef[g2]):
+                group_noedge[g1, g2] = True
+                group_noedge[g2, g1] = True
+        return group_noedge
+
 
 class Topology(RuleBasedPruning):
 
     def __init__(self, topology_fp):
         super().__init__()
-        self._topology = self._load_graph(topology_fp)
+        self._topology = topology.load_topology(topology_fp)
+
+    def _group_key(self, evdef):
+        return evdef.host
 
     def _is_adjacent(self, evdef1, evdef2):
         if evdef1.host == evdef2.host:
@@ -165,33 +416,31 @@ class Topology(RuleBasedPruning):
         else:
             return False
 
+    def _group_noedge(self, l_evdef):
+        idxs = self._topology.host_indexes([evdef.host for evdef in l_evdef])
+        adjacent = self._topology.adjacent(idxs[:, np.newaxis],
+                                           idxs[np.newaxis, :])
+        np.fill_diagonal(adjacent, True)
+        return ~adjacent
+
 
 class LayeredTopology(RuleBasedPruning):
     _default_layer = "other"
 
     def __init__(self, d_topology_fp, d_rule):
         super().__init__()
-        self._topology = self._load_graphs(d_topology_fp)
+        self._topology = topology.load_layered_topology(d_topology_fp)
         self._d_rule = d_rule
 
-    @classmethod
-    def _load_graphs(cls, d_fp):
-        topo = {}
-        for name, fp in d_fp.items():
-            try:
-                topo[name] = cls._load_graph(fp)
-            except IOError:
-                msg = "failed to load {0} for layer {1}".format(name, fp)
-                _logger.warning(msg)
-                topo[name] = nx.Graph()
-        return topo
-
     def _get_layer(self, evdef):
         if evdef.group in self._d_rule:
             return self._d_rule[evdef.group]
         else:
             return self._default_layer
 
+    def _group_key(self, evdef):
+        return evdef.host, self._get_layer(evdef)
+
     def _is_adjacent(self, evdef1, evdef2):
         # same host
         if evdef1.host == evdef2.host:
@@ -203,17 +452,31 @@ class LayeredTopology(RuleBasedPruning):
         layer1 = self._get_layer(evdef1)
         layer2 = self._get_layer(evdef2)
         for layer in (layer1, layer2):
-            if layer in self._topology:
-                net = self._topology[layer]
-                if net.has_edge(evdef1.host, evdef2.host):
-                    return True
+            if self._topology.has_edge(evdef1.host, evdef2.host, layer):
+                return True
         else:
             return False
 
+    def _group_noedge(self, l_evdef):
+        idxs = self._topology.host_indexes([evdef.host for evdef in l_evdef])
+        layers = self._topology.layer_indexes([self._get_layer(evdef)
+                                               for evdef in l_evdef])
+        adjacent = self._topology.adjacent(
+            idxs[:, np.newaxis], idxs[np.newaxis, :],
+            layers[:, np.newaxis], layers[np.newaxis, :])
+        # same host (including hosts not in the topology)
+        hosts = np.empty(len(l_evdef), dtype=object)
+        hosts[:] = [evdef.host for evdef in l_evdef]
+        same_host = hosts[:, np.newaxis] == hosts[np.newaxis, :]
+        return ~(adjacent | same_host)
+
 
 class HostIndependent(RuleBasedPruning):
     # no edges between events on different devices
 
+    def _group_key(self, evdef):
+        return evdef.host
+
     def _is_adjacent(self, evdef1, evdef2):
         return evdef1.host == evdef2.host
 
@@ -226,15 +489,24 @@ class AdditionalSource(RuleBasedPruning):
         from . import log2event
         return evdef.source in (log2event.SRCCLS_SNMP, )
 
+    def _group_key(self, evdef):
+        return self._is_additional(evdef)
+
     def _is_adjacent(self, evdef1, evdef2):
         return not (self._is_additional(evdef1) and
                     self._is_additional(evdef2))
 
 
-def init_prior_knowledge(conf, evmap):
+def init_prior_knowledge(conf, evmap, args=None):
+    """Args:
+        conf: logdag config
+        evmap (log2event.EventDefinitionMap): events of the window
+        args (optional): job arguments, required for import-dag
+    """
     from amulog import config
-    l_pruner = []
     methods = config.getlist(conf, "pc_prune", "methods")
+    if len(methods) == 0:
+        return None
 
     node_ids = evmap.eids()
     pk = PriorKnowledge(node_ids)
@@ -254,10 +526,26 @@ def init_prior_knowledge(conf, evmap):
                 d_rule[group] = layer
             pk = LayeredTopology(d_fp, d_rule).update(pk, evmap)
         elif method == "independent":
-            l_pruner.append(Independent())
+            pk = HostIndependent().update(pk, evmap)
         elif method == "ext-source":
-            l_pruner.append(ExternalSource())
+            pk = AdditionalSource().update(pk, evmap)
+        elif method == "import-dag":
+            if args is None:
+                raise ValueError("import-dag requires job arguments")
+            n_windows = conf.getint("pc_prune", "import_dag_windows")
+            stable_ratio = conf.getfloat("pc_prune",
+                                         "import_dag_stable_ratio")
+            src_conf_path = conf.get("pc_prune", "import_dag_config").strip()
+            if src_conf_path:
+                src_conf = config.open_config(
+                    src_conf_path, ex_defaults=[arguments.DEFAULT_CONFIG])
+            else:
+                src_conf = None
+            pk = ImportDAG(args, n_windows, stable_ratio,
+                           src_conf).update(pk, evmap)
         else:
             raise NotImplementedError("invalid method name {0}".format(method))
 
+    return pk
+
 
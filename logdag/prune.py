@@ -1,9 +1,10 @@
 #!/usr/bin/env python
 # coding: utf-8
 
-import json
 import networkx as nx
 
+from . import topology
+
 
 class _PruneBase(object):
 
@@ -19,21 +20,9 @@ class MultiLayerTopology(_PruneBase):
 
     def __init__(self, d_topology_fp, d_rule):
         super().__init__()
-        self._topology = self._load_graph(d_topology_fp)
+        self._topology = topology.load_layered_topology(d_topology_fp)
         self._d_rule = d_rule
 
-    @staticmethod
-    def _load_graph(d_fp):
-        topo = {}
-        for name, fp in d_fp.items():
-            try:
-                with open(fp, 'r', encoding='utf-8') as f:
-                    js = json.load(f)
-                topo[name] = nx.node_link_graph(js)
-            except IOError:
-                topo[name] = nx.Graph()
-        return topo
-
     def _get_layer(self, evdef):
         if evdef.group in self._d_rule:
             return self._d_rule[evdef.group]
@@ -47,19 +36,26 @@ class MultiLayerTopology(_PruneBase):
         layer1 = self._get_layer(evdef1)
         layer2 = self._get_layer(evdef2)
         for layer in (layer1, layer2):
-            if layer in self._topology:
-                net = self._topology[layer]
-                if net.has_edge(evdef1.host, evdef2.host):
-                    return True
+            if self._topology.has_edge(evdef1.host, evdef2.host, layer):
+                return True
         else:
             return False
 
     def prune(self, g_base, evmap):
         g_ret = nx.Graph()
         g_ret.add_nodes_from(g_base.nodes())
-        for edge in g_base.edges():
-            src_evdef, dst_evdef = [evmap.evdef(node) for node in edge]
-            if self._is_adjacent(src_evdef, dst_evdef):
+        edges = list(g_base.edges())
+        l_evdef = [[evmap.evdef(node) for node in edge] for edge in edges]
+        idxs = [self._topology.host_indexes([evdefs[i].host
+                                             for evdefs in l_evdef])
+                for i in (0, 1)]
+        layers = [self._topology.layer_indexes([self._get_layer(evdefs[i])
+                                                for evdefs in l_evdef])
+                  for i in (0, 1)]
+        adjacent = self._topology.adjacent(idxs[0], idxs[1],
+                                           layers[0], layers[1])
+        for edge, evdefs, flag in zip(edges, l_evdef, adjacent):
+            if flag or evdefs[0].host == evdefs[1].host:
                 g_ret.add_edge(*edge)
         return g_ret
 
@@ -68,21 +64,19 @@ class SingleLayerTopology(_PruneBase):
 
     def __init__(self, topology_fp):
         super().__init__()
-        self._topology = self._load_graph(topology_fp)
-
-    @staticmethod
-    def _load_graph(fp):
-        with open(fp, 'r', encoding='utf-8') as f:
-            js = json.load(f)
-        return nx.node_link_graph(js)
+        self._topology = topology.load_topology(topology_fp)
 
     def prune(self, g_base, evmap):
         g_ret = nx.Graph()
         g_ret.add_nodes_from(g_base.nodes())
-        for edge in g_base.edges():
-            src_host, dst_host = [evmap.evdef(node).host for node in edge]
-            if src_host == dst_host or \
-                    self._topology.has_edge(src_host, dst_host):
+        edges = list(g_base.edges())
+        l_hosts = [[evmap.evdef(node).host for node in edge]
+                   for edge in edges]
+        idxs = [self._topology.host_indexes([hosts[i] for hosts in l_hosts])
+                for i in (0, 1)]
+        adjacent = self._topology.adjacent(idxs[0], idxs[1])
+        for edge, (src_host, dst_host), flag in zip(edges, l_hosts, adjacent):
+            if flag or src_host == dst_host:
                 g_ret.add_edge(*edge)
         return g_ret
 
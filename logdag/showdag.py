@@ -2,6 +2,7 @@
 # coding: utf-8
 
 
+import logging
 import pickle
 import networkx as nx
 from collections import defaultdict
@@ -11,6 +12,7 @@ from . import arguments
 from . import log2event
 
 KEY_WEIGHT = "weight"
+_logger = logging.getLogger(__package__)
 
 # fmt_int = lambda x: "{:,d}".format(x)
 # fmt_ratio = lambda x: "{:.1f}".format(x)
@@ -19,16 +21,42 @@ KEY_WEIGHT = "weight"
 
 class LogDAG:
 
-    def __init__(self, args, graph=None):
+    def __init__(self, args, graph=None, evmap=None):
         self.args = args
         self.conf, self.dt_range, self.area = self.args
         self.name = arguments.args2name(self.args)
+        self._arrays = None
         self.graph = graph
 
-        # cache
-        self._evmap_obj = None
+        # cache (evmap is loaded from the job directory if not given)
+        self._evmap_obj = evmap
         self._d_el = None
 
+    @property
+    def graph(self):
+        # DAGs loaded in npz format are materialized on demand
+        if self._graph is None and self._arrays is not None:
+            self._graph = self._arrays.to_graph()
+        return self._graph
+
+    @graph.setter
+    def graph(self, graph):
+        self._graph = graph
+        self._arrays = None
+
+    def _lazy(self, graph):
+        """True if the arrays can be used instead of the graph."""
+        return graph is None and self._graph is None and \
+            self._arrays is not None
+
+    def edge_array(self):
+        """Returns edges of the DiGraph as arrays (src, dst, directed),
+        where directed is False for the edges with reversed edges.
+        The graph is not materialized for npz format."""
+        if self._arrays is None:
+            return DAGArrays.from_graph(self.graph).edge_array()
+        return self._arrays.edge_array()
+
     @classmethod
     def dag_path(cls, args):
         conf = args[0]
@@ -60,6 +88,11 @@ class LogDAG:
             with open(fp, 'w', encoding='utf-8') as f:
                 obj = nx.node_link_data(self.graph)
                 json.dump(obj, f)
+        elif dag_format == "npz":
+            if self._lazy(None):
+                self._arrays.dump(fp)
+            else:
+                DAGArrays.from_graph(self.graph).dump(fp)
 
     def load(self):
         dag_format = self.conf["dag"]["output_dag_format"]
@@ -74,6 +107,9 @@ class LogDAG:
                 with open(fp, 'r', encoding='utf-8') as f:
                     obj = json.load(f)
                     self.graph = nx.node_link_graph(obj, directed=True)
+            elif dag_format == "npz":
+                self.graph = None
+                self._arrays = DAGArrays.load(fp)
         except:
             # compatibility
             fp = arguments.ArgumentManager.dag_path_old(self.args)
@@ -81,11 +117,15 @@ class LogDAG:
                 self.graph = pickle.load(f)
 
     def number_of_nodes(self, graph=None):
+        if self._lazy(graph):
+            return self._arrays.number_of_nodes()
         if graph is None:
             graph = self.graph
         return graph.number_of_nodes()
 
     def number_of_edges(self, graph=None):
+        if self._lazy(graph):
+            return self._arrays.number_of_edges()
         if graph is None:
             graph = self.graph
         # temp_graph = nx.Graph(graph)
@@ -182,6 +222,8 @@ class LogDAG:
         return g_same, g_diff
 
     def connected_subgraphs(self, graph=None):
+        if self._lazy(graph):
+            return self._arrays.connected_components()
         if graph is None:
             graph = self.graph
         temp_graph = graph.to_undirected()
@@ -311,6 +353,162 @@ class LogDAG:
         return output
 
 
+class DAGArrays:
+    """DAG stored in arrays (dag.output_dag_format = npz).
+
+    The arrays are the node ids, the edges of the DiGraph
+    (src, dst, and directed flag: False if the reversed edge exists),
+    and the columns of edge attributes (e.g., weight, label).
+    Graph attributes and node attributes are stored in json.
+    """
+
+    # kinds of edge attribute columns
+    _KIND_FLOAT = "float"
+    _KIND_STR = "str"
+    _KIND_JSON = "json"
+
+    def __init__(self, nodes, src, dst, directed,
+                 edge_attrs=None, node_attrs=None, graph_attrs=None):
+        self.nodes = nodes
+        self.src = src
+        self.dst = dst
+        self.directed = directed
+        # key: attribute name, val: (kind, values, mask)
+        self.edge_attrs = edge_attrs or {}
+        self.node_attrs = node_attrs or {}
+        self.graph_attrs = graph_attrs or {}
+
+    @staticmethod
+    def _json_default(obj):
+        import numpy as np
+        if isinstance(obj, np.generic):
+            return obj.item()
+        elif isinstance(obj, (np.ndarray, set, tuple)):
+            return list(obj)
+        raise TypeError("{0} is not serializable".format(type(obj)))
+
+    @classmethod
+    def _edge_column(cls, values, mask):
+        import numpy as np
+        import numbers
+        l_val = [v for v, m in zip(values, mask) if m]
+        if all(isinstance(v, numbers.Real) and not isinstance(v, bool)
+               for v in l_val):
+            return cls._KIND_FLOAT, np.array(
+                [v if m else np.nan for v, m in zip(values, mask)],
+                dtype=float)
+        elif all(isinstance(v, str) for v in l_val):
+            return cls._KIND_STR, np.array(
+                [v if m else "" for v, m in zip(values, mask)], dtype=str)
+        else:
+            import json
+            return cls._KIND_JSON, np.array(
+                [json.dumps(v, default=cls._json_default) if m else ""
+                 for v, m in zip(values, mask)], dtype=str)
+
+    @classmethod
+    def from_graph(cls, graph):
+        import numpy as np
+        nodes = np.array(list(graph.nodes()))
+        if len(nodes) == 0:
+            nodes = nodes.astype(np.int64)
+        elif not np.issubdtype(nodes.dtype, np.integer):
+            raise TypeError("npz DAG format requires integer node ids")
+        edges = list(graph.edges(data=True))
+        src = np.array([u for u, v, d in edges], dtype=nodes.dtype)
+        dst = np.array([v for u, v, d in edges], dtype=nodes.dtype)
+        directed = np.array([not graph.has_edge(v, u)
+                             for u, v, d in edges], dtype=bool)
+
+        edge_attrs = {}
+        for name in sorted({name for _, _, d in edges for name in d}):
+            mask = np.array([name in d for _, _, d in edges], dtype=bool)
+            values = [d.get(name) for _, _, d in edges]
+            kind, values = cls._edge_column(values, mask)
+            edge_attrs[name] = (kind, values, mask)
+        node_attrs = {node: dict(d) for node, d in graph.nodes(data=True)
+                      if len(d) > 0}
+        return cls(nodes, src, dst, directed, edge_attrs=edge_attrs,
+                   node_attrs=node_attrs, graph_attrs=dict(graph.graph))
+
+    def to_graph(self):
+        import json
+        graph = nx.DiGraph()
+        graph.add_nodes_from(self.nodes.tolist())
+        for node, d in self.node_attrs.items():
+            graph.nodes[node].update(d)
+        l_attrs = [{} for _ in range(len(self.src))]
+        for name, (kind, values, mask) in self.edge_attrs.items():
+            for d, value, m in zip(l_attrs, values.tolist(), mask.tolist()):
+                if m:
+                    if kind == self._KIND_JSON:
+                        value = json.loads(value)
+                    d[name] = value
+        graph.add_edges_from(zip(self.src.tolist(), self.dst.tolist(),
+                                 l_attrs))
+        graph.graph.update(self.graph_attrs)
+        return graph
+
+    def edge_array(self):
+        return self.src, self.dst, self.directed
+
+    def number_of_nodes(self):
+        return len(self.nodes)
+
+    def number_of_edges(self):
+        """Number of edges of the undirected graph."""
+        loops = self.src == self.dst
+        return int(self.directed.sum() +
+                   (~self.directed & ~loops).sum() // 2 +
+                   (~self.directed & loops).sum())
+
+    def connected_components(self):
+        """Node sets of the connected components (undirected)."""
+        import numpy as np
+        from scipy.sparse import coo_matrix
+        from scipy.sparse.csgraph import connected_components
+        n_nodes = len(self.nodes)
+        order = np.argsort(self.nodes)
+        src = order[np.searchsorted(self.nodes, self.src, sorter=order)]
+        dst = order[np.searchsorted(self.nodes, self.dst, sorter=order)]
+        adj = coo_matrix((np.ones(len(src)), (src, dst)),
+                         shape=(n_nodes, n_nodes))
+        n_comp, labels = connected_components(adj, directed=False)
+        for comp in range(n_comp):
+            yield set(self.nodes[labels == comp].tolist())
+
+    def dump(self, fp):
+        import json
+        import numpy as np
+        meta = {"graph": self.graph_attrs,
+                "nodes": [[node, d] for node, d in self.node_attrs.items()],
+                "edge_attrs": {name: kind for name, (kind, _, _)
+                               in self.edge_attrs.items()}}
+        d_array = {"nodes": self.nodes, "src": self.src, "dst": self.dst,
+                   "directed": self.directed,
+                   "meta": np.array(json.dumps(
+                       meta, default=self._json_default))}
+        for name, (kind, values, mask) in self.edge_attrs.items():
+            d_array["edge_" + name] = values
+            d_array["edgemask_" + name] = mask
+        with open(fp, "wb") as f:
+            np.savez(f, **d_array)
+
+    @classmethod
+    def load(cls, fp):
+        import json
+        import numpy as np
+        with np.load(fp) as npz:
+            meta = json.loads(str(npz["meta"]))
+            edge_attrs = {name: (kind, npz["edge_" + name],
+                                 npz["edgemask_" + name])
+                          for name, kind in meta["edge_attrs"].items()}
+            return cls(npz["nodes"], npz["src"], npz["dst"], npz["directed"],
+                       edge_attrs=edge_attrs,
+                       node_attrs={node: d for node, d in meta["nodes"]},
+                       graph_attrs=meta["graph"])
+
+
 # common functions
 
 def empty_dag():
@@ -447,6 +645,30 @@ def stat_by_threshold(conf, thresholds, dt_range=None, groupby=None):
     return np.sum(data, axis=0)
 
 
+def _apply_by_pvalue(ldag, **kwargs):
+    from . import pc_skeleton
+    record = pc_skeleton.SkeletonRecord.load(ldag.args)
+    if record is None:
+        _logger.warning("no skeleton record of job({0})".format(ldag.name))
+        return ldag.number_of_edges()
+    return record.number_of_edges(kwargs["th"])
+
+
+def stat_by_pvalue(conf, thresholds, dt_range=None, groupby=None):
+    """Sum of skeleton edges of PC results for thresholds of p-values,
+    derived from skeleton records (see pc_skeleton.SkeletonRecord)."""
+    import numpy as np
+    l_func = []
+    l_kwargs = []
+    for th in thresholds:
+        l_func.append(_apply_by_pvalue)
+        l_kwargs.append({"th": th})
+    data = [v for _, _, v
+            in stat_groupby(conf, l_func, l_kwargs=l_kwargs,
+                            dt_range=dt_range, groupby=groupby)]
+    return np.sum(data, axis=0)
+
+
 # def list_results(conf, src_dir=None):
 #    table = [["datetime", "area", "nodes", "edges", "name"], ]
 #    for r in iter_results(conf, src_dir):
@@ -7,7 +7,7 @@ FUNCTIONS = ["no_isolated", "to_undirected",
              "directed", "undirected",
              "across_host", "within_host",
              "subgraph_with_log", "subgraph_with_snmp",
-             "ate_prune"]
+             "ate_prune", "median_ate_prune", "probability_prune"]
 
 
 # def apply(ldag, l_filtername, th=None):
@@ -125,7 +125,7 @@ def subgraph_with_snmp(graph, ldag=None, **_):
     return ret
 
 
-def ate_prune(graph, th=None, **_):
+def ate_prune(graph, th=None, attr="weight", **_):
     """Prune edges with smaller ATE (average treatment effect).
     Effective if DAG estimation algorithm is LiNGAM."""
 
@@ -134,7 +134,7 @@ def ate_prune(graph, th=None, **_):
         raise ValueError("threshold not given")
     ret = graph.copy()
     try:
-        edge_label = {(u, v): d["weight"]
+        edge_label = {(u, v): d[attr]
                       for (u, v, d) in graph.edges(data=True)}
         for (src, dst), val in edge_label.items():
             if np.abs(val) < th:
@@ -142,3 +142,15 @@ def ate_prune(graph, th=None, **_):
         return ret
     except KeyError:
         return nx.create_empty_copy(graph)
+
+
+def median_ate_prune(graph, th=None, **kwargs):
+    """Prune edges with smaller median ATE in the bootstrap.
+    Effective if LiNGAM with lingam.bootstrap."""
+    return ate_prune(graph, th=th, attr="bootstrap_median", **kwargs)
+
+
+def probability_prune(graph, th=None, **kwargs):
+    """Prune edges found in smaller ratio of the bootstrap resamplings.
+    Effective if LiNGAM with lingam.bootstrap."""
+    return ate_prune(graph, th=th, attr="bootstrap_probability", **kwargs)
@@ -15,13 +15,13 @@ FEATURE_MEASUREMENT = "log_feature"
 
 
 class LogEventDefinition(log2event.EventDefinition):
-
+    __slots__ = ("gid",)
     _l_attr_log = ["gid", ]
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         for attr in self._l_attr_log:
-            setattr(self, attr, kwargs[attr])
+            object.__setattr__(self, attr, kwargs[attr])
 
     def __str__(self):
         # bug of string None: TODO to find the reason
@@ -20,13 +20,14 @@ VSOURCE_KEY = "all"
 
 
 class SNMPEventDefinition(log2event.EventDefinition):
+    __slots__ = ("measure", "direction", "mod_cls", "mod_id")
     _l_attr_key = ["mod_cls", "mod_id", ]
     _l_attr_snmp = ["measure", "direction", ] + _l_attr_key
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         for attr in self._l_attr_snmp:
-            setattr(self, attr, kwargs[attr])
+            object.__setattr__(self, attr, kwargs[attr])
 
     def __str__(self):
         return "{0}, {1}@{2}({3})".format(self.host, self.measure,
@@ -59,6 +60,7 @@ class SNMPEventDefinition(log2event.EventDefinition):
 
 
 class SNMPVirtualEventDefinition(SNMPEventDefinition):
+    __slots__ = ()
 
     def __str__(self):
         return "{0}, {1}({2})".format(self.host, self.measure,
@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Parameter sweep of DAG estimation.
+
+Every variant of the parameter grid is written to its own output tree
+(<dag.output_dir>/<variant name>). Per window, event time-series are
+loaded once in the finest ci_bin_size of the grid, and the other bin sizes
+are derived by aggregation (if ci_bin_method is sequential, and
+the aggregated bins are same as those of the database; otherwise
+they are loaded from the database as make-dag does).
+The results of CI tests (including depth-0 tests) are shared among
+the variants on the same input data (e.g., different skeleton_threshold).
+"""
+
+import copy
+import logging
+import os
+import re
+from collections import defaultdict
+from itertools import product
+
+import pandas as pd
+
+from . import arguments
+from . import dtutil
+from . import log2event
+from amulog import common
+from amulog import config
+
+_logger = logging.getLogger(__package__)
+
+# options that change the windows, which must be common in the grid
+WINDOW_OPTIONS = ["whole_term", "unit_term", "unit_diff", "area"]
+
+
+def parse_grid(l_grid_str):
+    """Parse parameter grid given as strings like
+    "dag.ci_bin_size=1m,5m" (section is dag if omitted).
+
+    Returns:
+        list of (section, option, list of values)
+    """
+    grid = []
+    for grid_str in l_grid_str:
+        key, _, values = grid_str.partition("=")
+        if "." in key:
+            section, option = key.strip().split(".", 1)
+        else:
+            section, option = "dag", key.strip()
+        l_value = [v.strip() for v in values.split(",") if v.strip() != ""]
+        if len(l_value) == 0:
+            raise ValueError("no value given for {0}".format(key))
+        if section == "dag" and option in WINDOW_OPTIONS:
+            raise ValueError("{0} cannot be swept".format(option))
+        grid.append((section, option, l_value))
+    return grid
+
+
+def variant_name(variant):
+    name = "_".join("{0}-{1}".format(option, value)
+                    for _, option, value in variant)
+    return re.sub(r"[^0-9a-zA-Z_.-]", "", name)
+
+
+def init_variants(conf, grid):
+    """Returns:
+        list of (variant name, conf)"""
+    output_dir = conf.get("dag", "output_dir")
+    l_key = [(section, option) for section, option, _ in grid]
+    ret = []
+    for values in product(*[l_value for _, _, l_value in grid]):
+        variant = [key + (value,) for key, value in zip(l_key, values)]
+        name = variant_name(variant)
+        new_conf = copy.deepcopy(conf)
+        for section, option, value in variant:
+            new_conf[section][option] = value
+        new_conf["dag"]["output_dir"] = "/".join((output_dir, name))
+        ret.append((name, new_conf))
+    return ret
+
+
+def _data_key(conf, grid):
+    """Variants with same key share the loaded events and CI p-values.
+    The key includes the input options (except ci_bin_size, see
+    _load_events) and all swept options of the other sections
+    (e.g., filter.rules)."""
+    input_key = log2event._input_key(conf, False, exclude=["ci_bin_size"])
+    grid_key = tuple(conf.get(section, option)
+                     for section, option, _ in grid if section != "dag")
+    return input_key, grid_key
+
+
+def _convert_events(evlist, org_binsize, new_binsize, dt_range):
+    dtindex = pd.to_datetime(dtutil.range_dt(dt_range[0], dt_range[1],
+                                             new_binsize))
+    new_evlist = []
+    for df in evlist:
+        data = dtutil.convert_binsize(df.values, org_binsize, new_binsize)
+        new_evlist.append(pd.DataFrame(data, index=dtindex,
+                                       columns=df.columns))
+    return new_evlist
+
+
+def _aggregatable(conf, dt_range, org_binsize, new_binsize):
+    """Test whether the bins of new_binsize aggregated from org_binsize
+    are same as the bins of new_binsize given by the database.
+    The bins of sql are aligned to the window start, and those of
+    influx (GROUP BY time()) are aligned to the epoch."""
+    if new_binsize % org_binsize != dtutil.empty_timedelta():
+        return False
+    if conf.get("general", "evdb") == "influx":
+        sec = new_binsize.total_seconds()
+        return all(dt.timestamp() % sec == 0 for dt in dt_range)
+    return True
+
+
+def _load_events(l_args):
+    """Load events for variants with common data options.
+
+    Returns:
+        dict: key: ci_bin_size, val: (evlist, evmap)
+    """
+    dt_range, area = l_args[0][1:]
+    d_binsize = defaultdict(list)
+    for args in l_args:
+        binsize = config.getdur(args[0], "dag", "ci_bin_size")
+        d_binsize[binsize].append(args)
+
+    d_events = {}
+    if l_args[0][0].get("dag", "ci_bin_method") == "sequential":
+        base_binsize = min(d_binsize.keys())
+        base_conf = d_binsize[base_binsize][0][0]
+        base_events = log2event.load_input_events(base_conf, dt_range,
+                                                  area, False)
+        d_events[base_binsize] = base_events
+        for binsize, l_args_bin in d_binsize.items():
+            if binsize in d_events:
+                continue
+            if _aggregatable(base_conf, dt_range, base_binsize, binsize):
+                evlist, evmap = base_events
+                evlist = _convert_events(evlist, base_binsize,
+                                         binsize, dt_range)
+                d_events[binsize] = (evlist, evmap)
+            else:
+                d_events[binsize] = log2event.load_input_events(
+                    l_args_bin[0][0], dt_range, area, False)
+    else:
+        for binsize, l_args_bin in d_binsize.items():
+            d_events[binsize] = log2event.load_input_events(
+                l_args_bin[0][0], dt_range, area, False)
+    return d_events
+
+
+def sweep_window(l_args, grid):
+    """Estimate DAGs of all variants for one window.
+
+    Args:
+        l_args (list): args of each variant with common window
+        grid (list): parameter grid given by parse_grid
+    """
+    from . import makedag
+    from . import showdag
+    from . import pc_skeleton
+
+    jobname = arguments.args2name(l_args[0])
+    timer = common.Timer("makedag sweep job({0})".format(jobname),
+                         output=_logger)
+    timer.start()
+
+    l_args_todo = []
+    for args in l_args:
+        if args[0].getboolean("dag", "pass_dag_exists"):
+            if os.path.exists(showdag.LogDAG.dag_path(args)):
+                continue
+        l_args_todo.append(args)
+
+    d_group = defaultdict(list)
+    for args in l_args_todo:
+        d_group[_data_key(args[0], grid)].append(args)
+
+    for key, l_args_group in d_group.items():
+        d_events = _load_events(l_args_group)
+        timer.lap("load-nodes")
+        d_cache = {}
+        for args in l_args_group:
+            conf = args[0]
+            binsize = config.getdur(conf, "dag", "ci_bin_size")
+            evlist, evmap = d_events[binsize]
+            # build_input can overwrite columns of given DataFrames
+            evlist = [df.copy(deep=False) for df in evlist]
+            input_df, evmap = log2event.build_input(conf, evlist, evmap)
+            if input_df is None:
+                continue
+            # p-values depend on the rare event policy
+            cache_key = (binsize, conf.get("dag", "ci_func"),
+                         conf.get("dag", "ci_rare_policy"),
+                         conf.get("dag", "ci_rare_min_count"))
+            if cache_key not in d_cache:
+                d_cache[cache_key] = pc_skeleton.CITestCache()
+            makedag.makedag_input(args, input_df, evmap, timer,
+                                  do_dump=True, ci_cache=d_cache[cache_key])
+        for (binsize, ci_func, _, _), ci_cache in d_cache.items():
+            _logger.info("job({0}) CI cache for {1} {2}: "
+                         "{3} hit, {4} miss".format(
+                             jobname, config.dur2str(binsize), ci_func,
+                             ci_cache.n_hit, ci_cache.n_miss))
+    timer.stop()
+
+
+def sweep_args(l_variant):
+    """Returns:
+        list of list of args: args of all variants for each window"""
+    l_am = []
+    for _, conf in l_variant:
+        # base output_dir of the variants
+        common.mkdir(os.path.dirname(conf.get("dag", "output_dir")))
+        am = arguments.ArgumentManager(conf)
+        am.generate(arguments.all_args)
+        am.init_dirs(conf)
+        am.dump()
+        l_am.append(am)
+    return [list(l_args) for l_args in zip(*l_am)]
@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Network topology files for pruning (prior knowledge).
+
+The topology files (networkx graphs in node-link json format) are
+loaded once per process and cached with their modification time.
+Each set of files is indexed into TopologyIndex: host indexes and
+sparse adjacency matrices of the hosts for each layer,
+with the adjacency in any layer precomputed.
+"""
+
+import json
+import logging
+import os
+
+import numpy as np
+import networkx as nx
+from scipy import sparse
+
+_logger = logging.getLogger(__package__)
+
+DEFAULT_LAYER = "default"
+
+# key: tuple of (layer name, absolute path, mtime), val: TopologyIndex
+_cache = {}
+
+
+class TopologyIndex:
+    """Adjacency of hosts in topology layers.
+
+    Hosts are indexed in common among the layers;
+    hosts not in any layer have index -1 (adjacent to nothing
+    except the same host).
+    """
+
+    def __init__(self, d_graph):
+        self.layers = sorted(d_graph.keys())
+        self._layer_index = {layer: idx
+                             for idx, layer in enumerate(self.layers)}
+        hosts = set()
+        for graph in d_graph.values():
+            hosts |= set(graph.nodes())
+        self.hosts = sorted(hosts, key=str)
+        self._host_index = {host: idx for idx, host in enumerate(self.hosts)}
+
+        n_hosts = len(self.hosts)
+        self._adj = []
+        any_layer = sparse.csr_matrix((n_hosts, n_hosts), dtype=bool)
+        for layer in self.layers:
+            edges = np.array([(self._host_index[u], self._host_index[v])
+                              for u, v in d_graph[layer].edges()],
+                             dtype=int).reshape(-1, 2)
+            rows = np.concatenate((edges[:, 0], edges[:, 1]))
+            cols = np.concatenate((edges[:, 1], edges[:, 0]))
+            adj = sparse.csr_matrix((np.ones(len(rows), dtype=bool),
+                                     (rows, cols)),
+                                    shape=(n_hosts, n_hosts), dtype=bool)
+            self._adj.append(adj)
+            any_layer = any_layer + adj
+        self._any_layer = any_layer.tocsr()
+
+    def host_indexes(self, hosts):
+        return np.array([self._host_index.get(host, -1) for host in hosts],
+                        dtype=int)
+
+    def layer_indexes(self, layers):
+        return np.array([self._layer_index.get(layer, -1)
+                         for layer in layers], dtype=int)
+
+    def has_edge(self, host1, host2, layer=None):
+        """Adjacency in the layer (any layer if None)."""
+        idx1, idx2 = self.host_indexes([host1, host2])
+        if idx1 < 0 or idx2 < 0:
+            return False
+        if layer is None:
+            return bool(self._any_layer[idx1, idx2])
+        elif layer in self._layer_index:
+            return bool(self._adj[self._layer_index[layer]][idx1, idx2])
+        else:
+            return False
+
+    def _lookup(self, adj, idxs1, idxs2):
+        ret = np.zeros(len(idxs1), dtype=bool)
+        known = (idxs1 >= 0) & (idxs2 >= 0)
+        if np.any(known):
+            ret[known] = np.asarray(
+                adj[idxs1[known], idxs2[known]]).ravel()
+        return ret
+
+    def adjacent(self, idxs1, idxs2, layers1=None, layers2=None):
+        """Vectorized adjacency of pairs of host indexes.
+
+        A pair is adjacent if the hosts are same, or if the hosts are
+        adjacent in the layer of either end (layer indexes layers1 and
+        layers2; any layer if None).
+
+        Returns:
+            np.ndarray: boolean array in the broadcast shape of the inputs
+        """
+        if layers1 is None:
+            idxs1, idxs2 = np.broadcast_arrays(idxs1, idxs2)
+        else:
+            idxs1, idxs2, layers1, layers2 = np.broadcast_arrays(
+                idxs1, idxs2, layers1, layers2)
+        shape = idxs1.shape
+        idxs1 = idxs1.astype(int).ravel()
+        idxs2 = idxs2.astype(int).ravel()
+        ret = (idxs1 == idxs2) & (idxs1 >= 0)
+        if layers1 is None:
+            ret |= self._lookup(self._any_layer, idxs1, idxs2)
+        else:
+            for l_layer in (layers1.ravel(), layers2.ravel()):
+                for layer_idx, adj in enumerate(self._adj):
+                    mask = l_layer == layer_idx
+                    ret[mask] |= self._lookup(adj, idxs1[mask], idxs2[mask])
+        return ret.reshape(shape)
+
+    def neighborhood(self, idxs, hops):
+        """Boolean mask of hosts within hops from any of idxs
+        (adjacency in any layer)."""
+        mask = np.zeros(len(self.hosts), dtype=bool)
+        mask[idxs] = True
+        adj = self._any_layer.astype(np.int32)
+        for _ in range(hops):
+            mask |= adj.dot(mask.astype(np.int32)) > 0
+        return mask
+
+    def khop_partitions(self, hops=1):
+        """Cover the hosts with overlapping k-hop neighborhoods.
+
+        Centers are selected greedily in descending order of degree
+        from the hosts not covered yet, and a center covers the hosts
+        within hops - 1. Each partition is the hosts within hops
+        from its center, so that every pair of adjacent hosts is
+        included in the partition of the center covering either host.
+
+        Returns:
+            list of np.ndarray: host indexes of each partition
+        """
+        if hops < 1:
+            raise ValueError("hops must be positive")
+        n_hosts = len(self.hosts)
+        degree = np.asarray(self._any_layer.sum(axis=1)).ravel()
+        uncovered = np.ones(n_hosts, dtype=bool)
+        partitions = []
+        for center in np.lexsort((np.arange(n_hosts), -degree)):
+            if not uncovered[center]:
+                continue
+            uncovered &= ~self.neighborhood([center], hops - 1)
+            partitions.append(
+                np.flatnonzero(self.neighborhood([center], hops)))
+        return partitions
+
+
+def _load_graph(fp):
+    with open(fp, 'r', encoding='utf-8') as f:
+        js = json.load(f)
+    return nx.node_link_graph(js)
+
+
+def _file_key(name, fp):
+    try:
+        mtime = os.path.getmtime(fp)
+    except OSError:
+        mtime = None
+    return name, os.path.abspath(fp), mtime
+
+
+def _store(key, topology):
+    # remove the entries of the same files with old mtime
+    files = [(name, path) for name, path, _ in key]
+    for old_key in list(_cache.keys()):
+        if [(name, path) for name, path, _ in old_key] == files:
+            del _cache[old_key]
+    _cache[key] = topology
+    return topology
+
+
+def load_topology(fp):
+    """Load one topology file as a layer named DEFAULT_LAYER.
+    The file must exist (IOError is raised)."""
+    key = (_file_key(DEFAULT_LAYER, fp),)
+    if key not in _cache:
+        _store(key, TopologyIndex({DEFAULT_LAYER: _load_graph(fp)}))
+    return _cache[key]
+
+
+def load_layered_topology(d_fp):
+    """Load topology files of layers (key: layer name, val: file path).
+    Missing files are loaded as empty layers with a warning."""
+    key = tuple(sorted(_file_key(name, fp) for name, fp in d_fp.items()))
+    if key not in _cache:
+        d_graph = {}
+        for name, fp in d_fp.items():
+            try:
+                d_graph[name] = _load_graph(fp)
+            except IOError:
+                msg = "failed to load {0} for layer {1}".format(fp, name)
+                _logger.warning(msg)
+                d_graph[name] = nx.Graph()
+        _store(key, TopologyIndex(d_graph))
+    return _cache[key]
+
+
+def init_topology(conf):
+    """Topology given in pc_prune section: multi_network_file
+    if multi-topology is used, otherwise single_network_file."""
+    from amulog import config
+    methods = config.getlist(conf, "pc_prune", "methods")
+    if "multi-topology" in methods:
+        d_fp = {}
+        files = config.getlist(conf, "pc_prune", "multi_network_file")
+        for group, fp in [s.split(":") for s in files]:
+            d_fp[group] = fp
+        return load_layered_topology(d_fp)
+    else:
+        fp = conf.get("pc_prune", "single_network_file")
+        return load_topology(fp)
+
+
+def clear_cache():
+    _cache.clear()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import unittest
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+
+def _test_data(seed=0, n_samples=300, n_nodes=6):
+    # count time-series with linear dependencies
+    rs = np.random.RandomState(seed)
+    data = np.zeros((n_samples, n_nodes))
+    data[:, 0] = rs.poisson(1, n_samples)
+    for i in range(1, n_nodes):
+        data[:, i] = rs.poisson(0.5, n_samples)
+        if i % 3 != 0:
+            data[:, i] += rs.uniform(-2, 2) * data[:, i - 1]
+    return pd.DataFrame(data, columns=[10 + i for i in range(n_nodes)])
+
+
+def _pairwise_direct_lingam(data, lower_limit, prior_knowledge=None):
+    # fit DirectLiNGAM for every pair (previous implementation)
+    import lingam
+    edges = {}
+    for i, j in combinations(data.columns, 2):
+        kwargs = {}
+        if prior_knowledge is not None:
+            kwargs["prior_knowledge"] = \
+                prior_knowledge.lingam_prior_knowledge(node_ids=[i, j])
+        model = lingam.DirectLiNGAM(**kwargs)
+        model.fit(data[[i, j]])
+        adj = np.nan_to_num(model.adjacency_matrix_)
+        for to_idx, from_idx in zip(*np.where(np.abs(adj) > lower_limit)):
+            edges[((i, j)[from_idx], (i, j)[to_idx])] = \
+                adj[to_idx, from_idx]
+    return edges
+
+
+def _positive_or_none(value):
+    return value if value > 0 else None
+
+
+class TestPairwiseLiNGAM(unittest.TestCase):
+
+    def test_same_as_direct_lingam(self):
+        from logdag import lingam_input
+        from logdag import pknowledge
+
+        for seed in range(5):
+            data = _test_data(seed)
+            pk = pknowledge.PriorKnowledge(list(data.columns))
+            pk.add_path_rule((11, 10))
+            pk.add_noedge_rule((13, 14))
+            for prior_knowledge in (None, pk):
+                edges = _pairwise_direct_lingam(data, 0.01, prior_knowledge)
+                g = lingam_input.estimate_corr(
+                    data, algorithm="direct", lower_limit=0.01,
+                    prior_knowledge=prior_knowledge)
+                assert set(g.edges()) == set(edges.keys())
+                for edge, coef in edges.items():
+                    assert np.isclose(g.edges[edge]["weight"], coef)
+
+
+class TestICALiNGAM(unittest.TestCase):
+
+    def test_restart_same_as_ica_lingam(self):
+        import lingam
+        from logdag import lingam_input
+
+        rs = np.random.RandomState(0)
+        data = rs.exponential(1, (2000, 3))
+        data[:, 1] += 0.8 * data[:, 0]
+        data[:, 2] += -0.5 * data[:, 1]
+        np.random.seed(1)
+        model, l_result = lingam_input.fit_ica_lingam(data, n_restarts=1)
+        assert l_result[0][1] < 1000
+        np.random.seed(1)
+        seed = np.random.randint(np.iinfo(np.int32).max, size=1)[0]
+        model_org = lingam.ICALiNGAM(random_state=seed).fit(data)
+        assert np.allclose(model.adjacency_matrix_,
+                           model_org.adjacency_matrix_)
+
+    def test_restart_first_parallel(self):
+        from logdag import lingam_input
+        from logdag import parallel
+
+        l_args = [(-1,), (0,), (2,), (-3,), (4,)]
+        for processes in (1, 2):
+            # ordered, and stopped at the first result
+            assert parallel.pool_first(_positive_or_none, l_args,
+                                       processes) == [None, None, 2]
+            assert parallel.pool_first(_positive_or_none, l_args[:2],
+                                       processes) == [None, None]
+
+        rs = np.random.RandomState(0)
+        data = rs.exponential(1, (2000, 3))
+        data[:, 1] += 0.8 * data[:, 0]
+        l_adj = []
+        for processes in (1, 2):
+            np.random.seed(1)
+            model, l_result = lingam_input.fit_ica_lingam(
+                data, n_restarts=3, processes=processes)
+            assert len(l_result) == 1
+            l_adj.append(model.adjacency_matrix_)
+        assert np.allclose(l_adj[0], l_adj[1])
+        assert lingam_input._ica_data is None
+        assert len(parallel.SharedMatrix._owned) == 0
+
+
+class TestBootstrap(unittest.TestCase):
+
+    def test_bootstrap(self):
+        from logdag import lingam_input
+        from logdag import showdag_filter
+
+        data = _test_data(seed=0, n_samples=500, n_nodes=4)
+        l_graph = []
+        for processes in (1, 2):
+            np.random.seed(0)
+            g = lingam_input.estimate(data, algorithm="direct",
+                                      processes=processes, n_bootstrap=8)
+            assert g.graph["bootstrap"] == 8
+            for _, _, attrs in g.edges(data=True):
+                assert 0 <= attrs["bootstrap_probability"] <= 1
+            l_graph.append(g)
+        assert list(l_graph[0].edges(data=True)) == \
+            list(l_graph[1].edges(data=True))
+
+        g = showdag_filter.probability_prune(l_graph[0], th=1.)
+        assert all(attrs["bootstrap_probability"] == 1.
+                   for _, _, attrs in g.edges(data=True))
+
+
+class TestComponentLiNGAM(unittest.TestCase):
+
+    def test_components(self):
+        from amulog import config
+        from logdag import arguments
+        from logdag import lingam_input
+        from logdag import makedag
+        from logdag import pknowledge
+
+        data = pd.concat([_test_data(seed=1, n_nodes=4),
+                          _test_data(seed=2, n_nodes=4)], axis=1)
+        data.columns = list(range(8))
+        pk = pknowledge.PriorKnowledge(list(data.columns))
+        for i in range(4):
+            for j in range(4, 8):
+                pk.add_noedge_rule((i, j))
+
+        conf = config.open_config(arguments.DEFAULT_CONFIG,
+                                  base_default=False)
+        conf["dag"]["cause_algorithm"] = "lingam"
+        conf["dag"]["decompose_components"] = "true"
+        conf["lingam"]["algorithm"] = "direct"
+        g = makedag.estimate_dag(conf, data, "gsq", pk)
+
+        edges = set()
+        for nodes in (list(range(4)), list(range(4, 8))):
+            sub_g = lingam_input.estimate(data[nodes], algorithm="direct",
+                                          prior_knowledge=pk.subset(nodes))
+            edges |= set(sub_g.edges())
+        assert set(g.nodes()) == set(data.columns)
+        assert set(g.edges()) == edges
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -139,3 +139,190 @@ class TestLoader(unittest.TestCase):
             edge_cnt += ldag.number_of_edges()
         assert edge_cnt > 0
 
+
+
+class TestSweep(unittest.TestCase):
+
+    def test_data_key(self):
+        import datetime
+        from logdag import sweep
+
+        conf = config.open_config(arguments.DEFAULT_CONFIG,
+                                  base_default=False)
+        grid = sweep.parse_grid(["ci_bin_size=1m,5m",
+                                 "skeleton_threshold=0.01,0.001",
+                                 "filter.rules=sizetest,remove_linear"])
+        l_key = {sweep._data_key(variant_conf, grid)
+                 for _, variant_conf in sweep.init_variants(conf, grid)}
+        # shared among bin sizes and thresholds, not among filter rules
+        assert len(l_key) == 2
+
+        dt_range = (datetime.datetime(2112, 9, 1, 0, 3),
+                    datetime.datetime(2112, 9, 2, 0, 3))
+        binsize = config.str2dur("1m")
+        conf["general"]["evdb"] = "sql"
+        assert sweep._aggregatable(conf, dt_range, binsize,
+                                   config.str2dur("3m"))
+        assert not sweep._aggregatable(conf, dt_range, binsize,
+                                       config.str2dur("90s"))
+        # influx bins are aligned to the epoch
+        conf["general"]["evdb"] = "influx"
+        assert not sweep._aggregatable(conf, dt_range, binsize,
+                                       config.str2dur("1h"))
+
+
+class TestInputCache(unittest.TestCase):
+
+    def test_input_cache(self):
+        import datetime
+        import pandas as pd
+        from logdag import log2event
+
+        conf = config.open_config(arguments.DEFAULT_CONFIG,
+                                  base_default=False)
+        dts = datetime.datetime(2112, 9, 1)
+        args = (conf, (dts, dts + datetime.timedelta(days=1)), "all")
+        input_df = pd.DataFrame({0: [0, 1, 1]})
+        # no events are loaded without the cache
+        conf["dag"]["source"] = ""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            conf["dag"]["output_dir"] = tmpdir
+            log2event.dump_input_cache(args, input_df,
+                                       log2event.EventDefinitionMap(), False)
+            conf["dag"]["input_cache"] = "false"
+            assert log2event.makeinput_cached(args, False)[0] is None
+            conf["dag"]["input_cache"] = "true"
+            assert log2event.makeinput_cached(args, False)[0] is not None
+
+            # the options of the event loaders are in the key
+            for section, option, value in [
+                    ("general", "evdb", "sql"),
+                    ("general", "log_source", "influx"),
+                    ("database_amulog", "source_conf", "other.conf")]:
+                org_value = conf[section][option]
+                conf[section][option] = value
+                assert log2event.load_input_cache(args, False)[0] is None
+                conf[section][option] = org_value
+            # credentials are not stored in the key
+            conf["database_influx"]["passwd"] = "other"
+            assert log2event.load_input_cache(args, False)[0] is not None
+
+
+class TestEventDefinition(unittest.TestCase):
+
+    def test_intern(self):
+        import pickle
+        from logdag import log2event
+        from logdag.source import evgen_log
+
+        def _evdef(host):
+            return evgen_log.LogEventDefinition(
+                source=log2event.SRCCLS_LOG, host=host, group="g", gid=1)
+
+        evmap1 = log2event.EventDefinitionMap()
+        evmap2 = log2event.EventDefinitionMap()
+        eid1 = evmap1.add_evdef(_evdef("h1"))
+        eid2 = evmap2.add_evdef(_evdef("h1"))
+        assert evmap1.evdef(eid1) is evmap2.evdef(eid2)
+        with self.assertRaises(AttributeError):
+            evmap1.evdef(eid1).group = "x"
+
+        # evdefs pickled before slots (state: __dict__)
+        old = evgen_log.LogEventDefinition.__new__(
+            evgen_log.LogEventDefinition)
+        old.__setstate__({"source": log2event.SRCCLS_LOG, "host": "h1",
+                          "group": "g", "gid": 1})
+        assert old == evmap1.evdef(eid1)
+        assert log2event.intern(old) is evmap1.evdef(eid1)
+
+        evdef = pickle.loads(pickle.dumps(_evdef("h2")))
+        new_evdef = evdef.replace(group="x")
+        assert new_evdef.identifier == "h2:1:x"
+        assert evdef.identifier == "h2:1:g"
+
+    def test_columnar(self):
+        import datetime
+        from logdag import log2event
+        from logdag import evdict
+        from logdag.source import evgen_log
+
+        conf = config.open_config(arguments.DEFAULT_CONFIG,
+                                  base_default=False)
+        conf["dag"]["evmap_format"] = "columnar"
+        l_evdef = [evgen_log.LogEventDefinition(
+            source=log2event.SRCCLS_LOG, host=host, group=None, gid=gid)
+            for host, gid in [("h1", 1), ("h2", 1), ("h1", 2)]]
+        l_evdef.append(log2event.MultipleEventDefinition(
+            l_evdef[:2], group=None))
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            conf["dag"]["output_dir"] = tmpdir
+            l_args = []
+            for day, l_idx in [(1, [0, 1, 3]), (2, [2, 0])]:
+                args = (conf, (datetime.datetime(2112, 9, day),
+                               datetime.datetime(2112, 9, day + 1)), "all")
+                evmap = log2event.EventDefinitionMap()
+                for idx in l_idx:
+                    evmap.add_evdef(l_evdef[idx])
+                evmap.dump(args)
+                l_args.append((args, evmap))
+
+            evdict.clear_dictionaries()
+            dictionary = evdict.load_dictionary(conf)
+            assert len(dictionary) == len(l_evdef)
+            # global ids are given without creating the evdefs
+            gids = [dictionary.get_gid(evdef) for evdef in l_evdef]
+            assert sorted(gids) == list(range(len(l_evdef)))
+            assert len(dictionary._evdefs) == 0
+            for args, evmap in l_args:
+                loaded = log2event.EventDefinitionMap()
+                loaded.load(args)
+                assert dict(loaded.items()) == dict(evmap.items())
+                assert loaded.get_eid(l_evdef[0]) == evmap.get_eid(l_evdef[0])
+
+            # loading does not make the directories of missing jobs
+            conf["dag"]["output_dir"] = os.path.join(tmpdir, "missing")
+            evdict.clear_dictionaries()
+            with self.assertRaises(FileNotFoundError):
+                evdict.load_evmap(log2event.EventDefinitionMap(),
+                                  (conf,) + l_args[0][0][1:])
+            assert not os.path.exists(conf["dag"]["output_dir"])
+
+
+class TestDAGFormat(unittest.TestCase):
+
+    def test_npz(self):
+        import datetime
+        import networkx as nx
+        from logdag import showdag
+
+        conf = config.open_config(arguments.DEFAULT_CONFIG,
+                                  base_default=False)
+        conf["dag"]["output_dag_format"] = "npz"
+        graph = nx.DiGraph()
+        graph.add_nodes_from(range(6))
+        graph.add_edge(0, 1, weight=0.5, label="0.5")
+        graph.add_edge(1, 0, weight=0.2, label="0.2")
+        graph.add_edge(2, 3)
+        graph.add_edge(3, 4, weight=1.5)
+        graph.graph["ci_tests"] = 10
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            conf["dag"]["output_dir"] = tmpdir
+            args = (conf, (datetime.datetime(2112, 9, 1),
+                           datetime.datetime(2112, 9, 2)), "all")
+            showdag.LogDAG(args, graph).dump()
+
+            ldag = showdag.LogDAG(args)
+            ldag.load()
+            assert ldag.number_of_edges() == 3
+            assert ldag.number_of_nodes() == 6
+            assert sorted(len(nodes) for nodes
+                          in ldag.connected_subgraphs()) == [1, 2, 3]
+            assert ldag._graph is None
+            assert nx.utils.graphs_equal(ldag.graph, graph)
+            assert ldag.number_of_edges() == 3
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,746 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import unittest
+
+import numpy as np
+import networkx as nx
+
+
+def _test_data(seed=0, n_samples=2000, n_nodes=8):
+    # binary time-series with a chain structure and noise
+    rs = np.random.RandomState(seed)
+    data = np.zeros((n_samples, n_nodes), dtype=int)
+    data[:, 0] = rs.binomial(1, 0.3, n_samples)
+    for i in range(1, n_nodes):
+        noise = rs.binomial(1, 0.1, n_samples)
+        if i % 3 == 0:
+            data[:, i] = rs.binomial(1, 0.3, n_samples)
+        else:
+            parent = data[:, i - 1] & rs.binomial(1, 0.8, n_samples)
+            data[:, i] = parent | noise
+    return data
+
+
+def _budget_search(budget, seed):
+    from gsq.ci_tests import ci_test_bin
+    from logdag import pc_skeleton
+    search = pc_skeleton.SkeletonSearch(ci_test_bin, _test_data(seed=seed),
+                                        0.01, budget=budget)
+    search.run()
+    return search.n_tests
+
+
+def _shared_columns(shared, col_idxs):
+    return shared.frame(col_idxs)
+
+
+class TestSkeleton(unittest.TestCase):
+
+    def test_same_as_pcalg(self):
+        import pcalg
+        from gsq.ci_tests import ci_test_bin
+        from logdag import pc_skeleton
+
+        data = _test_data()
+        for method in ("stable", "default"):
+            g1, sep1 = pcalg.estimate_skeleton(
+                indep_test_func=ci_test_bin, data_matrix=data,
+                alpha=0.01, method=method)
+            g2, sep2 = pc_skeleton.estimate_skeleton(
+                indep_test_func=ci_test_bin, data_matrix=data,
+                alpha=0.01, method=method)
+            assert set(g1.edges()) == set(g2.edges())
+            assert sep1 == sep2
+
+    def test_init_graph(self):
+        import pcalg
+        from gsq.ci_tests import ci_test_bin
+        from logdag import pc_skeleton
+        from logdag import pknowledge
+
+        data = _test_data()
+        pk = pknowledge.PriorKnowledge(list(range(data.shape[1])))
+        for edge in [(0, 2), (1, 5), (3, 7)]:
+            pk.add_noedge_rule(edge)
+        init_graph = pk.pruned_initial_skeleton()
+        g1, sep1 = pcalg.estimate_skeleton(
+            indep_test_func=ci_test_bin, data_matrix=data, alpha=0.01,
+            init_graph=init_graph.to_nx(directed=False))
+        g2, sep2 = pc_skeleton.estimate_skeleton(
+            indep_test_func=ci_test_bin, data_matrix=data, alpha=0.01,
+            init_graph=init_graph)
+        assert set(g1.edges()) == set(g2.edges())
+        assert sep1 == sep2
+
+    def test_required_graph(self):
+        from gsq.ci_tests import ci_test_bin
+        from logdag import pc_skeleton
+        from logdag import pknowledge
+
+        data = _test_data()
+        g1, _ = pc_skeleton.SkeletonSearch(ci_test_bin, data, 0.01).run()
+        pk = pknowledge.PriorKnowledge(list(range(data.shape[1])))
+        # separated by node 1 in the chain
+        assert not g1.has_edge(0, 2)
+        pk.add_edge_rule((0, 2))
+        search = pc_skeleton.SkeletonSearch(
+            ci_test_bin, data, 0.01, required_graph=pk.required_skeleton())
+        g2, _ = search.run()
+        assert g2.has_edge(0, 2)
+        assert search.pvalues[(0, 2)][0] == -np.inf
+
+    def test_depth0_graph(self):
+        from gsq.ci_tests import ci_test_bin
+        from logdag import pc_skeleton
+        from logdag import pknowledge
+
+        data = _test_data()
+        pk = pknowledge.PriorKnowledge(list(range(data.shape[1])))
+        # (0, 2): dependent at depth 0, separated by node 1 in the chain
+        # (0, 3): independent at depth 0
+        depth0 = np.zeros((data.shape[1], data.shape[1]), dtype=bool)
+        depth0[0, 2] = depth0[0, 3] = True
+        pk.add_depth0_matrix(depth0)
+        search = pc_skeleton.SkeletonSearch(
+            ci_test_bin, data, 0.01, depth0_graph=pk.depth0_only_skeleton())
+        g, _ = search.run()
+        assert g.has_edge(0, 2)
+        assert search.pvalues[(0, 2)][1] == 0
+        assert not g.has_edge(0, 3)
+        assert not g.has_edge(1, 3)
+
+    def test_checkpoint(self):
+        import datetime
+        import os
+        import tempfile
+        from amulog import config
+        from gsq.ci_tests import ci_test_bin
+        from logdag import arguments
+        from logdag import ci_stats
+        from logdag import pc_input
+        from logdag import pc_skeleton
+
+        data = _test_data(n_nodes=10)
+        search = pc_skeleton.SkeletonSearch(ci_test_bin, data, 0.01)
+        g1, sep1 = search.run()
+
+        class _Killed(Exception):
+            pass
+
+        def killed_at_depth1(data_matrix, i, j, cond):
+            if len(cond) >= 1:
+                raise _Killed
+            return ci_test_bin(data_matrix, i, j, cond)
+
+        # same test as ci_test_bin for the fingerprint
+        killed_at_depth1.identity = \
+            lambda: pc_skeleton.ci_test_identity(ci_test_bin)
+
+        conf = config.open_config(arguments.DEFAULT_CONFIG,
+                                  base_default=False)
+        dts = datetime.datetime(2112, 9, 1)
+        args = (conf, (dts, dts + datetime.timedelta(days=1)), "all")
+        with tempfile.TemporaryDirectory() as tmpdir:
+            conf["dag"]["output_dir"] = tmpdir
+            checkpoint = pc_skeleton.SkeletonCheckpoint(args)
+            with self.assertRaises(_Killed):
+                pc_skeleton.SkeletonSearch(killed_at_depth1, data, 0.01,
+                                           checkpoint=checkpoint).run()
+            assert os.path.exists(checkpoint.path)
+
+            # not resumed with other CI tests
+            values = data.astype(float)
+            statistics = ci_stats.CIStatistics(
+                ci_stats.KIND_BINARY, data.shape[0], values.sum(axis=0),
+                values.T.dot(values))
+            for func in (pc_input.RareEventTest(ci_test_bin, data,
+                                                "independent", 5),
+                         pc_input.RareEventTest(ci_test_bin, data,
+                                                "independent", 3),
+                         ci_stats.StatisticsTest(ci_test_bin, statistics)):
+                other = pc_skeleton.SkeletonSearch(func, data, 0.01,
+                                                   checkpoint=checkpoint)
+                assert checkpoint.load(other._fingerprint) is None
+
+            search_resumed = pc_skeleton.SkeletonSearch(
+                ci_test_bin, data, 0.01, checkpoint=checkpoint)
+            g2, sep2 = search_resumed.run()
+            assert set(g1.edges()) == set(g2.edges())
+            assert sep1 == sep2
+            assert search_resumed.n_tests == search.n_tests
+            checkpoint.remove()
+            assert not os.path.exists(checkpoint.path)
+
+    def test_warm_start_strict(self):
+        from gsq.ci_tests import ci_test_bin
+        from logdag import pc_skeleton
+
+        data = _test_data()
+        search = pc_skeleton.SkeletonSearch(ci_test_bin, data, 0.01)
+        g1, _ = search.run()
+
+        ws = pc_skeleton.WarmStart(strict=True)
+        record = pc_skeleton.SkeletonRecord(data.shape[1], 0.01)
+        record.update(search)
+        ws._cache = {key: cond for key, (depth, cond)
+                     in record.separations().items() if depth > 0}
+        search_ws = pc_skeleton.SkeletonSearch(ci_test_bin, data, 0.01,
+                                               warm_start=ws)
+        g2, _ = search_ws.run()
+        assert set(g1.edges()) == set(g2.edges())
+        # cached sets are tested once more than the cold start at most
+        assert search_ws.n_tests <= search.n_tests + ws.n_hit + ws.n_miss
+
+    def test_warm_start_cpdag(self):
+        from logdag import pc_input
+        from logdag import pc_skeleton
+
+        # (0, 2) is separated with either {1} or {3} (both adjacent to 0
+        # and 2), and the CPDAG depends on which one is used
+        def indep_test(data_matrix, i, j, cond):
+            if (min(i, j), max(i, j)) == (0, 2) and \
+                    set(cond) in ({1}, {3}):
+                return 0.5
+            return 0.
+
+        data = np.zeros((100, 4))
+        g1, sep1 = pc_skeleton.SkeletonSearch(indep_test, data, 0.01).run()
+        assert sep1[0][2] == {1}
+        ws = pc_skeleton.WarmStart(strict=True)
+        ws._cache = {(0, 2): (3,)}
+        search_ws = pc_skeleton.SkeletonSearch(indep_test, data, 0.01,
+                                               warm_start=ws)
+        g2, sep2 = search_ws.run()
+        assert ws.n_hit > 0
+        assert set(g1.edges()) == set(g2.edges())
+        cpdag1 = pc_input.estimate_cpdag(g1, sep1)
+        cpdag2 = pc_input.estimate_cpdag(g2, sep2)
+        assert set(cpdag1.edges()) == set(cpdag2.edges())
+
+    def test_cond_order(self):
+        import pandas as pd
+        from logdag import pc_input
+        from logdag import pc_skeleton
+
+        # d-separation oracle: (0, 5) is separated only by 4, which is
+        # the last one of the neighbors of 0 in the default order,
+        # and dependent p-values are larger for distant pairs
+        dag = nx.DiGraph([(1, 0), (2, 0), (3, 0), (0, 4), (4, 5)])
+        skeleton = dag.to_undirected()
+
+        def indep_test(data_matrix, i, j, cond):
+            if nx.d_separated(dag, {i}, {j}, set(cond)):
+                return 1.
+            return 1e-3 * nx.shortest_path_length(skeleton, i, j)
+
+        data = np.zeros((100, 6))
+        l_search = []
+        for cond_order in ("default", "association"):
+            search = pc_skeleton.SkeletonSearch(indep_test, data, 0.01,
+                                                cond_order=cond_order)
+            g, sep_set = search.run()
+            assert set(map(frozenset, g.edges())) == \
+                set(map(frozenset, skeleton.edges()))
+            assert sep_set[0][5] == {4}
+            l_search.append(search)
+        default, association = l_search
+        assert association.n_tests < default.n_tests
+        assert association.n_enum_tests < association.n_enum_default_max
+        # exact in the default order, and an upper bound in others
+        assert default.n_enum_tests == default.n_enum_default_max
+        assert association.n_enum_default_max >= default.n_enum_tests
+
+        dag_graph = pc_input.estimate_dag(
+            pd.DataFrame(data), 0.01, indep_test, cond_order="association")
+        assert dag_graph.graph["ci_enum_tests"] == association.n_enum_tests
+        assert dag_graph.graph["ci_enum_default_max"] == \
+            association.n_enum_default_max
+
+    def test_budget(self):
+        from gsq.ci_tests import ci_test_bin
+        from logdag import pc_skeleton
+
+        data = _test_data()
+        search = pc_skeleton.SkeletonSearch(ci_test_bin, data, 0.01)
+        search.run()
+        n_depth0 = data.shape[1] * (data.shape[1] - 1)
+
+        # the budget is shared by the searches (e.g., components of a job)
+        budget = pc_skeleton.SearchBudget(test_limit=search.n_tests + 1)
+        search1 = pc_skeleton.SkeletonSearch(ci_test_bin, data, 0.01,
+                                             budget=budget)
+        search1.run()
+        assert not search1.truncated
+        search2 = pc_skeleton.SkeletonSearch(ci_test_bin, data, 0.01,
+                                             budget=budget)
+        search2.run()
+        assert search2.truncated
+        assert search2.depth == 0
+        assert search2.n_tests == n_depth0
+        assert budget.n_tests == search.n_tests + n_depth0
+
+        # adaptive: stop before the level exceeding the remaining budget
+        budget = pc_skeleton.SearchBudget(test_limit=n_depth0 + 1,
+                                          adaptive=True)
+        search3 = pc_skeleton.SkeletonSearch(ci_test_bin, data, 0.01,
+                                             budget=budget)
+        search3.run()
+        assert search3.truncated
+        assert search3.n_tests == n_depth0
+
+    def test_budget_parallel(self):
+        from logdag import parallel
+        from logdag import pc_skeleton
+
+        seeds = [0, 1, 2]
+        budget = pc_skeleton.SearchBudget(test_limit=10 ** 6)
+        with budget.share(len(seeds), processes=2) as l_budget:
+            l_n_tests = parallel.pool_starmap(
+                _budget_search, zip(l_budget, seeds), processes=2)
+        assert budget.n_tests == sum(l_n_tests)
+
+    def test_budget_policy(self):
+        from amulog import config
+        from logdag import arguments
+        from logdag import pc_skeleton
+
+        conf = config.open_config(arguments.DEFAULT_CONFIG,
+                                  base_default=False)
+        conf["dag"]["skeleton_depth_policy"] = "adaptive"
+        with self.assertRaises(ValueError):
+            pc_skeleton.init_budget(conf)
+        conf["dag"]["skeleton_test_budget"] = "1000"
+        budget = pc_skeleton.init_budget(conf)
+        assert budget.adaptive
+
+    def test_ledger(self):
+        import datetime
+        import tempfile
+        from amulog import config
+        from logdag import arguments
+
+        conf = config.open_config(arguments.DEFAULT_CONFIG,
+                                  base_default=False)
+        am = arguments.ArgumentManager
+        l_args = [(conf, (datetime.datetime(2112, 9, day),
+                          datetime.datetime(2112, 9, day + 1)), "all")
+                  for day in (1, 2)]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            conf["dag"]["output_dir"] = tmpdir
+            am.remove_ledger(l_args[0], "depth_truncated")
+            assert am.load_ledger(conf) == []
+            for args in l_args:
+                am.add_ledger(args, "depth_truncated", "depth=1")
+            # rerun: truncated again at other depth, and not truncated
+            am.add_ledger(l_args[0], "depth_truncated", "depth=2")
+            am.remove_ledger(l_args[1], "depth_truncated")
+            assert am.load_ledger(conf) == [
+                (am.jobname(l_args[0]), "depth_truncated", "depth=2")]
+
+    def test_record_rethreshold(self):
+        from gsq.ci_tests import ci_test_bin
+        from logdag import pc_skeleton
+
+        data = _test_data()
+        search = pc_skeleton.SkeletonSearch(ci_test_bin, data, 0.01)
+        g1, sep1 = search.run()
+        record = pc_skeleton.SkeletonRecord(data.shape[1], 0.01)
+        record.update(search)
+        g2, _ = record.skeleton()
+        assert set(g1.edges()) == set(g2.edges())
+        g3, _ = record.skeleton(1e-6)
+        assert set(g3.edges()) <= set(g2.edges())
+
+
+    def test_ci_cache(self):
+        from gsq.ci_tests import ci_test_bin
+        from logdag import pc_skeleton
+
+        data = _test_data()
+        cache = pc_skeleton.CITestCache()
+        for alpha in (0.01, 0.001):
+            g1, sep1 = pc_skeleton.SkeletonSearch(
+                ci_test_bin, data, alpha).run()
+            g2, sep2 = pc_skeleton.SkeletonSearch(
+                ci_test_bin, data, alpha, ci_cache=cache).run()
+            assert set(g1.edges()) == set(g2.edges())
+            assert sep1 == sep2
+        assert cache.n_hit > 0
+
+
+class TestRareEvent(unittest.TestCase):
+
+    @staticmethod
+    def _rare_data():
+        data = _test_data()
+        rare = np.zeros((data.shape[0], 1), dtype=int)
+        rare[[10, 500, 1500], 0] = 1
+        return np.hstack([data, rare])
+
+    def test_policies(self):
+        from scipy.stats import fisher_exact
+        from gsq.ci_tests import ci_test_bin
+        from logdag import pc_input
+
+        data = self._rare_data()
+        rare = data.shape[1] - 1
+        for policy in pc_input.RareEventTest.policies:
+            func = pc_input.RareEventTest(ci_test_bin, data, policy,
+                                          min_count=5)
+            # not rare: G-square tests as usual
+            assert func(data, 0, 1, {2}) == ci_test_bin(data, 0, 1, {2})
+            p0 = func(data, 0, rare, set())
+            p1 = func(data, 0, rare, {1})
+            if policy == "none":
+                assert p0 == ci_test_bin(data, 0, rare, set())
+                assert p1 == ci_test_bin(data, 0, rare, {1})
+                assert func.counts == {}
+            elif policy == "independent":
+                assert p0 == p1 == 1.
+                assert func.counts == {"independent": 2}
+            elif policy == "exact":
+                x = data[:, 0].astype(bool)
+                y = data[:, rare].astype(bool)
+                table = [[np.sum(~x & ~y), np.sum(~x & y)],
+                         [np.sum(x & ~y), np.sum(x & y)]]
+                assert p0 == fisher_exact(table)[1]
+                # only the order-0 test is replaced
+                assert p1 == ci_test_bin(data, 0, rare, {1})
+                assert func.counts == {"exact": 1}
+            elif policy == "no-condition":
+                assert p0 == ci_test_bin(data, 0, rare, set())
+                assert p1 == 0.
+                assert func.counts == {"no-condition": 1}
+
+    def test_pc(self):
+        import pandas as pd
+        from logdag import pc_input
+
+        df = pd.DataFrame(self._rare_data())
+        rare = df.shape[1] - 1
+        g = pc_input.pc(df, 0.01, rare_policy="independent",
+                        rare_min_count=5)
+        # all pairs with the rare event are separated without tests
+        assert g.degree(rare) == 0
+        assert g.graph["ci_shortcuts"]["independent"] == 2 * rare
+        g = pc_input.pc(df, 0.01)
+        assert "ci_shortcuts" not in g.graph
+
+
+class TestStatistics(unittest.TestCase):
+
+    def test_incremental(self):
+        import pandas as pd
+        from gsq.ci_tests import ci_test_bin
+        from logdag import ci_stats
+
+        data = _test_data(n_nodes=10)
+        index = pd.date_range("2112-09-01", periods=data.shape[0],
+                              freq="1min")
+        window = ci_stats.WindowStatistics(ci_stats.KIND_BINARY)
+        assert window.update(index[:1500], list(range(10)),
+                             data[:1500].astype(float)) == "full"
+
+        # next window: event 0 leaves, event 10 enters,
+        # and event 4 has different values in the overlapping bins
+        rs = np.random.RandomState(1)
+        data2 = np.hstack([data[300:1800, 1:],
+                           rs.binomial(1, 0.2, (1500, 1))])
+        data2[:, 3] = rs.binomial(1, 0.2, 1500)
+        assert window.update(index[300:1800], list(range(1, 11)),
+                             data2.astype(float)) == "incremental"
+        assert np.array_equal(window.cross, data2.T.dot(data2))
+        statistics = window.statistics()
+        for i, j in [(0, 1), (2, 3), (4, 9)]:
+            assert statistics.p_value(i, j, set()) == \
+                ci_test_bin(data2, i, j, set())
+        assert statistics.p_value(0, 1, {2}) is None
+
+    def test_fisher_z(self):
+        import pandas as pd
+        from scipy.stats import norm
+        from logdag import ci_stats
+
+        # gaussian chain 0 -> 1 -> 2, and 3 independent
+        rs = np.random.RandomState(0)
+        data = rs.normal(size=(1000, 4))
+        data[:, 1] += data[:, 0]
+        data[:, 2] += 0.5 * data[:, 1]
+        index = pd.date_range("2112-09-01", periods=data.shape[0],
+                              freq="1min")
+        window = ci_stats.WindowStatistics(ci_stats.KIND_GAUSSIAN)
+        window.update(index[:800], list(range(4)), data[:800])
+        assert window.update(index[200:], list(range(4)),
+                             data[200:]) == "incremental"
+        statistics = window.statistics()
+
+        def _partial_corr_test(x, i, j, cond):
+            # correlation of the residuals of the regressions on cond
+            n = x.shape[0]
+            design = np.hstack([np.ones((n, 1)), x[:, sorted(cond)]])
+            coef, _, _, _ = np.linalg.lstsq(design, x[:, [i, j]],
+                                            rcond=None)
+            resid = x[:, [i, j]] - design.dot(coef)
+            r = np.corrcoef(resid.T)[0, 1]
+            z = np.sqrt(n - len(cond) - 3) * np.arctanh(r)
+            return 2 * norm.sf(abs(z))
+
+        x = data[200:]
+        for i, j, cond in [(0, 1, set()), (0, 2, set()), (2, 3, set()),
+                           (0, 2, {1}), (0, 3, {1, 2}), (1, 2, {0, 3})]:
+            assert np.isclose(statistics.p_value(i, j, cond),
+                              _partial_corr_test(x, i, j, cond),
+                              rtol=1e-6, atol=1e-12)
+        assert statistics.p_value(0, 2, set()) < 0.01
+        assert statistics.p_value(0, 2, {1}) > 0.01
+
+    def test_pc(self):
+        import pandas as pd
+        from logdag import ci_stats
+        from logdag import pc_input
+
+        data = _test_data()
+        input_df = pd.DataFrame(data)
+        window = ci_stats.WindowStatistics(ci_stats.KIND_BINARY)
+        window.update(input_df.index, list(input_df.columns),
+                      ci_stats.input_values(input_df, ci_stats.KIND_BINARY))
+        g1 = pc_input.pc(input_df, 0.01, "gsq")
+        g2 = pc_input.pc(input_df, 0.01, "gsq",
+                         statistics=window.statistics())
+        assert set(g1.edges()) == set(g2.edges())
+        # order-0 tests of all pairs
+        assert g2.graph["ci_stats_tests"] >= 28
+        assert g2.graph["ci_tests"] == g1.graph["ci_tests"]
+
+
+class TestOrientation(unittest.TestCase):
+
+    def test_same_as_pcalg(self):
+        import pcalg
+        from logdag import adjgraph
+        from logdag import pc_orient
+
+        for seed in range(30):
+            # random separating sets to include conflicting v-structures
+            rs = np.random.RandomState(seed)
+            n_nodes = rs.randint(3, 20)
+            skel = nx.gnp_random_graph(n_nodes, 0.3, seed=seed)
+            sep_set = [[set() for _ in range(n_nodes)]
+                       for _ in range(n_nodes)]
+            for i in range(n_nodes):
+                for j in range(i + 1, n_nodes):
+                    if not skel.has_edge(i, j):
+                        cond = set(int(k) for k in rs.choice(n_nodes, 2)
+                                   if k not in (i, j))
+                        sep_set[i][j] = cond
+                        sep_set[j][i] = cond
+            g1 = pcalg.estimate_cpdag(skel, sep_set)
+            g2 = pc_orient.estimate_cpdag(
+                adjgraph.AdjacencyGraph.from_nx(skel), sep_set)
+            assert set(g1.edges()) == set(g2.arcs())
+
+
+class TestDecomposition(unittest.TestCase):
+
+    def test_components(self):
+        import pandas as pd
+        from amulog import config
+        from logdag import arguments
+        from logdag import makedag
+        from logdag import pknowledge
+
+        data = np.hstack([_test_data(seed=1, n_nodes=5),
+                          _test_data(seed=2, n_nodes=5)])
+        input_df = pd.DataFrame(data)
+        pk = pknowledge.PriorKnowledge(list(input_df.columns))
+        for i in range(5):
+            for j in range(5, 10):
+                pk.add_noedge_rule((i, j))
+
+        conf = config.open_config(arguments.DEFAULT_CONFIG,
+                                  base_default=False)
+        g1 = makedag.estimate_dag(conf, input_df, "gsq", pk)
+        conf["dag"]["decompose_components"] = "true"
+        g2 = makedag.estimate_dag(conf, input_df, "gsq", pk)
+        assert set(g1.nodes()) == set(g2.nodes())
+        assert set(g1.edges()) == set(g2.edges())
+
+    def test_shared_components(self):
+        import pandas as pd
+        from amulog import config
+        from logdag import arguments
+        from logdag import makedag
+        from logdag import parallel
+
+        data = np.hstack([_test_data(seed=1, n_nodes=5),
+                          _test_data(seed=2, n_nodes=5)])
+        input_df = pd.DataFrame(data)
+        conf = config.open_config(arguments.DEFAULT_CONFIG,
+                                  base_default=False)
+        conf["dag"]["decompose_components"] = "true"
+        conf["dag"]["decompose_skeleton"] = "depth0"
+        g1 = makedag.estimate_dag(conf, input_df, "gsq")
+
+        conf["dag"]["estimate_parallel"] = "2"
+        with parallel.shared_frame(input_df, 2) as shared_df:
+            assert parallel.SharedMatrix.lookup(shared_df.values) is not None
+            g2 = makedag.estimate_dag(conf, shared_df, "gsq")
+        assert len(parallel.SharedMatrix._owned) == 0
+        assert set(g1.edges()) == set(g2.edges())
+
+    def test_shared_dtypes(self):
+        import pandas as pd
+        from logdag import parallel
+
+        df = pd.DataFrame({10: np.arange(5, dtype=np.int64),
+                           11: np.linspace(0, 1, 5),
+                           12: np.arange(5, dtype=np.int8) * 3,
+                           13: np.array([2 ** 60 + 1] * 5, dtype=np.int64)},
+                          index=pd.date_range("2112-09-01", periods=5))
+        l_idxs = [[0, 1, 3], [2, 0]]
+        for processes in (1, 2):
+            with parallel.share_frame(df, processes) as shared:
+                results = parallel.pool_starmap(
+                    _shared_columns, [(shared, col_idxs)
+                                      for col_idxs in l_idxs],
+                    processes=processes)
+            for col_idxs, sub_df in zip(l_idxs, results):
+                # no float conversion of the int columns
+                pd.testing.assert_frame_equal(sub_df, df.iloc[:, col_idxs])
+            with parallel.shared_frame(df, processes) as shared_df:
+                pd.testing.assert_frame_equal(shared_df, df)
+        assert len(parallel.SharedMatrix._owned) == 0
+
+    def test_depth0_components(self):
+        import pandas as pd
+        from amulog import config
+        from logdag import arguments
+        from logdag import makedag
+        from logdag import pc_skeleton
+
+        data = np.hstack([_test_data(seed=3, n_nodes=5),
+                          _test_data(seed=4, n_nodes=5)])
+        input_df = pd.DataFrame(data)
+
+        conf = config.open_config(arguments.DEFAULT_CONFIG,
+                                  base_default=False)
+        g1 = makedag.estimate_dag(conf, input_df, "gsq")
+        conf["dag"]["decompose_components"] = "true"
+        conf["dag"]["decompose_skeleton"] = "depth0"
+        g2 = makedag.estimate_dag(conf, input_df, "gsq")
+        assert set(g1.nodes()) == set(g2.nodes())
+        assert set(g1.edges()) == set(g2.edges())
+        # the components reuse the depth-0 tests of the decomposition
+        conf["dag"]["decompose_components"] = "false"
+        g3 = makedag.estimate_dag(conf, input_df, "gsq",
+                                  ci_cache=pc_skeleton.CITestCache())
+        n_pairs = input_df.shape[1] * (input_df.shape[1] - 1) // 2
+        assert g2.graph["ci_tests"] == g3.graph["ci_tests"] - n_pairs
+
+    def test_partitions(self):
+        import json
+        import os
+        import tempfile
+        import pandas as pd
+        from amulog import config
+        from logdag import arguments
+        from logdag import log2event
+        from logdag import makedag
+
+        class _EventDefinition:
+            def __init__(self, host, node):
+                self.host = host
+                self.identifier = "{0}:{1}".format(host, node)
+
+        # chains 0-1-2, 4-5, 6-7 on hosts h0 - h1 - h2 - h3
+        data = _test_data(n_nodes=8)
+        input_df = pd.DataFrame(data)
+        evmap = log2event.EventDefinitionMap()
+        for node in input_df.columns:
+            evmap.add_evdef(_EventDefinition("h{0}".format(node // 2), node))
+        topology = nx.path_graph(["h0", "h1", "h2", "h3"])
+
+        conf = config.open_config(arguments.DEFAULT_CONFIG,
+                                  base_default=False)
+        conf["dag"]["decompose_partition"] = "khop"
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fp = os.path.join(tmpdir, "topology.json")
+            with open(fp, "w") as f:
+                json.dump(nx.node_link_data(topology), f)
+            conf["pc_prune"]["single_network_file"] = fp
+            g = makedag.estimate_dag(conf, input_df, "gsq", evmap=evmap)
+
+        stats = g.graph["partition_agreement"]
+        # balls of h1 and h2 (those of h0 and h3 are included in them)
+        assert stats["partitions"] == 2
+        assert stats["overlapped"] == stats["agreed"] + stats["disagreed"]
+        skeleton = set(frozenset(edge) for edge in g.edges())
+        for edge in [(0, 1), (1, 2), (4, 5), (6, 7)]:
+            assert frozenset(edge) in skeleton
+
+
+class TestEgo(unittest.TestCase):
+
+    def test_ego(self):
+        import datetime
+        import json
+        import os
+        import tempfile
+        import pandas as pd
+        from amulog import config
+        from logdag import arguments
+        from logdag import ego
+        from logdag import log2event
+        from logdag import topology
+
+        class _EventDefinition:
+            def __init__(self, host, node):
+                self.host = host
+                self.identifier = "{0}:{1}".format(host, node)
+
+        # events 0-7 on hosts h0 - h1 - h2 - h3, event 8 on h9 (isolated)
+        data = _test_data(n_nodes=9)
+        dts = datetime.datetime(2112, 9, 1)
+        index = pd.date_range(dts, periods=data.shape[0], freq="1min")
+        input_df = pd.DataFrame(data, index=index)
+        evmap = log2event.EventDefinitionMap()
+        for node in input_df.columns:
+            host = "h{0}".format(node // 2) if node < 8 else "h9"
+            evmap.add_evdef(_EventDefinition(host, node))
+        conf = config.open_config(arguments.DEFAULT_CONFIG,
+                                  base_default=False)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fp = os.path.join(tmpdir, "topology.json")
+            with open(fp, "w") as f:
+                json.dump(nx.node_link_data(
+                    nx.path_graph(["h0", "h1", "h2", "h3"])), f)
+            topo = topology.load_topology(fp)
+            conf["pc_prune"]["single_network_file"] = fp
+
+            # only the neighbor hosts if no bins with the seed messages
+            l_dt = [dts - datetime.timedelta(days=1)]
+            nodes = ego.select_nodes(input_df, evmap, [0], l_dt,
+                                     topology=topo, hops=1)
+            assert nodes == [0, 1, 2, 3]
+            nodes = ego.select_nodes(input_df, evmap, [0], l_dt,
+                                     topology=topo, hops=2)
+            assert nodes == [0, 1, 2, 3, 4, 5]
+            # co-occurring events in the bin of the message
+            bin_idx = int(np.flatnonzero(data[:, 8] > 0)[0])
+            nodes = ego.select_nodes(input_df, evmap, [0], [index[bin_idx]],
+                                     topology=topo, hops=1)
+            assert 8 in nodes
+
+            args = (conf, (dts, index[-1]), "all")
+            ldag = ego.estimate_ego(args, [0, 1], input_df=input_df,
+                                    evmap=evmap)
+            topology.clear_cache()
+        assert set(ldag.graph.nodes()) <= set(input_df.columns)
+        assert ldag.graph.to_undirected().has_edge(0, 1)
+        assert ldag.graph.graph["ego_seeds"] == [0, 1]
+
+
+if __name__ == "__main__":
+    unittest.main()
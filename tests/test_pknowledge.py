@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import json
+import os
+import tempfile
+import unittest
+from itertools import combinations, permutations
+
+import networkx as nx
+import numpy as np
+
+
+class _EventDefinition:
+
+    def __init__(self, host, group="interface", source="log"):
+        self.host = host
+        self.group = group
+        self.source = source
+
+    @property
+    def identifier(self):
+        return "{0}:{1}".format(self.host, self.group)
+
+
+class _EventDefinitionMap:
+
+    def __init__(self, l_evdef):
+        self._emap = dict(enumerate(l_evdef))
+
+    def eids(self):
+        return list(self._emap.keys())
+
+    def evdef(self, eid):
+        return self._emap[eid]
+
+
+class TestPriorKnowledge(unittest.TestCase):
+
+    def test_rules(self):
+        from logdag import pknowledge
+        pk = pknowledge.PriorKnowledge([10, 11, 12, 13])
+        pk.add_noedge_rule((10, 11))
+        pk.add_path_rule((12, 13))
+        pk.add_nopath_rule((11, 12))
+        assert pk.is_noedge((11, 10)) and pk.is_nopath((11, 10))
+        assert pk.is_edge((13, 12)) and not pk.is_path((13, 12))
+        assert pk.is_noedge((12, 11)) and not pk.is_nopath((12, 11))
+
+        g = pk.pruned_initial_skeleton()
+        assert set(g.edges()) == {(0, 2), (0, 3), (1, 3), (2, 3)}
+
+        pmatrix = pk.lingam_prior_knowledge(node_ids=[12, 13])
+        assert pmatrix.tolist() == [[-1, -1], [1, -1]]
+        sub_pk = pk.subset([11, 12])
+        assert sub_pk.is_nopath((0, 1)) and not sub_pk.is_nopath((1, 0))
+
+    def test_lingam_prior_knowledge(self):
+        from lingam.utils import make_prior_knowledge
+        from logdag import pknowledge
+
+        node_ids = [10, 11, 12, 13, 14, 15]
+        rs = np.random.RandomState(0)
+        for _ in range(20):
+            pk = pknowledge.PriorKnowledge(node_ids)
+            paths = set()
+            nopaths = set()
+            for edge in permutations(node_ids, 2):
+                rule = rs.randint(10)
+                if rule == 0:
+                    pk.add_path_rule(edge)
+                    paths.add(edge)
+                elif rule == 1:
+                    pk.add_nopath_rule(edge)
+                    nopaths.add(edge)
+                elif rule == 2:
+                    pk.add_edge_rule(edge)
+                    paths |= {edge, edge[::-1]}
+                elif rule == 3:
+                    pk.add_noedge_rule(edge)
+                    nopaths |= {edge, edge[::-1]}
+            exogenous = set(rs.choice(node_ids, 1))
+            sink = set(rs.choice(node_ids, 1))
+            for node in exogenous:
+                pk.add_exogenous_variable(node)
+            for node in sink:
+                pk.add_sink_variable(node)
+
+            for sub_ids in (node_ids, [13, 10, 15]):
+                d_idx = {node: idx for idx, node in enumerate(sub_ids)}
+
+                def _relabel(edges):
+                    return [(d_idx[i], d_idx[j]) for i, j in edges
+                            if i in d_idx and j in d_idx]
+
+                pmatrix = make_prior_knowledge(
+                    len(sub_ids),
+                    exogenous_variables=[d_idx[node] for node in exogenous
+                                         if node in d_idx],
+                    sink_variables=[d_idx[node] for node in sink
+                                    if node in d_idx],
+                    paths=_relabel(paths), no_paths=_relabel(nopaths))
+                assert np.array_equal(
+                    pk.lingam_prior_knowledge(node_ids=sub_ids), pmatrix)
+
+    def test_topology(self):
+        from logdag import pknowledge
+        topology = nx.Graph([("h0", "h1"), ("h1", "h2")])
+        l_evdef = [_EventDefinition("h{0}".format(i % 4)) for i in range(12)]
+        evmap = _EventDefinitionMap(l_evdef)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fp = os.path.join(tmpdir, "topology.json")
+            with open(fp, "w") as f:
+                json.dump(nx.node_link_data(topology), f)
+            rule = pknowledge.Topology(fp)
+            pk = rule.update(pknowledge.PriorKnowledge(evmap.eids()), evmap)
+
+        for node1, node2 in combinations(evmap.eids(), 2):
+            adjacent = rule._is_adjacent(evmap.evdef(node1),
+                                         evmap.evdef(node2))
+            assert pk.is_noedge((node1, node2)) != adjacent
+
+
+class TestRuleBasedPruning(unittest.TestCase):
+    # the rules of the node groups are same as the rules of
+    # each pair of nodes with _is_adjacent
+
+    @staticmethod
+    def _evmap():
+        l_evdef = []
+        for host in ("h0", "h1", "h2", "h3", "h4"):
+            for group in ("interface", "system"):
+                l_evdef.append(_EventDefinition(host, group))
+            l_evdef.append(_EventDefinition(host, "snmp", source="snmp"))
+        return _EventDefinitionMap(l_evdef)
+
+    def _assert_same_as_pairs(self, rule, evmap):
+        from logdag import pknowledge
+        pk = rule.update(pknowledge.PriorKnowledge(evmap.eids()), evmap)
+        for node1, node2 in permutations(evmap.eids(), 2):
+            adjacent = rule._is_adjacent(evmap.evdef(node1),
+                                         evmap.evdef(node2))
+            assert pk.is_noedge((node1, node2)) != adjacent
+            assert pk.is_nopath((node1, node2)) != adjacent
+            assert not pk.is_edge((node1, node2))
+
+    def test_layered_topology(self):
+        from logdag import pknowledge
+        from logdag import topology
+        evmap = self._evmap()
+        # h4 is not in the topology
+        d_graph = {"l2": nx.Graph([("h0", "h1"), ("h1", "h2")]),
+                   "l3": nx.Graph([("h0", "h3"), ("h2", "h3")])}
+        d_rule = {"interface": "l2", "system": "l3"}
+        with tempfile.TemporaryDirectory() as tmpdir:
+            d_fp = {}
+            for layer, graph in d_graph.items():
+                d_fp[layer] = os.path.join(tmpdir, layer + ".json")
+                with open(d_fp[layer], "w") as f:
+                    json.dump(nx.node_link_data(graph), f)
+            # missing layer
+            d_fp["other"] = os.path.join(tmpdir, "other.json")
+            rule = pknowledge.LayeredTopology(d_fp, d_rule)
+            self._assert_same_as_pairs(rule, evmap)
+        topology.clear_cache()
+
+    def test_host_independent(self):
+        from logdag import pknowledge
+        self._assert_same_as_pairs(pknowledge.HostIndependent(),
+                                   self._evmap())
+
+    def test_additional_source(self):
+        from logdag import pknowledge
+        self._assert_same_as_pairs(pknowledge.AdditionalSource(),
+                                   self._evmap())
+
+
+class TestTopologyCache(unittest.TestCase):
+
+    def test_cache(self):
+        from logdag import topology
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fp = os.path.join(tmpdir, "topology.json")
+            with open(fp, "w") as f:
+                json.dump(nx.node_link_data(nx.Graph([("h0", "h1")])), f)
+            topo = topology.load_topology(fp)
+            assert topology.load_topology(fp) is topo
+            assert topo.has_edge("h1", "h0") and not topo.has_edge("h0", "h2")
+
+            # invalidated by the modification time
+            with open(fp, "w") as f:
+                json.dump(nx.node_link_data(nx.Graph([("h0", "h2")])), f)
+            mtime = os.path.getmtime(fp) + 10
+            os.utime(fp, (mtime, mtime))
+            topo = topology.load_topology(fp)
+            assert topo.has_edge("h0", "h2") and not topo.has_edge("h0", "h1")
+            topology.clear_cache()
+
+
+class TestImportDAG(unittest.TestCase):
+
+    def test_import(self):
+        import datetime
+        from amulog import config
+        from logdag import arguments
+        from logdag import log2event
+        from logdag import pknowledge
+        from logdag import showdag
+
+        conf = config.open_config(arguments.DEFAULT_CONFIG,
+                                  base_default=False)
+        dts = datetime.datetime(2112, 9, 2)
+        args = (conf, (dts, dts + datetime.timedelta(days=1)), "all")
+        prev_args = arguments.ArgumentManager.previous_args(args)
+
+        # previous window: h0-h1 connected, h2 not connected, h3 missing
+        prev_evmap = log2event.EventDefinitionMap()
+        for host in ("h2", "h1", "h0"):
+            prev_evmap.add_evdef(_EventDefinition(host))
+        evmap = log2event.EventDefinitionMap()
+        for host in ("h0", "h1", "h2", "h3"):
+            evmap.add_evdef(_EventDefinition(host))
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            conf["dag"]["output_dir"] = tmpdir
+            prev_evmap.dump(prev_args)
+            showdag.LogDAG(prev_args, nx.DiGraph([(2, 1)])).dump()
+            rule = pknowledge.ImportDAG(args, n_windows=2, stable_ratio=0.5)
+            pk = rule.update(pknowledge.PriorKnowledge(evmap.eids()), evmap)
+
+            # noedge rules only from the DAGs of other config
+            src_conf = conf
+            conf = config.open_config(arguments.DEFAULT_CONFIG,
+                                      base_default=False)
+            args = (conf, args[1], args[2])
+            rule = pknowledge.ImportDAG(args, n_windows=2, stable_ratio=0.5,
+                                        src_conf=src_conf)
+            pk_src = rule.update(pknowledge.PriorKnowledge(evmap.eids()),
+                                 evmap)
+
+        # self-import: no hard rules, never connected pairs at depth 0
+        assert pk.required_skeleton() is None
+        assert not any(pk.is_noedge(edge) or pk.is_edge(edge)
+                       for edge in combinations(evmap.eids(), 2))
+        assert set(pk.depth0_only_skeleton().edges()) == {(0, 2), (1, 2)}
+
+        assert pk_src.is_edge((0, 1))
+        assert not pk_src.is_noedge((0, 1))
+        assert set(pk_src.required_skeleton().edges()) == {(0, 1)}
+        assert pk_src.depth0_only_skeleton() is None
+        assert pk_src.is_noedge((0, 2)) and pk_src.is_noedge((1, 2))
+        assert not any(pk_src.is_noedge((i, 3)) for i in range(3))
+
+
+if __name__ == "__main__":
+    unittest.main()